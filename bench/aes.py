@@ -0,0 +1,55 @@
+'''
+Throughput of aes.decryptData in CBC mode with each of the available backends,
+on a stream and on many short strings decrypted with the same key.
+
+Usage: python bench/aes.py [tree] [streamMB]
+
+Versions without the optional backends are measured once, as stock. streamMB is
+the size of the stream (default: 1).
+'''
+import time
+import random
+import hashlib
+from common import select_tree, random_bytes
+
+tree, args = select_tree()
+from peepdf import aes
+
+def use_backend(backend):
+    '''
+        Leaves enabled only the optional module of backend, none for tbox
+    '''
+    for name, flag in [('cryptography', 'CRYPTOGRAPHY_MODULE'), ('pycryptodome', 'PYCRYPTODOME_MODULE')]:
+        if hasattr(aes, flag):
+            setattr(aes, flag, available[flag] and backend == name)
+
+available = dict([(flag, getattr(aes, flag)) for flag in ['CRYPTOGRAPHY_MODULE', 'PYCRYPTODOME_MODULE'] if hasattr(aes, flag)])
+if available:
+    backends = ['tbox']
+    if available.get('CRYPTOGRAPHY_MODULE'):
+        backends.append('cryptography')
+    if available.get('PYCRYPTODOME_MODULE'):
+        backends.append('pycryptodome')
+else:
+    backends = ['stock']
+
+random.seed(1)
+streamSize = int(args[0]) * 1024 * 1024 if args else 1024 * 1024
+key = random_bytes(16)
+# The IV goes first, then the encrypted blocks
+stream = random_bytes(16 + streamSize)
+strings = [random_bytes(16 + 32) for i in xrange(2000)]
+
+print 'tree:', tree
+print '%-20s %-13s %10s %8s  %s' % ('data', 'backend', 'time (s)', 'MB/s', 'output md5')
+for backend in backends:
+    use_backend(backend)
+    for name, data in [('stream %d MB' % (streamSize / (1024 * 1024)), [stream]), ('%d strings' % len(strings), strings)]:
+        start = time.time()
+        output = []
+        for encrypted in data:
+            ret = aes.decryptData(encrypted, key)
+            output.append(ret[1])
+        elapsed = time.time() - start
+        size = sum([len(encrypted) - 16 for encrypted in data])
+        print '%-20s %-13s %10.3f %8.2f  %s' % (name, backend, elapsed, size / elapsed / (1024 * 1024), hashlib.md5(''.join(output)).hexdigest())
@@ -0,0 +1,66 @@
+'''
+Helpers shared by the benchmarks of this directory.
+
+Every benchmark takes as optional first argument the checkout to measure,
+by default the one containing this directory. An older version is compared
+by checking it out apart and passing its path:
+
+    git worktree add /tmp/old <commit>
+    python bench/parse_scaling.py /tmp/old
+'''
+import os
+import sys
+import random
+import binascii
+import tempfile
+import contextlib
+
+def select_tree():
+    '''
+        Takes the checkout to measure from the command line and makes its modules importable
+        
+        @return: A tuple (tree, args), with the absolute path of the checkout and the rest of the arguments
+    '''
+    tree = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    args = sys.argv[1:]
+    if args and not args[0].replace('.', '', 1).isdigit():
+        tree = args.pop(0)
+    tree = os.path.abspath(tree)
+    sys.path.insert(0, tree)
+    return tree, args
+
+def random_bytes(size):
+    '''
+        Random bytes from the random module, so they are the same on every run after seeding it
+    '''
+    return binascii.unhexlify('%0*x' % (2 * size, random.getrandbits(8 * size)))
+
+def pdf_content(objects, root = 1):
+    '''
+        Content of a PDF file with the given objects, numbered from 1. The cross reference table is a stub, the objects are found by the parser looking for them.
+        
+        @param objects: The content of each object (string), without obj and endobj
+        @param root: The id of the /Root object
+        @return: The content of the file (string)
+    '''
+    out = ['%PDF-1.4\n']
+    for id, content in enumerate(objects, 1):
+        out.append('%d 0 obj\n%s\nendobj\n' % (id, content))
+    out.append('xref\n0 1\n0000000000 65535 f \ntrailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n0\n%%%%EOF\n' % (len(out), root))
+    return ''.join(out)
+
+def write_pdf(path, objects, root = 1):
+    with open(path, 'wb') as fout:
+        fout.write(pdf_content(objects, root))
+
+@contextlib.contextmanager
+def temp_file(suffix = '.pdf'):
+    '''
+        Path of a temporary file, removed at the end of the block
+    '''
+    fd, path = tempfile.mkstemp(suffix = suffix)
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        os.remove(path)
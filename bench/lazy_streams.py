@@ -0,0 +1,61 @@
+'''
+Compares a lazy mode parse with a normal one on a document whose Javascript
+code and references are inside image and font streams, the ones whose decoding
+is deferred in lazy mode, next to a large image nobody reads. Both parses must
+find the same Javascript code and the same tree. The parse time shows the
+decoding saved in lazy mode, the tree time the deferred streams decoded on
+demand to find their references.
+
+Usage: python bench/lazy_streams.py [tree] [imageSize]
+
+imageSize is the decoded size of the large image in bytes (default: 20000000).
+'''
+import sys
+import time
+import zlib
+from common import select_tree, write_pdf, temp_file
+
+tree, args = select_tree()
+from peepdf.PDFCore import PDFParser
+
+def hidden_code(imageSize):
+    js = 'function spray(n) { var s = unescape("%u9090"); while (s.length < n) { s = s + s; } return s; }\nvar x = spray(1024); if (x.length > 0) { app.alert(x.length); } else { app.alert(0); }\n'
+    image = zlib.compress(js)
+    font = '4 0 R 3 0 R'
+    largeImage = zlib.compress('\xff' * imageSize)
+    objects = ['<< /Type /Catalog /Pages 2 0 R /OpenAction 6 0 R >>',
+               '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+               '<< /Type /Page /Parent 2 0 R /Resources << /XObject << /Im1 5 0 R /Im2 8 0 R >> /Font << /F1 7 0 R >> >> >>',
+               '<< /Type /Annot /Subtype /Text >>',
+               '<< /Subtype /Image /Width 1 /Height 1 /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream' % (len(image), image),
+               '<< /S /JavaScript /JS 5 0 R >>',
+               '<< /Length1 %d /Length %d >>\nstream\n%s\nendstream' % (len(font), len(font), font),
+               '<< /Subtype /Image /Width 1 /Height 1 /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream' % (len(largeImage), largeImage)]
+    return objects
+
+def analyse(path, lazyMode):
+    start = time.time()
+    ret, pdf = PDFParser().parse(path, forceMode = True, manualAnalysis = True, lazyMode = lazyMode)
+    parseTime = time.time() - start
+    js = []
+    for version in range(pdf.updates + 1):
+        for id in pdf.body[version].getContainingJS():
+            js += pdf.getObject(int(id), version).getJSCode()
+    start = time.time()
+    pdfTree = repr(pdf.getTree())
+    return parseTime, time.time() - start, js, pdfTree
+
+imageSize = int(args[0]) if args else 20000000
+with temp_file() as path:
+    write_pdf(path, hidden_code(imageSize))
+    print 'tree:', tree
+    print '%-6s %10s %9s %8s  %s' % ('mode', 'parse (s)', 'tree (s)', 'JS code', 'tree')
+    results = {}
+    for lazyMode in (False, True):
+        parseTime, treeTime, js, pdfTree = analyse(path, lazyMode)
+        results[lazyMode] = (js, pdfTree)
+        print '%-6s %10.3f %9.3f %8d  %s' % (['normal', 'lazy'][lazyMode], parseTime, treeTime, len(''.join(js)), pdfTree)
+if results[False] != results[True]:
+    print 'The lazy mode parse differs from the normal one'
+    sys.exit(1)
+print 'Same Javascript code and tree in both modes'
@@ -0,0 +1,58 @@
+'''
+Resident memory taken by the objects of parsed synthetic PDF files, in PDF
+objects (nested ones included) per MB. Each file is parsed in a new process,
+measuring the growth of its RSS (Linux only).
+
+Usage: python bench/memory.py [tree] [numObjects ...]
+'''
+import sys
+import subprocess
+from common import select_tree, write_pdf, temp_file
+
+tree, args = select_tree()
+
+# Parses the file and prints the RSS growth (MB), the parse time and the number of objects, argv: tree file
+driver = '''
+import gc, sys, time
+sys.path.insert(0, sys.argv[1])
+from peepdf.PDFCore import PDFParser
+
+def rss():
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS'):
+            return int(line.split()[1]) / 1024.0
+
+def count(pdfObject):
+    objectType = pdfObject.getType()
+    if objectType in ('dictionary', 'stream'):
+        return 1 + sum([count(element) for element in pdfObject.getElements().values()])
+    elif objectType == 'array':
+        return 1 + sum([count(element) for element in pdfObject.getElements()])
+    return 1
+
+gc.collect()
+before = rss()
+start = time.time()
+ret, pdf = PDFParser().parse(sys.argv[2], forceMode = True, manualAnalysis = True)
+elapsed = time.time() - start
+gc.collect()
+growth = rss() - before
+objects = 0
+for body in pdf.body:
+    for indirectObject in body.getObjects().values():
+        objects += count(indirectObject.getObject())
+print growth, elapsed, objects
+'''
+
+def annotations(numObjects):
+    return ['<< /Type /Annot /Subtype /Link /Next %d 0 R /T (Annotation %d) /Rect [0 0 %d 20] /Border [0 0 1] /C [1.0 0.5 0] /F 4 >>' % (i % numObjects + 1, i, i) for i in range(1, numObjects + 1)]
+
+counts = [int(arg) for arg in args] or [5000, 20000]
+with temp_file() as path:
+    print 'tree:', tree
+    print '%8s %12s %10s %10s %14s' % ('objects', 'PDF objects', 'RSS (MB)', 'parse (s)', 'objects per MB')
+    for numObjects in counts:
+        write_pdf(path, annotations(numObjects))
+        growth, elapsed, objects = subprocess.check_output([sys.executable, '-c', driver, tree, path]).split()
+        growth, elapsed, objects = float(growth), float(elapsed), int(objects)
+        print '%8d %12d %10.1f %10.2f %14.0f' % (numObjects, objects, growth, elapsed, objects / growth)
@@ -0,0 +1,75 @@
+'''
+Time to find the closing delimiter of deeply nested arrays, dictionaries and
+strings, and to parse a file with such an object.
+
+Usage: python bench/nesting.py [tree] [depth ...]
+'''
+import time
+from common import select_tree, write_pdf, temp_file
+
+tree, args = select_tree()
+from peepdf import PDFCore
+from peepdf.PDFCore import PDFFile, PDFParser
+
+objects = [('array', '[', ']'), ('dictionary', '<< /A ', ' >>'), ('string', '(', ')')]
+
+def nested(opening, closing, depth):
+    return opening * depth + '1' + closing * depth
+
+def make_parser(maxDepth):
+    '''
+        Parser with the given nesting limit, 'default' for the default one of the tree
+    '''
+    if maxDepth == 'default':
+        return PDFParser()
+    try:
+        return PDFParser(maxNestingDepth = maxDepth)
+    except TypeError:
+        # Versions without the nesting limit
+        return None
+
+def find_closing(parser, content, delim):
+    '''
+        Reads the nested object with readUntilClosingDelim, as the parser does after reading the opening delimiter
+    '''
+    PDFCore.pdfFile = PDFFile()
+    parser.charCounter = len(delim[0])
+    try:
+        ret = parser.readUntilClosingDelim(content, delim)
+    except RuntimeError:
+        return 'recursion limit'
+    if ret[0] == -1:
+        return ret[1]
+    return 'ok'
+
+def parse(path, parser):
+    ret, pdf = parser.parse(path, forceMode = True, manualAnalysis = True)
+    errors = pdf.getErrors()
+    if errors:
+        return errors[0]
+    return 'ok'
+
+depths = [int(arg) for arg in args] or [10, 1000, 10000, 100000]
+print 'tree:', tree
+print '%-10s %7s %10s  %s' % ('object', 'depth', 'match (s)', 'result')
+for name, opening, closing in objects:
+    delim = [delim for delim in PDFParser().delimiters if delim[2] == name][0]
+    for depth in depths:
+        content = nested(opening, closing, depth)
+        parser = make_parser(None) or make_parser('default')
+        start = time.time()
+        result = find_closing(parser, content, delim)
+        print '%-10s %7d %10.3f  %s' % (name, depth, time.time() - start, result)
+
+with temp_file() as path:
+    print
+    print '%-10s %7s %10s %10s  %s' % ('file', 'depth', 'max depth', 'parse (s)', 'first error')
+    for depth in depths:
+        write_pdf(path, [nested('[', ']', depth), '<< /B 2 >>'], root = 2)
+        for maxDepth in ('default', None):
+            parser = make_parser(maxDepth)
+            if parser == None:
+                continue
+            start = time.time()
+            result = parse(path, parser)
+            print '%-10s %7d %10s %10.3f  %s' % ('array', depth, maxDepth, time.time() - start, result)
@@ -0,0 +1,27 @@
+'''
+Parse time of synthetic PDF files with a growing number of objects.
+
+The offsets of the objects come from getIndirectObjects, so the time per object
+should stay flat as the body grows.
+
+Usage: python bench/parse_scaling.py [tree] [numObjects ...]
+'''
+import time
+from common import select_tree, write_pdf, temp_file
+
+tree, args = select_tree()
+from peepdf.PDFCore import PDFParser
+
+def annotations(numObjects):
+    return ['<< /Type /Annot /Next %d 0 R /V (x%d) /Rect [0 0 1 1] >>' % (i % numObjects + 1, i) for i in range(1, numObjects + 1)]
+
+counts = [int(arg) for arg in args] or [5000, 10000, 20000, 50000]
+with temp_file() as path:
+    print 'tree:', tree
+    print '%8s %10s %14s' % ('objects', 'parse (s)', 'us per object')
+    for numObjects in counts:
+        write_pdf(path, annotations(numObjects))
+        start = time.time()
+        ret, pdf = PDFParser().parse(path, forceMode = True, manualAnalysis = True)
+        elapsed = time.time() - start
+        print '%8d %10.2f %14.1f' % (numObjects, elapsed, elapsed * 1e6 / numObjects)
@@ -0,0 +1,58 @@
+'''
+Throughput of post_prediction on random PNG and TIFF predicted streams, with
+the NumPy engine and the pure Python one.
+
+Usage: python bench/predictors.py [tree] [sizeMB ...]
+
+Versions without NUMPY_MODULE are measured once, as stock. The streams are the
+same on every run, so the md5 of the outputs can be compared between engines
+and trees.
+'''
+import time
+import random
+import hashlib
+from common import select_tree, random_bytes
+
+tree, args = select_tree()
+from peepdf import PDFFilters
+
+def png(size, columns, filters):
+    '''
+        Random rows of columns bytes, each one starting with one of the PNG filter types
+    '''
+    row = columns + 1
+    data = bytearray(random_bytes(size / row * row))
+    for offset in xrange(0, len(data), row):
+        data[offset] = random.choice(filters)
+    return str(data)
+
+# name: (stream generator, predictor, columns, colors, bits)
+cases = [('xref-up', lambda size: png(size, 5, [2]), 12, 5, 1, 8),
+         ('image-up', lambda size: png(size, 3000, [2]), 12, 1000, 3, 8),
+         ('image-mixed', lambda size: png(size, 3000, [0, 1, 2, 3, 4]), 15, 1000, 3, 8),
+         ('tiff-8', random_bytes, 2, 1000, 1, 8)]
+
+engines = ['stock']
+if hasattr(PDFFilters, 'NUMPY_MODULE'):
+    engines = ['python']
+    if PDFFilters.NUMPY_MODULE:
+        engines.append('numpy')
+
+sizes = [int(arg) for arg in args] or [1, 10]
+print 'tree:', tree
+print '%-12s %5s %-7s %10s %8s  %s' % ('stream', 'MB', 'engine', 'time (s)', 'MB/s', 'output md5')
+for size in sizes:
+    for name, generator, predictor, columns, colors, bits in cases:
+        random.seed(1)
+        stream = generator(size * 1024 * 1024)
+        for engine in engines:
+            if engine != 'stock':
+                PDFFilters.NUMPY_MODULE = engine == 'numpy'
+            start = time.time()
+            ret = PDFFilters.post_prediction(stream, predictor, columns, colors, bits)
+            elapsed = time.time() - start
+            if ret[0] == -1:
+                result = ret[1]
+            else:
+                result = hashlib.md5(ret[1]).hexdigest()
+            print '%-12s %5d %-7s %10.2f %8.2f  %s' % (name, size, engine, elapsed, size / elapsed, result)
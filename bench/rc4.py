@@ -0,0 +1,45 @@
+'''
+Throughput of the RC4 implementation of PDFCrypto, on a stream and on many
+short strings encrypted with the same key, and time of the object key
+derivation of an encrypted document.
+
+Usage: python bench/rc4.py [tree] [streamMB]
+
+streamMB is the size of the stream (default: 1).
+'''
+import time
+import random
+import hashlib
+from common import select_tree, random_bytes
+
+tree, args = select_tree()
+from peepdf import PDFCrypto
+
+def report(name, elapsed, size, output):
+    print '%-24s %10.3f %8.2f  %s' % (name, elapsed, size / elapsed / (1024 * 1024), hashlib.md5(output).hexdigest())
+
+random.seed(1)
+streamSize = int(args[0]) * 1024 * 1024 if args else 1024 * 1024
+key = random_bytes(16)
+stream = random_bytes(streamSize)
+strings = [random_bytes(30) for i in xrange(20000)]
+encryptionKey = random_bytes(16)
+
+print 'tree:', tree
+print '%-24s %10s %8s  %s' % ('data', 'time (s)', 'MB/s', 'output md5')
+start = time.time()
+output = PDFCrypto.RC4(stream, key)
+report('stream %d MB' % (streamSize / (1024 * 1024)), time.time() - start, streamSize, output)
+
+start = time.time()
+output = ''.join([PDFCrypto.RC4(string, key) for string in strings])
+report('%d strings, same key' % len(strings), time.time() - start, 30 * len(strings), output)
+
+# Every string and stream of an object is decrypted with the same object key
+start = time.time()
+keys = []
+for id in xrange(1, 5001):
+    for i in range(4):
+        keys.append(PDFCrypto.computeObjectKey(id, 0, encryptionKey, 16))
+elapsed = time.time() - start
+print '%-24s %10.3f %8s  %s' % ('5000 objects, 4 keys', elapsed, '-', hashlib.md5(''.join(keys)).hexdigest())
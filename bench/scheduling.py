@@ -0,0 +1,80 @@
+'''
+Wall-clock time of pdfrankenstein on a skewed synthetic corpus with each job
+schedule: 400 samples of 1 MB and a few large ones, walked last. The analysis
+of a sample is simulated by sleeping for its size divided by a parse rate, so
+only the scheduling is measured, and the corpus is made of sparse files.
+
+Usage: python bench/scheduling.py [tree] [workers] [parseMBps]
+
+workers is the number of Hashers (default: 8) and parseMBps the simulated parse
+rate (default: 50).
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+from common import select_tree
+
+root, args = select_tree()
+workers = int(args[0]) if args else 8
+rate = float(args[1]) if len(args) > 1 else 50
+
+small = [1] * 400
+large = [150, 100, 60, 40, 20]
+
+# Runs pdfrankenstein with the simulated parse, argv: tree rate arguments
+driver = '''
+import os, sys, time
+root, rate = sys.argv[1], float(sys.argv[2])
+sys.argv = [os.path.join(root, 'pdfrankenstein.py')] + sys.argv[3:]
+sys.path.insert(0, root)
+src = open(sys.argv[0]).read()
+patch = """
+def simulated_parse(self, pdf):
+    time.sleep(os.path.getsize(pdf) / (%f * 1024 * 1024))
+    return False, 'simulated'
+Hasher.parse_pdf = simulated_parse
+""" % rate
+src = src.replace("if __name__ == '__main__':", patch + "\\nif __name__ == '__main__':", 1)
+exec compile(src, sys.argv[0], 'exec') in {'__name__': '__main__', '__file__': sys.argv[0]}
+'''
+
+def make_corpus(path):
+    '''
+        Sparse samples, the large ones in a subdirectory so they are walked after the small ones
+    '''
+    os.mkdir(os.path.join(path, 'large'))
+    samples = [os.path.join(path, 's%d.pdf' % i) for i in range(len(small))]
+    samples += [os.path.join(path, 'large', 'l%d.pdf' % i) for i in range(len(large))]
+    for sample, size in zip(samples, small + large):
+        with open(sample, 'wb') as fout:
+            fout.write('%PDF-1.4\n')
+            fout.truncate(size * 1024 * 1024)
+
+def schedules():
+    src = open(os.path.join(root, 'pdfrankenstein.py')).read()
+    if '--schedule' not in src:
+        # Versions without job schedules
+        return [('walk', [])]
+    return [('walk', ['--schedule', 'walk']), ('largest', ['--schedule', 'largest']), ('buckets', ['--schedule', 'buckets'])]
+
+work = tempfile.mkdtemp()
+try:
+    corpus = os.path.join(work, 'corpus')
+    os.mkdir(corpus)
+    make_corpus(corpus)
+    total = sum(small + large) / rate
+    print 'tree:', root
+    print '%d samples, %d MB, %.1fs of simulated parse on %d Hashers: %.1fs at best' % (len(small + large), sum(small + large), total, workers, max(total / workers, max(large) / rate))
+    print '%-8s %10s' % ('schedule', 'wall (s)')
+    for name, options in schedules():
+        out = os.path.join(work, 'out.txt')
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, '-c', driver, root, str(rate), corpus, '--workers', str(workers), '--timeout', '0', '-o', out] + options, stdout = devnull, stderr = devnull, cwd = work)
+        print '%-8s %10.1f' % (name, time.time() - start)
+        os.remove(out)
+finally:
+    shutil.rmtree(work)
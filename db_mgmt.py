@@ -7,7 +7,7 @@ import cfg
 
 class DBGateway(object):
 
-    def __init__(self, dbtype=''):
+    def __init__(self, dbtype='', db_name=None):
         self.cfg = cfg.Config()
         if dbtype is 'test':
             self.db_dir = os.getcwd()
@@ -15,6 +15,8 @@ class DBGateway(object):
         else:
             self.db_dir = self.cfg.setting('database', 'path')
             self.db_name = self.cfg.setting('database', 'db')
+        if db_name:
+            self.db_name = db_name
         if not (self.db_dir and self.db_name):
             print 'Error in database path or name. Check cfg file'
             sys.exit(1)
@@ -24,11 +26,15 @@ class DBGateway(object):
         self.db_conn.text_factory = str
         self.db_curr = self.db_conn.cursor()
 
-    def attach(self, db_name):
-        db = "'" + os.path.join(config.SETTINGS.get('DB_DIR'), db_name) + "'"
-        self.db_curr.execute('ATTACH DATABASE ' + db + ' AS ' + db_name)
+    def attach(self, db_name, alias=None):
+        db = "'" + os.path.join(self.db_dir, db_name) + "'"
+        self.db_curr.execute('ATTACH DATABASE ' + db + ' AS ' + (alias or db_name))
         self.db_conn.commit()
 
+    def detach(self, alias):
+        self.db_conn.commit()
+        self.db_curr.execute('DETACH DATABASE ' + alias)
+
     def create_table(self, table, **kwargs):
         try:
             kwargs = self.format_args(**kwargs)
@@ -86,6 +92,18 @@ class DBGateway(object):
                 print e
         self.db_conn.commit()
 
+    def insert_many(self, table, **kwargs):
+        # One transaction for all the rows. Duplicates are skipped, as in insert
+        kwargs = self.format_args(**kwargs)
+        cmd = 'INSERT OR IGNORE INTO ' + table + '(' + kwargs.get('cols') + ') VALUES (' + kwargs.get('subs') + ')'
+        self.db_curr.executemany(cmd, kwargs.get('vals'))
+        self.db_conn.commit()
+
+    def set_wal(self, synchronous='NORMAL'):
+        # Readers don't block the writer, and commits don't wait for an fsync (durable at checkpoints)
+        self.db_curr.execute('PRAGMA journal_mode=WAL')
+        self.db_curr.execute('PRAGMA synchronous=' + synchronous)
+
     def select(self, cmd_str):
         cmd = 'SELECT %s' % cmd_str
         self.db_curr.execute(cmd)
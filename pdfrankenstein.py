@@ -1,19 +1,103 @@
 import io
 import os
+import mmap
 import sys
-import glob
+import stat
 import time
+import heapq
+import signal
+import socket
+import shutil
 import getopt
 import hashlib
+import cStringIO
+import sqlite3
+import tempfile
+import threading
 import traceback
 import multiprocessing
 from Queue import Full, Empty
+from collections import deque
+from multiprocessing.managers import BaseManager
 
 from  peepdf.PDFCore import PDFParser
+try:
+    from scandir import scandir
+    SCANDIR_MODULE = True
+except ImportError:
+    SCANDIR_MODULE = False
 
 LOCK = multiprocessing.Lock()
 STORAGE_LOCK = multiprocessing.Lock()
 
+# Limits for the Flate decoding of each stream, so decompression bombs can't eat the memory of a Hasher
+MAX_DECODED_SIZE = 64 * 1024 * 1024
+MAX_DECOMPRESSION_RATIO = 200
+# Maximum nesting of arrays, dictionaries and strings in an object, so delimiter bombs are recorded as errors
+MAX_NESTING_DEPTH = 100
+
+# Default size cap (MB) of the parse result cache
+CACHE_SIZE = 1024
+
+# Maximum number of paths waiting in the job queue, the directory walk blocks when it is full
+JOB_QUEUE_SIZE = 1024
+# Maximum number of results waiting for the Stasher, the Hashers block when it is full
+RESULT_QUEUE_SIZE = 256
+# Result fields of SPOOL_SIZE bytes or more go to the Stasher in spool files,
+# only their Spooled descriptor is pickled through the results queue
+SPOOL_SIZE = 64 * 1024
+SPOOL_CHUNK = 1024 * 1024
+# Bytes of spool files waiting for the Stasher before the Hashers wait, and seconds between their checks
+SPOOL_BUDGET = 256 * 1024 * 1024
+SPOOL_WAIT = 0.05
+# Bytes searched for the magic when filtering samples, PDF readers accept a header within the first 1024
+MAGIC_SEARCH_SIZE = 1024
+PDF_MAGIC = '%PDF'
+
+# Orders of the jobs, see Jobber. Samples of LARGE_SAMPLE_SIZE (MB) or more
+# go to dedicated Hashers in 'buckets' mode.
+SCHEDULES = ('walk', 'largest', 'buckets')
+LARGE_SAMPLE_SIZE = 16
+
+# Distributed mode: seconds a job is leased to a worker node without news
+# from it, leases of a job before it is stored as a timeout, and seconds
+# between the lease requests of an idle node
+LEASE_TIME = 60
+LEASE_ATTEMPTS = 3
+LEASE_POLL = 1
+
+# Seconds between checkpoints of the stored samples in --resume mode
+CHECKPOINT_INTERVAL = 60
+
+# Default budgets of a Hasher: wall-clock seconds and resident memory (MB) per
+# sample, and samples analyzed before the process is replaced. 0 disables them.
+SAMPLE_TIMEOUT = 300
+SAMPLE_MEMORY = 2048
+RECYCLE_AFTER = 1000
+# Seconds between the checks of the Supervisor, and given to a Hasher to exit after SIGTERM
+SUPERVISOR_INTERVAL = 0.5
+KILL_GRACE = 5
+
+# Adaptive number of Hashers: seconds between measures, relative throughput
+# gain to keep scaling in the same direction, fraction of time on samples
+# below which Hashers are removed, and results waiting for the Stasher
+# above which Hashers are removed
+ADAPT_INTERVAL = 10
+ADAPT_THRESHOLD = 0.05
+LOW_UTILIZATION = 0.5
+RESULTS_BACKLOG = RESULT_QUEUE_SIZE / 2
+
+def worker_count(value):
+    '''
+    --workers value: 'auto' or a positive number of Hashers
+    '''
+    if value == 'auto':
+        return value
+    count = int(value)
+    if count < 1:
+        raise ValueError('At least one worker is needed')
+    return count
+
 class ParserFactory(object):
 
     def new_parser(self):
@@ -37,6 +121,25 @@ class ParsedArgs(object):
     out = 't-hash-{stamp}.txt'.format(stamp = time.strftime("%Y-%m-%d_%H-%M-%S"))
     debug = False
     verbose = False
+    cache_dir = None
+    cache_size = CACHE_SIZE
+    ext = None
+    magic = False
+    resume = False
+    timeout = SAMPLE_TIMEOUT
+    max_memory = SAMPLE_MEMORY
+    recycle = RECYCLE_AFTER
+    workers = 'auto'
+    max_workers = None
+    schedule = 'walk'
+    large_size = LARGE_SAMPLE_SIZE
+    large_workers = None
+    serve = None
+    connect = None
+    authkey = None
+    blobs = False
+    lease_time = LEASE_TIME
+    spool_dir = None
 
 class ArgParser(object):
 
@@ -46,10 +149,29 @@ class ArgParser(object):
             print 'Error in ArgParser. Unable to import argparse'
             sys.exit(1)
         self.parser = argparse.ArgumentParser()
-        self.parser.add_argument('pdf_in', help="PDF input for analysis")
-        self.parser.add_argument('-o', '--out', default='t-hash-'+time.strftime("%Y-%m-%d_%H-%M-%S")+'.txt', help="Analysis output filename or type. Default to timestamped file in CWD. Options: 'db'||'stdout'||[filename]")
+        self.parser.add_argument('pdf_in', nargs='?', help="PDF input for analysis. Not used by worker nodes (--connect)")
+        self.parser.add_argument('-o', '--out', default='t-hash-'+time.strftime("%Y-%m-%d_%H-%M-%S")+'.txt', help="Analysis output filename or type. Default to timestamped file in CWD. Options: 'db'||'shards'||'stdout'||[filename]")
         self.parser.add_argument('-d', '--debug', action='store_true', default=False, help="Print debugging messages")
         self.parser.add_argument('-v', '--verbose', action='store_true', default=False, help="Spam the terminal")
+        self.parser.add_argument('--cache-dir', default=None, help="Directory of the parse result cache. Samples already parsed (same SHA-256) are not parsed again")
+        self.parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="Size cap of the parse result cache in MB. Least recently used results are evicted first")
+        self.parser.add_argument('--ext', default=None, help="Only analyze files with these extensions, comma separated (e.g. 'pdf,bin')")
+        self.parser.add_argument('--magic', action='store_true', default=False, help="Only analyze files with a PDF header in their first bytes")
+        self.parser.add_argument('--resume', action='store_true', default=False, help="Skip the samples already stored in the output (db, shards or file)")
+        self.parser.add_argument('--timeout', type=int, default=SAMPLE_TIMEOUT, help="Seconds a sample can be analyzed before its Hasher is killed and a timeout row is stored. 0 disables it")
+        self.parser.add_argument('--max-memory', type=int, default=SAMPLE_MEMORY, help="Resident memory (MB) of a Hasher before it is killed and a timeout row is stored. 0 disables it")
+        self.parser.add_argument('--recycle', type=int, default=RECYCLE_AFTER, help="Replace each Hasher after this number of samples. 0 disables it")
+        self.parser.add_argument('--workers', type=worker_count, default='auto', help="Number of Hasher processes, or 'auto' to scale them with the measured throughput. Default 'auto'")
+        self.parser.add_argument('--max-workers', type=int, default=None, help="Maximum number of Hasher processes in 'auto' mode. Default to the number of CPUs")
+        self.parser.add_argument('--schedule', choices=SCHEDULES, default='walk', help="Order of the samples in a directory. 'walk': as found. 'largest': largest first, once the whole directory is listed. 'buckets': large samples analyzed by dedicated Hashers")
+        self.parser.add_argument('--large-size', type=int, default=LARGE_SAMPLE_SIZE, help="Size (MB) of the large samples in 'buckets' mode")
+        self.parser.add_argument('--large-workers', type=int, default=None, help="Number of Hashers for the large samples in 'buckets' mode. Default to a quarter of the Hashers")
+        self.parser.add_argument('--serve', default=None, help="Distributed mode. Coordinate the worker nodes connecting to this [host]:port instead of running Hashers")
+        self.parser.add_argument('--connect', default=None, help="Distributed mode. Run Hashers for the coordinator at host:port")
+        self.parser.add_argument('--authkey', default=None, help="Shared secret of the coordinator and its worker nodes, required in distributed mode")
+        self.parser.add_argument('--blobs', action='store_true', default=False, help="Send the samples to the worker nodes, for nodes without access to the input paths")
+        self.parser.add_argument('--lease-time', type=int, default=LEASE_TIME, help="Seconds without news from a worker node before its jobs are given to other nodes")
+        self.parser.add_argument('--spool-dir', default=None, help="Directory of the spool files passing large results to the Stasher. Default to /dev/shm if available, 'none' to pickle them through the results queue")
 
     def parse(self):
         '''
@@ -59,7 +181,7 @@ class ArgParser(object):
             parsed = ParsedArgs()
             self.parser.parse_args(namespace=parsed)
         except Exception:
-            self.parser.exit(status=0, message='Usage: pdfrankenstein.py <input pdf> [-o] [-d] [-v]\n')
+            self.parser.exit(status=0, message='Usage: pdfrankenstein.py <input pdf> [-o] [-d] [-v] [--cache-dir] [--cache-size] [--ext] [--magic] [--resume] [--timeout] [--max-memory] [--recycle] [--workers] [--max-workers] [--schedule] [--large-size] [--large-workers] [--serve] [--connect] [--authkey] [--blobs] [--lease-time] [--spool-dir]\n')
         else:
             return parsed
 
@@ -69,12 +191,13 @@ class GetOptParser(object):
     updated, and won't even have src code security updates as of 2013.
     '''
     shorts = 'o:dv'
-    longs = [ 'out=', 'debug', 'verbose' ]
+    longs = [ 'out=', 'debug', 'verbose', 'cache-dir=', 'cache-size=', 'ext=', 'magic', 'resume', 'timeout=', 'max-memory=', 'recycle=', 'workers=', 'max-workers=', 'schedule=', 'large-size=', 'large-workers=', 'serve=', 'connect=', 'authkey=', 'blobs', 'lease-time=', 'spool-dir=' ]
 
     def parse(self):
         parsed = ParsedArgs()
         opts, remain = self._parse_cli()
-        parsed.pdf_in = remain[0]
+        if remain:
+            parsed.pdf_in = remain[0]
         for opt, arg in opts:
             if opt in ('-o', '--out'):
                 '''
@@ -91,18 +214,52 @@ class GetOptParser(object):
                 parsed.debug = True
             elif opt in ('-v', '--verbose'):
                 parsed.verbose = True
+            elif opt == '--cache-dir':
+                parsed.cache_dir = arg
+            elif opt == '--cache-size':
+                if arg.isdigit():
+                    parsed.cache_size = int(arg)
+                else:
+                    print 'Invalid cache size. Using default:', parsed.cache_size
+            elif opt == '--ext':
+                parsed.ext = arg
+            elif opt == '--magic':
+                parsed.magic = True
+            elif opt == '--resume':
+                parsed.resume = True
+            elif opt == '--workers':
+                try:
+                    parsed.workers = worker_count(arg)
+                except ValueError:
+                    print 'Invalid number of workers. Using default:', parsed.workers
+            elif opt == '--schedule':
+                if arg in SCHEDULES:
+                    parsed.schedule = arg
+                else:
+                    print 'Invalid schedule. Using default:', parsed.schedule
+            elif opt in ('--serve', '--connect', '--authkey', '--spool-dir'):
+                setattr(parsed, opt[2:].replace('-', '_'), arg)
+            elif opt == '--blobs':
+                parsed.blobs = True
+            elif opt in ('--timeout', '--max-memory', '--recycle', '--max-workers', '--large-size', '--large-workers', '--lease-time'):
+                name = opt[2:].replace('-', '_')
+                if arg.isdigit():
+                    setattr(parsed, name, int(arg))
+                else:
+                    print 'Invalid %s value. Using default:' % opt, getattr(parsed, name)
         return parsed 
 
     def _parse_cli(self):
         try:
             o, r = getopt.gnu_getopt(sys.argv[1:], self.shorts, self.longs)
         except IndexError:
-            print 'Usage: pdfrankenstein.py <input pdf> [-o value] [-d] [-v]'
+            print 'Usage: pdfrankenstein.py <input pdf> [-o value] [-d] [-v] [--cache-dir value] [--cache-size value] [--ext value] [--magic] [--resume] [--timeout value] [--max-memory value] [--recycle value] [--workers value] [--max-workers value] [--schedule value] [--large-size value] [--large-workers value] [--serve value] [--connect value] [--authkey value] [--blobs] [--lease-time value] [--spool-dir value]'
             sys.exit(1)
         else:
-            if len(r) != 1:
+            # Worker nodes get their samples from the coordinator
+            if len(r) != 1 and not (not r and any([ opt == '--connect' for opt, arg in o ])):
                 print 'One PDF file or directory path required'
-                print 'Usage: pdfrankenstein.py <input pdf> [-o value] [-d] [-v]'
+                print 'Usage: pdfrankenstein.py <input pdf> [-o value] [-d] [-v] [--cache-dir value] [--cache-size value] [--ext value] [--magic] [--resume] [--timeout value] [--max-memory value] [--recycle value] [--workers value] [--max-workers value] [--schedule value] [--large-size value] [--large-workers value] [--serve value] [--connect value] [--authkey value] [--blobs] [--lease-time value] [--spool-dir value]'
                 sys.exit(1)
             return o, r
 
@@ -130,44 +287,134 @@ class Hasher(multiprocessing.Process):
         self.storage.close()
         write('\nStasher: Storage closed. Exiting.\n')
     '''
-    def __init__(self, qin, qout, counter, storage):
+    def __init__(self, qin, qout, counter, storage, cache=None, hit_counter=None, miss_counter=None, shard=None, stored_counter=None, slot=None, max_jobs=0, pending=None, spool=None):
         multiprocessing.Process.__init__(self)
         self.qin = qin
         self.qout = qout
         self.counter = counter
-        #self.storage = StorageFactory().new_storage(storage)
+        self.cache = cache
+        self.hit_counter = hit_counter
+        self.miss_counter = miss_counter
+        # In sharded mode results are stored by the Hasher instead of the Stasher
+        self.shard = shard
+        self.stored_counter = stored_counter
+        self.storage = None
+        # Shared with the Supervisor, which replaces the Hasher after max_jobs samples
+        self.slot = slot
+        self.max_jobs = max_jobs
+        # Rows of the samples that killed the previous Hasher of this slot
+        self.pending = pending or []
+        self.spool = spool
 
     def run(self):
-        #self.storage.open()
+        if self.shard is not None:
+            self.storage = ShardStorage(self.shard)
+            self.storage.open()
+        if self.cache:
+            self.cache.open()
+        for result in self.pending:
+            self.emit(result)
+        done = 0
         while True:
-            pdf = self.qin.get()
+            if self.max_jobs and done >= self.max_jobs or self.slot and self.slot.retire.value:
+                self.close()
+                return 0
+
+            try:
+                # Not blocking, a retired Hasher has to notice it without a job
+                pdf = self.qin.get(timeout=SUPERVISOR_INTERVAL)
+            except Empty:
+                continue
 
             if not pdf:
+                if self.slot:
+                    self.slot.finished.value = 1
+                self.close()
                 self.qin.task_done()
                 return 0
 
-            pdf_name = pdf.rstrip(os.path.sep).rpartition(os.path.sep)[2]
-            rv, parsed_pdf = self.parse_pdf(pdf)
+            if self.slot:
+                self.slot.begin(pdf)
+            pdf_name = sample_name(pdf)
+            sha256 = None
+            result = None
+            if self.cache:
+                sha256 = self.get_sha256(pdf)
+                if sha256:
+                    result = self.cache.get(sha256)
+                if result:
+                    self.hit_counter.inc()
+                else:
+                    self.miss_counter.inc()
+
+            if not result:
+                rv, parsed_pdf = self.parse_pdf(pdf)
 
-            if not rv:
-                js = ''
-                t_hash = ''
-                t_str = parsed_pdf
-            else:
-                t_hash, t_str = self.get_tree_hash(parsed_pdf)
-                jscript = self.get_js(parsed_pdf)
-                swflash = self.get_swf(parsed_pdf)
+                if not rv:
+                    jscript = ''
+                    swflash = ''
+                    t_hash = ''
+                    t_str = parsed_pdf
+                else:
+                    t_hash, t_str = self.get_tree_hash(parsed_pdf)
+                    jscript = self.get_js(parsed_pdf)
+                    swflash = self.get_swf(parsed_pdf)
+
+                result = {'tree_md5':t_hash, 'tree':t_str, 'obf_js':jscript, 'swf':swflash}
+                # Failed parses are not cached, they could be caused by the environment
+                if rv and sha256:
+                    self.cache.put(sha256, result)
+
+            result['pdf_md5'] = pdf_name
+            self.emit(result, True)
+            done += 1
 
-            self.qout.put({'pdf_md5':pdf_name, 'tree_md5':t_hash, 'tree':t_str, 'obf_js':jscript, 'swf':swflash})
-            #self.storage.store( (pdf_name, t_hash, t_str, js, swf) )
+    def emit(self, result, sample=False):
+        '''
+        Stores or queues the result of a job, then marks the job as done.
+        With sample the sample in progress in the slot is ended first. The
+        Supervisor doesn't kill the Hasher meanwhile, a result is either
+        written whole or replaced by a timeout row.
+        '''
+        if self.slot:
+            self.slot.emitting.acquire()
+        try:
+            if sample and self.slot:
+                self.slot.end()
+            if self.storage:
+                self.storage.store(result)
+                self.stored_counter.inc()
+            else:
+                if self.spool:
+                    result = self.spool.spool(result)
+                self.qout.put(result)
             self.counter.inc()
             self.qin.task_done()
-        #self.storage.close()
+        finally:
+            if self.slot:
+                self.slot.emitting.release()
+
+    def close(self):
+        if self.cache:
+            self.cache.close()
+        if self.storage:
+            self.storage.close()
+
+    def get_sha256(self, pdf):
+        m = hashlib.sha256()
+        try:
+            with open(pdf, 'rb') as fd:
+                for chunk in iter(lambda: fd.read(1024 * 1024), ''):
+                    m.update(chunk)
+        except IOError:
+            return None
+        return m.hexdigest()
 
     def parse_pdf(self, pdf):
         retval = True
 	try:
-            _, pdffile = PDFParser().parse(pdf, forceMode=True, manualAnalysis=True)
+            parser = PDFParser(maxNestingDepth=MAX_NESTING_DEPTH, maxDecodedSize=MAX_DECODED_SIZE, maxDecompressionRatio=MAX_DECOMPRESSION_RATIO)
+            _, pdffile = parser.parse(pdf, forceMode=True, manualAnalysis=True, lazyMode=True)
         except Exception as e:
             retval = False
             pdffile = '\n'.join([traceback.format_exc(), repr(e)])
@@ -178,7 +425,7 @@ class Hasher(multiprocessing.Process):
         for version in range(pdf.updates + 1):
             for idx, obj in pdf.body[version].objects.items():
                 if obj.object.type == 'stream':
-                    stream_ident = obj.object.decodedStream[:3]
+                    stream_ident = obj.object.peekStream(3)
                     if stream_ident in ['CWS', 'FWS']:
                         swf += obj.object.decodedStream.strip()
         return swf
@@ -190,15 +437,28 @@ class Hasher(multiprocessing.Process):
                 js += self.do_js_code(obj_id, pdf)
         return js
 
-    def get_tree_hash(self, pdf):
+    def get_tree_hash(self, pdf, with_string=True):
+        '''
+        Returns (tree_md5, tree_string). The tree is hashed while it is walked,
+        with_string=False skips building the string and returns None for it
+        '''
+        m = hashlib.md5()
+        parts = []
         try:
-	    tree_string = self.do_tree(pdf)
+            if with_string:
+                self.do_tree(pdf, parts.append)
+            else:
+                self.do_tree(pdf, m.update)
         except Exception as e:
-            tree_string = 'ERROR: ' + repr(e) 
-        m = hashlib.md5()
-        m.update(tree_string)
-	tree_hash = m.hexdigest()
-	if not tree_string:
+            parts = ['ERROR: ' + repr(e)]
+            m = hashlib.md5()
+            with_string = True
+        tree_string = None
+        if with_string:
+            tree_string = ''.join(parts)
+            m.update(tree_string)
+        tree_hash = m.hexdigest()
+        if with_string and not tree_string:
             tree_string = 'Empty tree. Hash on empty string.'
         return tree_hash, tree_string
 
@@ -212,57 +472,50 @@ class Hasher(multiprocessing.Process):
                 consoleOutput += js
         return consoleOutput
 
-    def do_tree(self, pdfFile):
-        version = None
-        treeOutput = ''
+    def do_tree(self, pdfFile, write):
+        '''
+        Writes the tree of every version of the document, piece by piece
+        '''
         tree = pdfFile.getTree()
         for i in range(len(tree)):
-            nodesPrinted = []
+            nodesPrinted = set()
             root = tree[i][0]
             objectsInfo = tree[i][1]
             if i != 0:
-                treeOutput += ' Version '+str(i)+': '
+                write(' Version '+str(i)+': ')
             if root != None:
-                nodesPrinted, nodeOutput = self.printTreeNode(root, objectsInfo, nodesPrinted)
-                treeOutput += nodeOutput
+                self.print_tree_node(root, objectsInfo, nodesPrinted, write)
             for object in objectsInfo:
-                nodesPrinted, nodeOutput = self.printTreeNode(object, objectsInfo, nodesPrinted)
-                treeOutput += nodeOutput
-        return treeOutput
-            
-    def printTreeNode(self, node, nodesInfo, expandedNodes = [], depth = 0, recursive = True):
-        '''
-            Given a tree prints the whole tree and its dependencies
-            
+                self.print_tree_node(object, objectsInfo, nodesPrinted, write)
+
+    def print_tree_node(self, node, nodesInfo, expandedNodes, write):
+        '''
+            Writes a node and, the first time it is seen, all its dependencies.
+            Walks the tree with an explicit stack, deep documents do not hit the recursion limit.
+
             @param node: Root of the tree
-            @param nodesInfo: Information abour the nodes of the tree
-            @param expandedNodes: Already expanded nodes
-            @param depth: Actual depth of the tree
-            @param recursive: Boolean to specify if it's a recursive call or not
-            @return: A tuple (expandedNodes,output), where expandedNodes is a list with the distinct nodes and output is the string representation of the tree
-        '''
-        output = ''
-        if nodesInfo.has_key(node):
-            if node not in expandedNodes or (node in expandedNodes and depth > 0):
-                output += nodesInfo[node][0] + ' (' +str(node) + ') '
-            if node not in expandedNodes:
-                expandedNodes.append(node)
-                children = nodesInfo[node][1]
-                if children != []:
-                    for child in children:
-                        if nodesInfo.has_key(child):
-                            childType = nodesInfo[child][0]
-                        else:
-                            childType = 'Unknown'
-                        if childType != 'Unknown' and recursive:
-                            expChildrenNodes, childrenOutput = self.printTreeNode(child, nodesInfo, expandedNodes, depth+1)
-                            output += childrenOutput
-                            expandedNodes = expChildrenNodes
-                        else:
-                            output += childType + ' (' +str(child) + ') '
+            @param nodesInfo: Information about the nodes of the tree
+            @param expandedNodes: Set of the already expanded nodes, it is updated
+            @param write: Callable receiving the string representation of the tree
+        '''
+        if node in expandedNodes or not nodesInfo.has_key(node):
+            return
+        expandedNodes.add(node)
+        write(nodesInfo[node][0] + ' (' + str(node) + ') ')
+        stack = [iter(nodesInfo[node][1])]
+        while stack:
+            for child in stack[-1]:
+                if nodesInfo.has_key(child):
+                    childType = nodesInfo[child][0]
                 else:
-                    return expandedNodes,output
-        return expandedNodes,output
+                    childType = 'Unknown'
+                write(childType + ' (' + str(child) + ') ')
+                if childType != 'Unknown' and child not in expandedNodes:
+                    expandedNodes.add(child)
+                    stack.append(iter(nodesInfo[child][1]))
+                    break
+            else:
+                stack.pop()
 
 
 
@@ -271,48 +524,824 @@ class Stasher(multiprocessing.Process):
     Stashers are the ant from the ant and the grashopper fable. They save
     things up for winter in persistent storage.
     '''
-    def __init__(self, qin, storage, counter):
+    def __init__(self, qin, storage, counter, resume=None, spool=None):
         multiprocessing.Process.__init__(self)
         self.qin = qin
-        self.storage = StorageFactory().new_storage(storage)
+        self.storage = StorageFactory().new_storage(storage, append=resume is not None)
         self.counter = counter
+        self.resume = resume
+        self.spool = spool
+        self.last_checkpoint = time.time()
 
     def run(self):
         self.storage.open()
         proceed = True
         while proceed:
-            t_hash = self.qin.get()
+            try:
+                t_hash = self.qin.get(timeout=self.storage.flush_interval)
+            except Empty:
+                self.storage.flush()
+                self.checkpoint()
+                continue
             if not t_hash:
                 write('\nStasher: kill msg recvd\n')
                 proceed = False
             else:
                 self.storage.store(t_hash)
+                if self.spool:
+                    self.spool.release(t_hash)
                 self.counter.inc()
-            self.qin.task_done()
+            self.checkpoint()
         self.storage.close()
+        if self.resume is not None:
+            self.resume.update()
         write('\nStasher: Storage closed. Exiting.\n')
 
+    def checkpoint(self):
+        if self.resume is not None and time.time() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.storage.flush()
+            self.resume.update()
+            self.last_checkpoint = time.time()
+
+
+class WorkerSlot(object):
+    '''
+    Shared state of one Hasher position, kept across its replacements:
+    the sample in progress, when it started, the samples analyzed and
+    the time spent on them, and whether the Hasher must exit or received
+    the kill msg.
+    '''
+    path_size = 4096
+
+    def __init__(self, index, bucket=0):
+        self.index = index
+        # Job queue of the Hasher, see Jobber
+        self.bucket = bucket
+        self.path = multiprocessing.RawArray('c', self.path_size)
+        self.started = multiprocessing.RawValue('d', 0)
+        self.samples = multiprocessing.RawValue('i', 0)
+        self.busy_time = multiprocessing.RawValue('d', 0)
+        self.finished = multiprocessing.RawValue('b', 0)
+        # Set by the Supervisor to remove the Hasher after its current sample
+        self.retire = multiprocessing.RawValue('b', 0)
+        # Held by the Hasher while it writes a result, see Hasher.emit
+        self.emitting = multiprocessing.Lock()
+        self.worker = None
+
+    def begin(self, path):
+        self.path.value = path[:self.path_size - 1]
+        self.started.value = time.time()
+
+    def end(self):
+        self.busy_time.value += time.time() - self.started.value
+        self.samples.value += 1
+        self.started.value = 0
+
+
+class Supervisor(object):
+    '''
+    Runs in the main process and keeps the Hashers alive, one per slot. A
+    Hasher over the wall-clock or memory budget of its sample is killed,
+    and its replacement stores a timeout row for the sample. Hashers that
+    exit before the kill msg (recycled or crashed) are replaced too.
+
+    bucket_procs is the number of Hashers reading each of the job queues.
+    The kill msgs are queued here once the Jobber is done. With adaptive
+    set, the Hashers of the first queue are scaled between min_procs and
+    max_procs by hill climbing on the throughput: one Hasher is added or
+    retired every ADAPT_INTERVAL seconds, and the direction is reversed
+    when the throughput does not improve. Hashers are retired while they
+    are mostly idle (walk bound) or the results queue backs up (storage
+    bound).
+    '''
+    def __init__(self, bucket_procs, new_hasher, queues, results, counter, timeout=SAMPLE_TIMEOUT, max_memory=SAMPLE_MEMORY * 1024 * 1024, adaptive=False, min_procs=1, max_procs=None):
+        self.slots = []
+        self.bucket_procs = bucket_procs
+        self.new_hasher = new_hasher
+        self.queues = queues
+        self.results = results
+        self.counter = counter
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.adaptive = adaptive
+        self.min_procs = min_procs
+        self.max_procs = max_procs or bucket_procs[0]
+        self.killed = 0
+        self.recycled = 0
+        # Kill msgs to queue, per job queue
+        self.kill_msgs = [ 0 for qu in queues ]
+        self.next_index = 0
+        self.direction = 1
+        self.last_rate = None
+        # Throughputs (samples/s) measured with each number of Hashers
+        self.rates = {}
+        self.samples = 0
+        self.busy_time = 0
+
+    def start(self):
+        for bucket, procs in enumerate(self.bucket_procs):
+            for cnt in range(procs):
+                self.add(bucket)
+        self.mark(time.time())
+
+    def add(self, bucket=0):
+        slot = WorkerSlot(self.next_index, bucket)
+        self.next_index += 1
+        self.slots.append(slot)
+        self.replace(slot)
+
+    def running(self, bucket=None):
+        return len([ slot for slot in self.slots if not slot.retire.value and bucket in (None, slot.bucket) ])
+
+    def watch(self, jobber):
+        '''
+        Returns when every Hasher got its kill msg and exited, after the
+        Jobber queued all the jobs
+        '''
+        queueing = True
+        while self.slots:
+            time.sleep(SUPERVISOR_INTERVAL)
+            for slot in list(self.slots):
+                if self.check(slot):
+                    slot.worker.join()
+                    self.slots.remove(slot)
+                    self.samples += slot.samples.value
+                    self.busy_time += slot.busy_time.value
+                    # A retired Hasher waiting for a job can get the kill msg of another one
+                    if slot.retire.value and slot.finished.value:
+                        self.kill_msgs[slot.bucket] += 1
+            if queueing and not jobber.is_alive():
+                queueing = False
+                for bucket in range(len(self.queues)):
+                    self.kill_msgs[bucket] += self.running(bucket)
+            # Not blocking on a full queue, hung Hashers must still be killed
+            for bucket, qu in enumerate(self.queues):
+                while self.kill_msgs[bucket]:
+                    try:
+                        qu.put_nowait(None)
+                    except Full:
+                        break
+                    self.kill_msgs[bucket] -= 1
+            now = time.time()
+            if now - self.last_mark >= ADAPT_INTERVAL:
+                measured = self.measure(now)
+                # Wait for the Hasher retired last time to exit
+                if queueing and self.adaptive and measured and self.running() == len(self.slots):
+                    self.adapt(*measured)
+        if self.killed or self.recycled:
+            write('\nSupervisor: %d Hashers killed, %d recycled\n' % (self.killed, self.recycled))
+        self.report()
+
+    def mark(self, now):
+        self.last_mark = now
+        self.last_procs = len(self.slots)
+        self.last_count = self.counter.value()
+        self.last_busy = sum([ slot.busy_time.value for slot in self.slots if slot.bucket == 0 ])
+
+    def measure(self, now):
+        '''
+        Records the throughput since the last mark for the number of
+        Hashers alive. Returns it with the fraction of that time the
+        Hashers of the first queue spent on samples, or None if the number
+        changed meanwhile.
+        '''
+        elapsed = now - self.last_mark
+        procs = len(self.slots)
+        changed = procs != self.last_procs
+        rate = (self.counter.value() - self.last_count) / elapsed
+        busy = sum([ slot.busy_time.value for slot in self.slots if slot.bucket == 0 ]) - self.last_busy
+        bucket_procs = len([ slot for slot in self.slots if slot.bucket == 0 ])
+        self.mark(now)
+        if changed or not bucket_procs:
+            return None
+        self.rates.setdefault(procs, []).append(rate)
+        return rate, busy / (elapsed * bucket_procs)
+
+    def adapt(self, rate, utilization):
+        backlog = queue_size(self.results)
+        if (backlog or 0) > RESULTS_BACKLOG or utilization < LOW_UTILIZATION:
+            self.direction = -1
+        elif self.last_rate is not None and rate <= self.last_rate * (1 + ADAPT_THRESHOLD):
+            self.direction = -self.direction
+        self.last_rate = rate
+        procs = self.running(0)
+        if procs + self.direction > self.max_procs or procs + self.direction < self.min_procs:
+            self.direction = -self.direction
+            return
+        if self.direction > 0:
+            self.add()
+            self.last_procs = len(self.slots)
+        else:
+            [ slot for slot in self.slots if slot.bucket == 0 ][-1].retire.value = 1
+
+    def report(self):
+        if self.samples:
+            write('Supervisor: mean parse time %.3fs over %d samples\n' % (self.busy_time / self.samples, self.samples))
+        if not self.rates:
+            return
+        means = dict([ (procs, sum(rates) / len(rates)) for procs, rates in self.rates.items() ])
+        for procs in sorted(means):
+            write('Supervisor: %d Hashers, %.2f samples/s (%d measures)\n' % (procs, means[procs], len(self.rates[procs])))
+        best = max(means, key=means.get)
+        write('Supervisor: best throughput %.2f samples/s with %d Hashers\n' % (means[best], best))
+
+    def check(self, slot):
+        worker = slot.worker
+        started = slot.started.value
+        if worker.is_alive():
+            if not started:
+                return False
+            reason = None
+            if self.timeout and time.time() - started > self.timeout:
+                reason = 'TIMEOUT: no result after %d seconds' % self.timeout
+            elif self.max_memory:
+                rss = process_rss(worker.pid)
+                if rss and rss > self.max_memory:
+                    reason = 'TIMEOUT: memory budget exceeded (%d MB)' % (rss / (1024 * 1024))
+            if not reason:
+                return False
+            # Not while the Hasher writes a result, it is done with the sample
+            if not slot.emitting.acquire(False):
+                return False
+            try:
+                # The Hasher may have moved to another sample meanwhile
+                if slot.started.value != started:
+                    return False
+                self.kill(worker)
+            finally:
+                slot.emitting.release()
+            self.killed += 1
+            write('\nSupervisor: Hasher killed on %s, %s\n' % (slot.path.value, reason))
+        elif slot.finished.value:
+            return True
+        elif slot.retire.value and not started:
+            return True
+        elif started:
+            reason = 'TIMEOUT: Hasher died (exit code %s)' % worker.exitcode
+            write('\nSupervisor: Hasher died on %s\n' % slot.path.value)
+        else:
+            self.recycled += 1
+            self.replace(slot)
+            return False
+        row = failure_row(slot.path.value, reason)
+        slot.end()
+        self.replace(slot, [row])
+        return False
+
+    def kill(self, worker):
+        worker.terminate()
+        worker.join(KILL_GRACE)
+        if worker.is_alive():
+            os.kill(worker.pid, signal.SIGKILL)
+            worker.join()
+
+    def replace(self, slot, pending=None):
+        if slot.worker:
+            slot.worker.join()
+            # The Hasher could have died while writing a result
+            slot.emitting = multiprocessing.Lock()
+        slot.worker = self.new_hasher(slot, pending)
+        slot.worker.start()
+
+
+class CoordinatorManager(BaseManager):
+    '''
+    Serves the Coordinator to the worker nodes in distributed mode
+    '''
+    pass
+
+
+class Coordinator(object):
+    '''
+    Hands out the jobs queued by the Jobber to the worker nodes, and queues
+    their results for the Stasher. Jobs are leased to a node for
+    lease_time seconds, renewed each time the node asks for more jobs.
+    When a node is lost its leases expire and the jobs are leased again,
+    up to max_attempts times before a timeout row is stored. With blobs
+    the content of the samples is sent along, for nodes that can't read
+    the paths of the coordinator.
+    '''
+    def __init__(self, jobs, results, counter, lease_time=LEASE_TIME, max_attempts=LEASE_ATTEMPTS, blobs=False):
+        # jobs is ended by a None once the Jobber is done
+        self.jobs = jobs
+        self.results = results
+        self.counter = counter
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.blobs = blobs
+        self.lock = threading.Lock()
+        # job id: [node, deadline, path, attempts]
+        self.leases = {}
+        self.retries = []
+        self.next_id = 0
+        self.exhausted = False
+        self.nodes = set()
+        self.lost = 0
+
+    def lease(self, node, count):
+        '''
+        Renews the leases of node and returns up to count new (job id,
+        path, blob) jobs, blob is None without blobs. Returns None once all
+        the jobs are done, the node can exit.
+        '''
+        with self.lock:
+            if node not in self.nodes:
+                self.nodes.add(node)
+                write('\nCoordinator: node %s connected\n' % node)
+            now = time.time()
+            for lease in self.leases.values():
+                if lease[0] == node:
+                    lease[1] = now + self.lease_time
+            self.expire()
+            batch = []
+            while len(batch) < count:
+                if self.retries:
+                    path, attempts = self.retries.pop()
+                elif self.exhausted:
+                    break
+                else:
+                    try:
+                        path = self.jobs.get_nowait()
+                    except Empty:
+                        break
+                    if path is None:
+                        self.exhausted = True
+                        self.jobs.task_done()
+                        break
+                    attempts = 0
+                blob = None
+                if self.blobs:
+                    try:
+                        with open(path, 'rb') as fd:
+                            blob = fd.read()
+                    except IOError as e:
+                        self.done(failure_row(path, 'Unable to read sample: %s' % e))
+                        continue
+                self.leases[self.next_id] = [node, now + self.lease_time, path, attempts + 1]
+                batch.append((self.next_id, path, blob))
+                self.next_id += 1
+            if not batch and self.finished():
+                return None
+            return batch
+
+    def complete(self, node, job_id, result):
+        '''
+        Queues the result of a leased job. Results of expired leases are
+        dropped, the job was leased again.
+        '''
+        with self.lock:
+            if self.leases.pop(job_id, None) is None:
+                return False
+            self.done(result)
+            return True
+
+    def done(self, result):
+        self.results.put(result)
+        self.counter.inc()
+        self.jobs.task_done()
+
+    def expire(self):
+        now = time.time()
+        for job_id, (node, deadline, path, attempts) in self.leases.items():
+            if deadline < now:
+                del self.leases[job_id]
+                self.lost += 1
+                if attempts >= self.max_attempts:
+                    self.done(failure_row(path, 'TIMEOUT: lease lost %d times' % attempts))
+                else:
+                    self.retries.append((path, attempts))
+                write('\nCoordinator: lease of %s on node %s expired\n' % (path, node))
+
+    def finished(self):
+        return self.exhausted and not self.leases and not self.retries
+
+    def wait(self):
+        '''
+        Returns when all the jobs are done, expiring the leases of lost
+        nodes meanwhile
+        '''
+        while True:
+            with self.lock:
+                self.expire()
+                if self.finished():
+                    break
+            time.sleep(LEASE_POLL)
+        # Lets the idle nodes learn that the jobs are done
+        time.sleep(LEASE_POLL * 3)
+        write('\nCoordinator: %d nodes, %d leases lost\n' % (len(self.nodes), self.lost))
+
+
+class Fetcher(threading.Thread):
+    '''
+    Thread of a worker node leasing jobs from the Coordinator into the
+    queue of the local Hashers, keeping up to capacity of them. Blobs are
+    written under spool_dir, in a directory per job so the sample keeps
+    its name. Exits once the Coordinator has no more jobs.
+    '''
+    def __init__(self, manager, qu, node, pending, capacity, spool_dir):
+        threading.Thread.__init__(self)
+        self.manager = manager
+        self.qu = qu
+        self.node = node
+        self.pending = pending
+        self.capacity = capacity
+        self.spool_dir = spool_dir
+
+    def run(self):
+        try:
+            coordinator = self.manager.coordinator()
+            while True:
+                # Asking for no job still renews the leases
+                room = self.pending.wait_room(self.capacity, LEASE_POLL)
+                batch = coordinator.lease(self.node, room)
+                if batch is None:
+                    break
+                for job_id, path, blob in batch:
+                    spooled = None
+                    if blob is not None:
+                        spooled = os.path.join(tempfile.mkdtemp(dir=self.spool_dir), sample_name(path))
+                        with open(spooled, 'wb') as fd:
+                            fd.write(blob)
+                    self.pending.add(sample_name(path), job_id, spooled)
+                    self.qu.put(spooled or path)
+                if room and not batch:
+                    time.sleep(LEASE_POLL)
+        except (EOFError, IOError, socket.error) as e:
+            write('\nFetcher: lost the coordinator (%s)\n' % e)
+
+
+class Returner(threading.Thread):
+    '''
+    Thread of a worker node sending the results of the local Hashers to
+    the Coordinator, until the kill msg
+    '''
+    def __init__(self, manager, qin, node, pending):
+        threading.Thread.__init__(self)
+        self.manager = manager
+        self.qin = qin
+        self.node = node
+        self.pending = pending
+
+    def run(self):
+        coordinator = None
+        while True:
+            result = self.qin.get()
+            if not result:
+                break
+            job_id, spooled = self.pending.pop(result['pdf_md5'])
+            if spooled:
+                shutil.rmtree(os.path.dirname(spooled), ignore_errors=True)
+            try:
+                if not coordinator:
+                    coordinator = self.manager.coordinator()
+                coordinator.complete(self.node, job_id, result)
+            except (EOFError, IOError, socket.error) as e:
+                write('\nReturner: result of %s lost (%s)\n' % (result['pdf_md5'], e))
+
+
+class ResultQueue(object):
+    '''
+    Queue of the results for the Stasher, or the Returner of a worker
+    node. Unlike a multiprocessing queue, put writes the result to the
+    pipe before returning instead of leaving it to a feeder thread, so it
+    is not lost when the Hasher is killed or dies on its next sample.
+    Holds up to maxsize results, put blocks when it is full. There is a
+    single reader, which gets the kill msg once the writers are done.
+    '''
+    def __init__(self, maxsize=0):
+        self.reader, self.writer = multiprocessing.Pipe(duplex=False)
+        self.lock = multiprocessing.Lock()
+        self.room = None
+        if maxsize:
+            self.room = multiprocessing.BoundedSemaphore(maxsize)
+        self.size = multiprocessing.Value('i', 0)
+
+    def put(self, result):
+        if self.room:
+            self.room.acquire()
+        with self.lock:
+            with self.size.get_lock():
+                self.size.value += 1
+            self.writer.send(result)
+
+    def get(self, timeout=None):
+        if timeout is not None and not self.reader.poll(timeout):
+            raise Empty
+        result = self.reader.recv()
+        with self.size.get_lock():
+            self.size.value -= 1
+        if self.room:
+            self.room.release()
+        return result
+
+    def qsize(self):
+        return self.size.value
+
+
+class PendingJobs(object):
+    '''
+    Jobs leased by a worker node and not returned yet. Results only carry
+    the sample name, samples with the same name are matched in lease order.
+    '''
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.jobs = {}
+        self.size = 0
+
+    def add(self, name, job_id, spooled):
+        with self.lock:
+            self.jobs.setdefault(name, deque()).append((job_id, spooled))
+            self.size += 1
+
+    def pop(self, name):
+        with self.lock:
+            jobs = self.jobs[name]
+            job = jobs.popleft()
+            if not jobs:
+                del self.jobs[name]
+            self.size -= 1
+            self.lock.notify()
+            return job
+
+    def wait_room(self, capacity, timeout):
+        '''
+        Returns the number of jobs that can be added, waiting up to timeout
+        seconds for one if there is no room
+        '''
+        with self.lock:
+            if self.size >= capacity:
+                self.lock.wait(timeout)
+            return max(0, capacity - self.size)
+
+
+class ResultCache(object):
+    '''
+    Content addressed cache of Hasher results, so samples seen again under
+    another path are not parsed twice. Results are keyed by the SHA-256 of
+    the sample and kept in a sqlite database in the cache directory. When
+    the database grows over max_size the least recently used results are
+    evicted.
+    '''
+    db_name = 'results.sqlite'
+    table = 'results'
+    cols = ( 'tree_md5', 'tree', 'obf_js', 'swf' )
+    evict_batch = 64
+
+    def __init__(self, cache_dir, max_size):
+        self.path = os.path.join(cache_dir, self.db_name)
+        self.max_size = max_size
+        self.db_conn = None
+
+    def open(self):
+        # Hashers share the database, so wait for the other writers instead of failing
+        self.db_conn = sqlite3.connect(self.path, timeout=60)
+        self.db_conn.text_factory = str
+        self.db_conn.execute('CREATE TABLE IF NOT EXISTS ' + self.table + ' (sha256 TEXT, ' + ', '.join([col + ' TEXT' for col in self.cols]) + ', last_used REAL, PRIMARY KEY(sha256))')
+        self.db_conn.execute('CREATE INDEX IF NOT EXISTS ' + self.table + '_last_used ON ' + self.table + ' (last_used)')
+        self.db_conn.commit()
+
+    def get(self, sha256):
+        row = self.db_conn.execute('SELECT ' + ', '.join(self.cols) + ' FROM ' + self.table + ' WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is None:
+            return None
+        self.db_conn.execute('UPDATE ' + self.table + ' SET last_used = ? WHERE sha256 = ?', (time.time(), sha256))
+        self.db_conn.commit()
+        return dict(zip(self.cols, row))
+
+    def put(self, sha256, result):
+        vals = [sha256] + [result.get(col, '') for col in self.cols] + [time.time()]
+        self.db_conn.execute('INSERT OR REPLACE INTO ' + self.table + ' VALUES (' + ', '.join(['?' for val in vals]) + ')', vals)
+        self.evict()
+        self.db_conn.commit()
+
+    def evict(self):
+        while self.size() > self.max_size:
+            stale = self.db_conn.execute('SELECT sha256 FROM ' + self.table + ' ORDER BY last_used LIMIT ?', (self.evict_batch,)).fetchall()
+            if not stale:
+                break
+            self.db_conn.executemany('DELETE FROM ' + self.table + ' WHERE sha256 = ?', stale)
+
+    def size(self):
+        '''
+        Bytes in use by the database, without the pages freed by evictions
+        '''
+        page_size = self.db_conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self.db_conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self.db_conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def close(self):
+        self.db_conn.commit()
+        self.db_conn.close()
+
+
+class ResumeIndex(object):
+    '''
+    Compact index of the samples already in the output, for --resume. Each
+    sample name is kept as the first key_size bytes of its MD5: the keys of
+    the last checkpoint in one sorted string and the newer ones in a set.
+    The checkpoint file also keeps the position of the storage it covers,
+    so a restart only reads what was stored after the last checkpoint.
+    '''
+    key_size = 8
+
+    def __init__(self, storage):
+        self.storage_type = storage
+        self.storage = None
+        self.keys = ''
+        self.new_keys = set()
+        self.position = 0
+
+    def __contains__(self, name):
+        key = hashlib.md5(name).digest()[:self.key_size]
+        if key in self.new_keys:
+            return True
+        # Binary search in the sorted keys of the checkpoint
+        low, high = 0, len(self.keys) / self.key_size
+        while low < high:
+            mid = (low + high) / 2
+            mid_key = self.keys[mid * self.key_size:(mid + 1) * self.key_size]
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.keys) / self.key_size + len(self.new_keys)
+
+    def update(self):
+        '''
+        Adds the samples stored since the last update and saves a checkpoint
+        '''
+        if self.storage is None:
+            self.storage = StorageFactory().new_storage(self.storage_type, append=True)
+            self.load()
+            if self.storage_type == 'shards':
+                # Shards left by an interrupted run haven't been merged yet
+                for shard_name in ShardStorage.shard_names():
+                    self.add(DbStorage(shard_name).stored_keys()[0])
+        stored = self.storage.stored_keys(self.position)
+        if stored is None:
+            # The storage was replaced, the checkpoint is useless
+            self.keys = ''
+            self.new_keys = set()
+            stored = self.storage.stored_keys()
+        keys, self.position = stored
+        self.add(keys)
+        self.save()
+
+    def add(self, names):
+        for name in names:
+            self.new_keys.add(hashlib.md5(name).digest()[:self.key_size])
+
+    def load(self):
+        path = self.storage.resume_path()
+        if not path or not os.path.isfile(path):
+            return
+        with open(path, 'rb') as fd:
+            try:
+                position = int(fd.readline())
+            except ValueError:
+                return
+            keys = fd.read()
+        if len(keys) % self.key_size == 0:
+            self.keys = keys
+            self.position = position
+
+    def save(self):
+        merged = cStringIO.StringIO()
+        last = None
+        old_keys = (self.keys[i:i + self.key_size] for i in xrange(0, len(self.keys), self.key_size))
+        for key in heapq.merge(old_keys, sorted(self.new_keys)):
+            if key != last:
+                merged.write(key)
+                last = key
+        self.keys = merged.getvalue()
+        self.new_keys = set()
+        path = self.storage.resume_path()
+        if path:
+            with open(path + '.tmp', 'wb') as fd:
+                fd.write('%d\n' % self.position)
+                fd.write(self.keys)
+            os.rename(path + '.tmp', path)
+
+
+class Spooled(object):
+    '''
+    Descriptor of a result field written by a Hasher to a spool file. The
+    field is read by the storage, chunks() maps the file so it can be
+    written out without a copy of the whole field.
+    '''
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def read(self):
+        with open(self.path, 'rb') as fd:
+            return fd.read()
+
+    def chunks(self, size=SPOOL_CHUNK):
+        if not self.size:
+            return
+        with open(self.path, 'rb') as fd:
+            buf = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, len(buf), size):
+                    yield buf[offset:offset + size]
+            finally:
+                buf.close()
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class Spool(object):
+    '''
+    Spool files of a run, created by the Hashers for the large fields of
+    their results and removed by the Stasher once stored. Hashers wait
+    while the files not stored yet take more than budget bytes.
+    '''
+    def __init__(self, base=None, budget=SPOOL_BUDGET):
+        self.path = tempfile.mkdtemp(prefix='pdfrankenstein-spool-', dir=base or spool_base())
+        self.budget = budget
+        self.used = multiprocessing.Value('d', 0)
+
+    def spool(self, result):
+        '''
+        Replaces the fields of result of SPOOL_SIZE bytes or more by Spooled
+        descriptors
+        '''
+        fields = [ key for key, value in result.items() if isinstance(value, str) and len(value) >= SPOOL_SIZE ]
+        if not fields:
+            return result
+        size = sum([ len(result[key]) for key in fields ])
+        while True:
+            with self.used.get_lock():
+                # A result over the budget goes alone
+                if not self.used.value or self.used.value + size <= self.budget:
+                    self.used.value += size
+                    break
+            time.sleep(SPOOL_WAIT)
+        for key in fields:
+            fd, path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'wb') as spooled:
+                spooled.write(result[key])
+            result[key] = Spooled(path, len(result[key]))
+        return result
+
+    def release(self, result):
+        size = 0
+        for value in result.values():
+            if isinstance(value, Spooled):
+                value.release()
+                size += value.size
+        if size:
+            with self.used.get_lock():
+                self.used.value -= size
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
 
 class StorageFactory(object):
 
-    def new_storage(self, typ):
+    def new_storage(self, typ, append=False):
         if typ == 'stdout':
             return StdoutStorage()
-        if typ == 'db':
+        if typ in ('db', 'shards'):
             return DbStorage()
         else:
-            return FileStorage(typ)
+            return FileStorage(typ, append)
 
 class Storage(object):
 
+    # Seconds between flushes of buffered rows, None if the storage doesn't buffer
+    flush_interval = None
+
     def __init__(self):
         pass
     def open(self):
         pass
     def store(self):
         pass
+    def flush(self):
+        pass
     def close(self):
         pass
+    def stored_keys(self, position=0):
+        '''
+        Returns the pdf_md5 of the rows stored after position and the new
+        position, or None if the storage is behind position (replaced)
+        '''
+        return [], position
+    def resume_path(self):
+        return None
 
 class StdoutStorage(Storage):
     def __init__(self):
@@ -324,33 +1353,133 @@ class DbStorage(Storage):
     table = 'parsed_pdfs'
     cols = ( 'pdf_md5', 'tree_md5', 'tree', 'graph', 'obf_js', 'deobf_js', 'swf', 'abc', 'actionscript', 'shellcode', 'bin_blob' )
     primary = 'pdf_md5'
+    # Rows are written in one transaction every batch_size rows or flush_interval seconds
+    batch_size = 500
+    flush_interval = 5
     
-    def __init__(self):
-        self.db = self.DBGateway()
+    def __init__(self, db_name=None):
+        self.db = self.DBGateway(db_name=db_name)
+        self.rows = []
+        self.stored = 0
+        self.started = time.time()
+        self.last_flush = time.time()
 
     def open(self):
+        self.db.set_wal()
         self.db.create_table(self.table, cols=[ ' '.join([col, 'TEXT']) for col in self.cols], primary=self.primary)
+        self.started = time.time()
+        self.last_flush = time.time()
 
     def store(self, data_list):
-        data_list = self.align_kwargs(data_list)
-        self.db.insert(self.table, cols=self.cols, vals=data_list)
+        self.rows.append(self.align_kwargs(data_list))
+        if len(self.rows) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.db.insert_many(self.table, cols=self.cols, vals=self.rows)
+            self.stored += len(self.rows)
+            self.rows = []
+        self.last_flush = time.time()
+
+    def stored_keys(self, position=0):
+        # Positions are rowids, the rows are only appended
+        # Cursors are consumed, an open one would keep the database locked for the writers
+        if not self.db.select("name FROM sqlite_master WHERE type='table' AND name='" + self.table + "'").fetchall():
+            return ([], 0) if position == 0 else None
+        last = self.db.select('MAX(rowid) FROM ' + self.table).fetchall()[0][0] or 0
+        if last < position:
+            return None
+        keys = [ row[0] for row in self.db.select('pdf_md5 FROM ' + self.table + ' WHERE rowid > %d AND rowid <= %d' % (position, last)) ]
+        return keys, last
+
+    def resume_path(self):
+        return os.path.join(self.db.db_dir, self.db.db_name) + '.resume'
     
     def close(self):
-        self.db.disconnect()
+        try:
+            self.flush()
+        finally:
+            self.db.disconnect()
+        elapsed = time.time() - self.started
+        write('\nDbStorage: %d rows stored in %.2fs (%.1f rows/s)\n' % (self.stored, elapsed, self.stored / elapsed if elapsed > 0 else 0))
 
     def align_kwargs(self, data):
         aligned = []
         for col in self.cols:
-            aligned.append(data.get(col, ''))
+            value = data.get(col, '')
+            if isinstance(value, Spooled):
+                value = value.read()
+            aligned.append(value)
         return tuple(aligned)
 
 
+class ShardStorage(DbStorage):
+    '''
+    Database of a single Hasher in sharded mode, so the results are written
+    by the process that produced them and never cross the Stasher queue.
+    Shards are merged into the configured database with merge() after the run.
+    '''
+    # Committed row by row, a Hasher killed or crashed on a sample loses none
+    # of the previous ones. Each shard is written at the pace of one Hasher.
+    batch_size = 1
+
+    def __init__(self, shard):
+        DbStorage.__init__(self, self.shard_name(shard))
+
+    @classmethod
+    def shard_name(cls, shard):
+        import cfg
+        name, ext = os.path.splitext(cfg.Config().setting('database', 'db'))
+        return '%s-%d%s' % (name, shard, ext)
+
+    @classmethod
+    def shard_names(cls):
+        '''
+        Names of the shards in the database directory, including the ones
+        left by previous runs
+        '''
+        import cfg
+        config = cfg.Config()
+        name, ext = os.path.splitext(config.setting('database', 'db'))
+        shard_names = []
+        for file_name in os.listdir(config.setting('database', 'path')):
+            if file_name.startswith(name + '-') and file_name.endswith(ext) and file_name[len(name) + 1:len(file_name) - len(ext)].isdigit():
+                shard_names.append(file_name)
+        return shard_names
+
+    @classmethod
+    def merge(cls):
+        storage = DbStorage()
+        storage.open()
+        db = storage.db
+        merged = 0
+        for shard_name in cls.shard_names():
+            shard_path = os.path.join(db.db_dir, shard_name)
+            db.attach(shard_name, 'shard')
+            db.db_curr.execute('INSERT OR IGNORE INTO ' + cls.table + ' (' + ', '.join(cls.cols) + ') SELECT ' + ', '.join(cls.cols) + ' FROM shard.' + cls.table)
+            db.detach('shard')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(shard_path + suffix):
+                    os.remove(shard_path + suffix)
+            merged += 1
+        count = db.count(cls.table)
+        db.disconnect()
+        return merged, count
+
+
 class FileStorage(Storage):
+    '''
+    One line per sample with the values of cols separated by tabs, escaped
+    so tabs and newlines in the JS or SWF don't break the lines.
+    '''
+    cols = ( 'pdf_md5', 'tree_md5', 'tree', 'obf_js', 'swf' )
 
-    def __init__(self, path):
+    def __init__(self, path, append=False):
         self.path = path
+        self.mode = 'ab' if append else 'wb'
         try:
-            self.fd = open(path, 'wb')
+            self.fd = open(path, self.mode)
         except IOError as e:
             print e
             print 'Unable to create output. Exiting.'
@@ -359,24 +1488,60 @@ class FileStorage(Storage):
             self.fd.close()
 
     def open(self):
-        self.fd = open(self.path, 'wb')
+        self.fd = open(self.path, self.mode)
 
     def store(self, data_list):
         try:
-            self.fd.write('%s\n' % '\t'.join(data_list))
+            for cnt, col in enumerate(self.cols):
+                value = data_list.get(col, '')
+                if cnt:
+                    self.fd.write('\t')
+                # The escaping is byte by byte, spooled fields are written in chunks
+                if isinstance(value, Spooled):
+                    for chunk in value.chunks():
+                        self.fd.write(chunk.encode('string_escape'))
+                else:
+                    self.fd.write(str(value).encode('string_escape'))
+            self.fd.write('\n')
         except IOError as e:
             print e
             print 'Unable to write to output file.'
             sys.exit(1)
 
+    def flush(self):
+        self.fd.flush()
+
     def close(self):
         self.fd.close()
 
+    def stored_keys(self, position=0):
+        # Positions are offsets after complete lines
+        keys = []
+        try:
+            fd = open(self.path, 'rb')
+        except IOError:
+            return ([], 0) if position == 0 else None
+        with fd:
+            fd.seek(0, os.SEEK_END)
+            if fd.tell() < position:
+                return None
+            fd.seek(position)
+            for line in fd:
+                if not line.endswith('\n'):
+                    break
+                keys.append(line.split('\t', 1)[0].decode('string_escape'))
+                position += len(line)
+        return keys, position
+
+    def resume_path(self):
+        return self.path + '.resume'
+
 class Counter(object):
 
     def __init__(self, soft_max, name='Untitled'):
         self.counter = multiprocessing.RawValue('i', 0)
-        self.hard_max = multiprocessing.RawValue('i', 0)
+        # -1 until the Jobber knows the number of jobs
+        self.hard_max = multiprocessing.RawValue('i', -1)
         self.soft_max = soft_max
         self.lock = multiprocessing.Lock()
         self.name = name
@@ -391,7 +1556,7 @@ class Counter(object):
     
     def complete(self):
         with self.lock:
-            if self.hard_max > 0:
+            if self.hard_max.value >= 0:
                 return self.counter.value == self.hard_max.value
 
     def ceil(self):
@@ -400,24 +1565,57 @@ class Counter(object):
 
 class Jobber(multiprocessing.Process):
 
-    def __init__(self, job_list, job_qu, validator, counters, num_procs):
+    def __init__(self, job_list, job_qus, validator, counters, resume=None, schedule='walk', large_size=LARGE_SAMPLE_SIZE):
+        '''
+        job_list can be any iterable, like the generator of walk_samples. If
+        validator is None the jobs are queued without checking them. Jobs
+        whose sample name is in resume (a ResumeIndex) are skipped. The kill
+        msgs are queued by the Supervisor, which knows the number of Hashers.
+
+        schedule is one of SCHEDULES. With 'walk' the jobs are queued in the
+        order of job_list. The other ones need (size, path) jobs: 'largest'
+        queues them by decreasing size once job_list is exhausted, so the
+        longest samples don't finish last, and 'buckets' queues the samples
+        of large_size bytes or more to the second of job_qus, which has its
+        own Hashers.
+        '''
         multiprocessing.Process.__init__(self)
         self.jobs = job_list
-        self.qu = job_qu
-        self.qu.cancel_join_thread()
+        self.qus = job_qus
         self.counters = counters
         self.validator = validator
-        self.num_procs = num_procs
+        self.resume = resume
+        self.schedule = schedule
+        self.large_size = large_size
 
     def run(self):
         write("Jobber started\n")
+        if self.resume is not None:
+            self.resume.update()
+            write("Resuming. %d samples already stored\n" % len(self.resume))
         job_cnt = 0
+        skip_cnt = 0
+        sized = []
         for job in self.jobs:
-            if self.validator.valid(job):
-                self.qu.put(job)
+            size = None
+            if self.schedule != 'walk':
+                size, job = job
+            if self.resume is not None and sample_name(job) in self.resume:
+                skip_cnt += 1
+            elif not self.validator or self.validator.valid(job):
+                if self.schedule == 'largest':
+                    sized.append((size, job))
+                elif self.schedule == 'buckets' and size >= self.large_size:
+                    self.qus[1].put(job)
+                else:
+                    self.qus[0].put(job)
                 job_cnt += 1
-        for n in range(self.num_procs):
-            self.qu.put(None)
+        if self.resume is not None:
+            write("Resuming. %d samples skipped\n" % skip_cnt)
+        if sized:
+            sized.sort(reverse=True)
+            for size, job in sized:
+                self.qus[0].put(job)
         for counter in self.counters:
             counter.hard_max.value = job_cnt
         write("Job queues complete. Counters set.\n")
@@ -425,33 +1623,20 @@ class Jobber(multiprocessing.Process):
 
 class ProgressBar(multiprocessing.Process):
 
-    def __init__(self, counters, io_lock, qu):
+    def __init__(self, counters, io_lock, qu, stats=[]):
         multiprocessing.Process.__init__(self)
         self.counters = counters
+        self.stats = stats
         self.io_lock = io_lock
         self.msg_qu = qu
 
     def run(self):
-        while any(not counter.ceil() for counter in self.counters):
-            self.io_lock.acquire()
-            sys.stdout.write('Filling job queues. \ \r')
-            sys.stdout.flush()
-            time.sleep(.1)
-            sys.stdout.write('Filling job queues. | \r')
-            sys.stdout.flush()
-            time.sleep(.1)
-            sys.stdout.write('Filling job queues. / \r')
-            sys.stdout.flush()
-            time.sleep(.1)
-            sys.stdout.write('Filling job queues. - \r')
-            sys.stdout.flush()
-            time.sleep(.1)
-            sys.stdout.flush()
-            self.io_lock.release()
         while any(not c.complete() for c in self.counters):
             time.sleep(.1)
             for counter in self.counters:
                 self.progress(counter)
+            for stat in self.stats:
+                self.stat(stat)
             self.check_msgs()
             write('\r')
         write('\n')
@@ -459,8 +1644,17 @@ class ProgressBar(multiprocessing.Process):
     def progress(self, counter):
         cnt = counter.value()
         ceil = counter.ceil()
-        prct = cnt * 1.0 / ceil * 100
-        write('[%s: %07d of %07d %03.02f%%]\t' % (counter.name, cnt, counter.ceil(), prct))
+        if ceil < 0:
+            # Samples are still being found
+            write('[%s: %07d of ?]\t' % (counter.name, cnt))
+        elif ceil == 0:
+            write('[%s: %07d of %07d]\t' % (counter.name, cnt, ceil))
+        else:
+            prct = cnt * 1.0 / ceil * 100
+            write('[%s: %07d of %07d %03.02f%%]\t' % (counter.name, cnt, ceil, prct))
+
+    def stat(self, counter):
+        write('[%s: %07d]\t' % (counter.name, counter.value()))
 
     def check_msgs(self):
         rv = True
@@ -484,6 +1678,181 @@ class FileValidator(Validator):
     def valid(self, fname):
         return os.path.isfile(fname)
 
+def scan_dir(top, sizes=False):
+    '''
+    Yields (path, is_dir, is_file, size) for the entries of a directory.
+    With scandir the types come from the directory listing itself, otherwise
+    each entry is lstat'ed once. Symlinks to directories are not followed.
+    The size of files is only set if sizes is True, it is taken from the
+    lstat or from the stat cached by scandir (free on Windows, one call per
+    file elsewhere).
+    '''
+    if SCANDIR_MODULE:
+        for entry in scandir(top):
+            try:
+                is_file = entry.is_file()
+                size = entry.stat().st_size if sizes and is_file else None
+                yield entry.path, entry.is_dir(follow_symlinks=False), is_file, size
+            except OSError:
+                continue
+    else:
+        for name in os.listdir(top):
+            path = os.path.join(top, name)
+            try:
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    if os.path.isfile(path):
+                        yield path, False, True, os.path.getsize(path) if sizes else None
+                    else:
+                        yield path, False, False, None
+                else:
+                    yield path, stat.S_ISDIR(st.st_mode), stat.S_ISREG(st.st_mode), st.st_size
+            except OSError:
+                continue
+
+def sample_name(path):
+    return path.rstrip(os.path.sep).rpartition(os.path.sep)[2]
+
+def failure_row(path, reason):
+    '''
+    Result stored for a sample without analysis, reason takes the place of the tree
+    '''
+    return {'pdf_md5':sample_name(path), 'tree_md5':'', 'tree':reason, 'obf_js':'', 'swf':''}
+
+def spool_base():
+    '''
+    Directory for the spool files, in memory (tmpfs) when available
+    '''
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def has_magic(path, magic, size=MAGIC_SEARCH_SIZE):
+    try:
+        with open(path, 'rb') as fd:
+            return magic in fd.read(size)
+    except IOError:
+        return False
+
+def walk_samples(path, extensions=None, magic=None, sizes=False):
+    '''
+    Recursively yields the files under path as they are found, so jobs can
+    start before the whole tree is listed. Files can be filtered by
+    extension (lowercase, with the dot) and by a magic string in their
+    first MAGIC_SEARCH_SIZE bytes. With sizes, (size, path) tuples are
+    yielded instead of paths.
+    '''
+    dirs = [path]
+    while dirs:
+        top = dirs.pop()
+        try:
+            entries = scan_dir(top, sizes)
+            for entry_path, is_dir, is_file, size in entries:
+                if is_dir:
+                    dirs.append(entry_path)
+                elif not is_file:
+                    continue
+                elif extensions and os.path.splitext(entry_path)[1].lower() not in extensions:
+                    continue
+                elif magic and not has_magic(entry_path, magic):
+                    continue
+                elif sizes:
+                    yield size, entry_path
+                else:
+                    yield entry_path
+        except OSError as e:
+            write('Unable to list directory %s: %s\n' % (top, e))
+
+def process_rss(pid):
+    '''
+    Resident memory of a process in bytes, None where /proc is not available
+    '''
+    try:
+        with open('/proc/%d/statm' % pid) as fd:
+            return int(fd.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+def queue_size(qu):
+    '''
+    Approximate size of a multiprocessing queue, None where qsize is not
+    implemented (Mac OS X)
+    '''
+    try:
+        return qu.qsize()
+    except NotImplementedError:
+        return None
+
+def parse_address(address):
+    '''
+    (host, port) of a [host]:port string, the host defaults to all interfaces
+    '''
+    host, sep, port = address.rpartition(':')
+    return host, int(port)
+
+def pool_size(args):
+    '''
+    Returns the number of Hashers to start, the maximum and whether the
+    Supervisor scales them
+    '''
+    cpus = multiprocessing.cpu_count()
+    adaptive = args.workers == 'auto'
+    if adaptive:
+        # Start from half of the CPUs, the Supervisor scales from there
+        max_procs = max(1, args.max_workers or cpus)
+        num_procs = max(1, min(cpus / 2, max_procs))
+    else:
+        num_procs = max_procs = args.workers
+    return num_procs, max_procs, adaptive
+
+def run_node(args, num_procs, max_procs, adaptive):
+    '''
+    Worker node of the coordinator at args.connect: the jobs leased by a
+    Fetcher are analyzed by local Hashers, watched by a Supervisor, and
+    their results are sent back by a Returner.
+    '''
+    CoordinatorManager.register('coordinator')
+    manager = CoordinatorManager(address=parse_address(args.connect), authkey=args.authkey)
+    try:
+        manager.connect()
+    except (IOError, socket.error) as e:
+        print 'Unable to connect to the coordinator at %s: %s' % (args.connect, e)
+        sys.exit(1)
+    node = '%s-%d' % (socket.gethostname(), os.getpid())
+    jobs = multiprocessing.JoinableQueue()
+    results = ResultQueue()
+    counter = Counter(0, 'Hashed')
+    hit_counter = Counter(0, 'Cache hits')
+    miss_counter = Counter(0, 'Cache misses')
+    cache = None
+    if args.cache_dir:
+        if not os.path.isdir(args.cache_dir):
+            os.makedirs(args.cache_dir)
+        cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    pending = PendingJobs()
+    spool_dir = tempfile.mkdtemp(prefix='pdfrankenstein-')
+
+    def new_hasher(slot, pending_rows):
+        return Hasher(jobs, results, counter, None, cache, hit_counter, miss_counter, None, None, slot, args.recycle, pending_rows)
+
+    supervisor = Supervisor([num_procs], new_hasher, [jobs], results, counter, args.timeout, args.max_memory * 1024 * 1024, adaptive, 1, max_procs)
+    # Enough leased jobs to keep every Hasher busy
+    fetcher = Fetcher(manager, jobs, node, pending, 2 * max_procs, spool_dir)
+    returner = Returner(manager, results, node, pending)
+    write('Node %s: %d processes%s analyzing samples of %s\n' % (node, num_procs, ' (adaptive, up to %d)' % max_procs if adaptive else '', args.connect))
+    fetcher.start()
+    returner.start()
+    supervisor.start()
+    supervisor.watch(fetcher)
+    fetcher.join()
+    jobs.join()
+    results.put(None)
+    returner.join()
+    shutil.rmtree(spool_dir, ignore_errors=True)
+    write('Node %s: %d samples analyzed\n' % (node, counter.value()))
+    if cache:
+        write('Node %s: %d cache hits, %d misses\n' % (node, hit_counter.value(), miss_counter.value()))
+
 def write(msg):
     with LOCK:
         sys.stdout.write(msg)
@@ -492,47 +1861,134 @@ def write(msg):
 if __name__ == '__main__':
     pdfs = []
     args = ParserFactory().new_parser().parse()
-    num_procs = multiprocessing.cpu_count()/2 - 1
-    #num_procs = multiprocessing.cpu_count() - 2
+    num_procs, max_procs, adaptive = pool_size(args)
+    if (args.serve or args.connect) and not args.authkey:
+        print 'An --authkey shared by the coordinator and the worker nodes is required'
+        sys.exit(1)
+    if args.connect:
+        run_node(args, num_procs, max_procs, adaptive)
+        sys.exit(0)
+    if not args.pdf_in:
+        print 'One PDF file or directory path required'
+        sys.exit(1)
+    if args.serve and (args.out == 'shards' or args.schedule == 'buckets'):
+        print 'Shards and size buckets are not available in distributed mode'
+        sys.exit(1)
     mgr = multiprocessing.Manager()
 
+    job_validator = FileValidator()
+    schedule = args.schedule
     if os.path.isdir(args.pdf_in):
-        dir_name = os.path.join(args.pdf_in, '*')
-        pdfs = glob.glob(dir_name)
-        print num_procs, 'processes analyzing', len(pdfs), 'samples in directory:', dir_name
+        extensions = None
+        if args.ext:
+            extensions = [ '.' + ext.strip().lstrip('.').lower() for ext in args.ext.split(',') if ext.strip() ]
+        pdfs = walk_samples(args.pdf_in, extensions, PDF_MAGIC if args.magic else None, schedule != 'walk')
+        # The walk already knows which entries are files
+        job_validator = None
+        if args.serve:
+            print 'Worker nodes analyzing samples in directory:', args.pdf_in
+        else:
+            print num_procs, 'processes%s analyzing samples in directory:' % (' (adaptive, up to %d)' % max_procs if adaptive else ''), args.pdf_in
     elif os.path.exists(args.pdf_in):
         pdfs.append(args.pdf_in)
+        # A single sample doesn't need more than one Hasher
+        num_procs = max_procs = 1
+        adaptive = False
+        schedule = 'walk'
         print num_procs, 'processes analyzing file:', args.pdf_in
     else:
         print 'Unable to find PDF file/directory:', args.pdf_in
         sys.exit(1)
-    if not len(pdfs) > 0:
-        print 'Empty sample set'
-        sys.exit(0)
 
     io_lock = multiprocessing.Lock()
-    jobs = multiprocessing.JoinableQueue()
-    results = multiprocessing.JoinableQueue()
+    # Bounded, so the walk waits for the Hashers instead of queueing the whole corpus
+    jobs = multiprocessing.JoinableQueue(JOB_QUEUE_SIZE)
+    queues = [jobs]
+    bucket_procs = [num_procs]
+    if schedule == 'buckets':
+        queues.append(multiprocessing.JoinableQueue(JOB_QUEUE_SIZE))
+        large_procs = max(1, args.large_workers or num_procs / 4)
+        bucket_procs = [max(1, num_procs - large_procs), large_procs]
+        # Only the Hashers of the small samples are scaled
+        max_procs = max(1, max_procs - large_procs)
+        write('%d of the processes analyzing samples of %d MB or more\n' % (large_procs, args.large_size))
+    # Bounded, so a slow Stasher holds back the Hashers instead of the results piling up
+    results = ResultQueue(RESULT_QUEUE_SIZE)
     msgs = multiprocessing.JoinableQueue()
-    job_validator = FileValidator()
-    job_counter = Counter(len(pdfs), 'Hashed')
-    result_counter = Counter(len(pdfs), 'Stored')
+    job_counter = Counter(0, 'Hashed')
+    result_counter = Counter(0, 'Stored')
     counters = [job_counter, result_counter]
-
-    hashers = [ Hasher(jobs, results, job_counter, args.out) for cnt in range(num_procs) ]
-    stasher = Stasher(results, args.out, result_counter)
-    jobber = Jobber(pdfs, jobs, job_validator, counters, num_procs)
-    progress = ProgressBar(counters, LOCK, msgs)
+    stats = []
+
+    cache = None
+    hit_counter = None
+    miss_counter = None
+    if args.cache_dir:
+        if not os.path.isdir(args.cache_dir):
+            os.makedirs(args.cache_dir)
+        cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        hit_counter = Counter(0, 'Cache hits')
+        miss_counter = Counter(0, 'Cache misses')
+        stats = [hit_counter, miss_counter]
+
+    sharded = args.out == 'shards'
+    resume = None
+    if args.resume:
+        resume = ResumeIndex(args.out)
+    spool = None
+    if not sharded and not args.serve and args.spool_dir != 'none':
+        spool = Spool(args.spool_dir)
+    if sharded:
+        stasher = None
+    else:
+        stasher = Stasher(results, args.out, result_counter, resume, spool)
+
+    def new_hasher(slot, pending):
+        if sharded:
+            return Hasher(queues[slot.bucket], results, job_counter, args.out, cache, hit_counter, miss_counter, slot.index, result_counter, slot, args.recycle, pending)
+        return Hasher(queues[slot.bucket], results, job_counter, args.out, cache, hit_counter, miss_counter, None, None, slot, args.recycle, pending, spool)
+
+    supervisor = Supervisor(bucket_procs, new_hasher, queues, results, job_counter, args.timeout, args.max_memory * 1024 * 1024, adaptive, 1, max_procs)
+    coordinator = None
+    if args.serve:
+        # The Hashers run on the worker nodes
+        coordinator = Coordinator(jobs, results, job_counter, args.lease_time, LEASE_ATTEMPTS, args.blobs)
+        CoordinatorManager.register('coordinator', callable=lambda: coordinator)
+        server = CoordinatorManager(address=parse_address(args.serve), authkey=args.authkey).get_server()
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        write('Coordinator listening on %s:%d\n' % server.address)
+    jobber = Jobber(pdfs, queues, job_validator, counters, resume, schedule, args.large_size * 1024 * 1024)
+    progress = ProgressBar(counters, LOCK, msgs, stats)
 
     write("Starting processes...\n")
     jobber.start()
-    stasher.start()
-    for hasher in hashers:
-        hasher.start()
+    if stasher:
+        stasher.start()
+    if not coordinator:
+        supervisor.start()
     progress.start()
 
-    jobs.join()
-    results.join()
-
-    time.sleep(1)
-    results.put(None)
+    if coordinator:
+        jobber.join()
+        jobs.put(None)
+        coordinator.wait()
+    else:
+        # Every Hasher exits on its kill msg, queued once the Jobber is done
+        supervisor.watch(jobber)
+        jobber.join()
+    for qu in queues:
+        qu.join()
+    if sharded:
+        progress.join()
+        merged, count = ShardStorage.merge()
+        write('Merged %d shards. %d rows in %s\n' % (merged, count, DbStorage.table))
+        if resume is not None:
+            resume.update()
+    # The Hashers are gone, so every result was written before the kill msg
+    if stasher:
+        results.put(None)
+        stasher.join()
+    if spool:
+        spool.remove()
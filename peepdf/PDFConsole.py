@@ -2914,7 +2914,8 @@ class PDFConsole(cmd.Cmd):
     
     def help_references(self):
         print newLine + 'Usage: references to|in $object_id [$version]'
-        print newLine + 'Shows the references in the object or to the object in the specified version of the document' + newLine
+        print newLine + 'Shows the references in the object or to the object in the specified version of the document'
+        print newLine + 'Note: references written inside strings, like "(see 1 0 R)", are not shown' + newLine
 
     def do_replace(self, argv):
         replaceOutput = ''
@@ -25,11 +25,11 @@
     This module contains classes and methods to analyse and modify PDF files
 '''
 
-import sys,os,re,hashlib,struct,aes as AES
+import sys,os,re,hashlib,struct,mmap,array,bisect,aes as AES
 from PDFUtils import *
 from PDFCrypto import *
 from JSAnalysis import *
-from PDFFilters import decodeStream,encodeStream
+from PDFFilters import decodeStream,encodeStream,flateDecodePrefix
 
 MAL_ALL = 1
 MAL_HEAD = 2
@@ -41,6 +41,9 @@ pdfFile = None
 newLine = os.linesep
 isForceMode = False
 isManualAnalysis = False
+isLazyMode = False
+maxDecodedSize = None
+maxDecompressionRatio = None
 spacesChars = ['\x00','\x09','\x0a','\x0c','\x0d','\x20']
 delimiterChars = ['<<','(','<','[','{','/','%']
 monitorizedEvents = ['/OpenAction ','/AA ','/Names ','/AcroForm ']
@@ -51,29 +54,158 @@ singUniqueName = 'CoolType.SING.uniqueName'
 bmpVuln = 'BMP/RLE heap corruption'
 vulnsDict = {'mailto':['CVE-2007-5020'],'Collab.collectEmailInfo':['CVE-2007-5659'],'util.printf':['CVE-2008-2992'],'/JBIG2Decode':['CVE-2009-0658'],'getIcon':['CVE-2009-0927'],'getAnnots':['CVE-2009-1492'],'spell.customDictionaryOpen':['CVE-2009-1493'],'media.newPlayer':['CVE-2009-4324'],'.rawValue':['CVE-2010-0188'],singUniqueName:['CVE-2010-2883'],'doc.printSeps':['CVE-2010-4091'],'/U3D':['CVE-2009-3953','CVE-2009-3959','CVE-2011-2462'],'/PRC':['CVE-2011-4369'],bmpVuln:['CVE-2013-2729'],'app.removeToolButton':['CVE-2013-3346']}
 jsContexts = {'global':None}
+lazyStreamSubtypes = ['/Image','/Type1C','/CIDFontType0C','/OpenType']
+defaultMaxNestingDepth = 100
 
-class PDFObject :
+class PDFKeywordScanner :
+    '''
+        Finds the first occurrence of every keyword of a list in a single pass over a string
+    '''
+    maxMatches = 32
+
+    def __init__(self, keywords) :
+        self.keywords = []
+        for keyword in keywords:
+            if keyword not in self.keywords:
+                self.keywords.append(keyword)
+        # Keywords matching at the same position as a longer one are prefixes of it
+        self.prefixes = {}
+        for keyword in self.keywords:
+            self.prefixes[keyword] = [prefix for prefix in self.keywords if keyword.startswith(prefix)]
+        # The keywords are factored in a trie, so only one alternative is tried for each character
+        trie = {}
+        for keyword in self.keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        self.regexp = re.compile(self.trieToRegexp(trie))
+
+    def trieToRegexp(self, node) :
+        '''
+            Returns a regexp matching the longest keyword of the trie at a position
+        '''
+        alternatives = []
+        for char in sorted(node.keys()):
+            if char != '':
+                alternatives.append(re.escape(char) + self.trieToRegexp(node[char]))
+        if alternatives == []:
+            return ''
+        if len(alternatives) == 1 and not node.has_key(''):
+            return alternatives[0]
+        regexp = '(?:' + '|'.join(alternatives) + ')'
+        if node.has_key(''):
+            # The keyword ending here is a prefix of the longer ones, tried after them
+            regexp += '?'
+        return regexp
+
+    def scan(self, string) :
+        '''
+            Scans the string for all the keywords
+            
+            @param string: The string to scan
+            @return: A dictionary with the index of the first occurrence of the keywords found in the string
+        '''
+        found = {}
+        if self.keywords == []:
+            return found
+        search = self.regexp.search
+        index = 0
+        matches = 0
+        while len(found) < len(self.keywords):
+            match = search(string, index)
+            if match == None:
+                break
+            index = match.start()
+            for keyword in self.prefixes[match.group()]:
+                if not found.has_key(keyword):
+                    found[keyword] = index
+            index += 1
+            matches += 1
+            if matches == self.maxMatches:
+                # Many repeated keywords, the missing ones can only be after the current index
+                for keyword in self.keywords:
+                    if not found.has_key(keyword):
+                        position = string.find(keyword, index)
+                        if position != -1:
+                            found[keyword] = position
+                break
+        return found
+
+indicatorsScanner = PDFKeywordScanner(monitorizedEvents + monitorizedActions + monitorizedElements)
+jsVulnsScanner = PDFKeywordScanner(jsVulns)
+
+def addMonitorizedKeywords(events = [], actions = [], elements = [], vulns = []) :
+    '''
+        Adds keywords to the lists of suspicious events, actions, elements and Javascript vulnerabilities
+        
+        @param events: A list of events, found anywhere in the object
+        @param actions: A list of actions, followed by a delimiter or a space
+        @param elements: A list of elements, followed by a delimiter or a space
+        @param vulns: A list of keywords searched in the Javascript code
+    '''
+    global indicatorsScanner, jsVulnsScanner
+    for keywords, newKeywords in [(monitorizedEvents, events), (monitorizedActions, actions), (monitorizedElements, elements), (jsVulns, vulns)]:
+        for keyword in newKeywords:
+            if keyword not in keywords:
+                keywords.append(keyword)
+    indicatorsScanner = PDFKeywordScanner(monitorizedEvents + monitorizedActions + monitorizedElements)
+    jsVulnsScanner = PDFKeywordScanner(jsVulns)
+
+class PDFEmptyList (list) :
+    '''
+        Empty list shared by the objects without errors, references or Javascript code.
+        It can not be modified in place, adding elements with += returns a new list.
+    '''
+    __slots__ = ()
+
+    def __iadd__(self, other) :
+        if len(other) == 0:
+            return self
+        return list(other)
+
+    def readOnly(self, *args) :
+        raise TypeError('The shared empty list can not be modified')
+
+    append = extend = insert = remove = pop = sort = reverse = __setitem__ = __delitem__ = __setslice__ = __delslice__ = __imul__ = readOnly
+
+class PDFEmptyDict (dict) :
+    '''
+        Empty dictionary shared by the objects without references in their elements
+    '''
+    __slots__ = ()
+
+    def readOnly(self, *args) :
+        raise TypeError('The shared empty dictionary can not be modified')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = readOnly
+
+emptyList = PDFEmptyList()
+emptyDict = PDFEmptyDict()
+
+class PDFObject (object) :
     '''
         Base class for all the PDF objects
     '''
+    __slots__ = ('references','type','value','rawValue','JSCode','updateNeeded','containsJScode','encryptedValue','encryptionKey','encrypted','errors','referencesInElements','compressedIn','unescapedBytes','urlsFound')
     def __init__(self, raw = None):
         '''
             Constructor of a PDFObject
             
             @param raw: The raw value of the PDF object
         '''
-        self.references = []
+        self.references = emptyList
         self.type = ''
         self.value = ''
         self.rawValue = raw
-        self.JSCode = []
+        self.JSCode = emptyList
         self.updateNeeded = False
         self.containsJScode = False
         self.encryptedValue = raw
         self.encryptionKey = ''
         self.encrypted = False
-        self.errors = []
-        self.referencesInElements = {}
+        self.errors = emptyList
+        self.referencesInElements = emptyDict
         self.compressedIn = None
     
     def addError(self, errorMessage):
@@ -83,7 +215,7 @@ class PDFObject :
             @param errorMessage: The error message to be added (string)
         '''
         if errorMessage not in self.errors:
-            self.errors.append(errorMessage)
+            self.errors += [errorMessage]
             
     def contains(self, string):
         '''
@@ -360,15 +492,16 @@ class PDFBool (PDFObject) :
     '''
         Boolean object of a PDF document
     '''
+    __slots__ = ()
     def __init__(self, value) :
         self.type = 'bool'
-        self.errors = []
-        self.references = []
-        self.JSCode = []
+        self.errors = emptyList
+        self.references = emptyList
+        self.JSCode = emptyList
         self.encrypted = False
         self.updateNeeded = False
         self.containsJScode = False
-        self.referencesInElements = {}
+        self.referencesInElements = emptyDict
         self.value = self.rawValue = self.encryptedValue = value
         self.compressedIn = None
 
@@ -377,34 +510,36 @@ class PDFNull (PDFObject) :
     '''
         Null object of a PDF document
     '''
+    __slots__ = ()
     def __init__(self, content) :
         self.type = 'null'
-        self.errors = []
-        self.JSCode = []
+        self.errors = emptyList
+        self.JSCode = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.value = self.rawValue = self.encryptedValue = content
         self.updateNeeded = False
         self.containsJScode = False
-        self.referencesInElements = {}
-        self.references = []
+        self.referencesInElements = emptyDict
+        self.references = emptyList
 
 
 class PDFNum (PDFObject) :
     '''
         Number object of a PDF document: can be an integer or a real number.
     '''
+    __slots__ = ()
     def __init__(self, num) :
-        self.errors = []
-        self.JSCode = []
+        self.errors = emptyList
+        self.JSCode = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.value = num
         self.compressedIn = None
         self.updateNeeded = False
         self.containsJScode = False
-        self.referencesInElements = {}
-        self.references = []
+        self.referencesInElements = emptyDict
+        self.references = emptyList
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
@@ -420,7 +555,7 @@ class PDFNum (PDFObject) :
         return ret
         
     def update(self):
-        self.errors = []
+        self.errors = emptyList
         try:
             if self.value.find('.') != -1:
                 self.type = 'real'
@@ -451,11 +586,12 @@ class PDFName (PDFObject) :
     '''
         Name object of a PDF document
     '''
+    __slots__ = ()
     def __init__(self, name) :
         self.type = 'name'
-        self.errors = []
-        self.JSCode = []
-        self.references = []
+        self.errors = emptyList
+        self.JSCode = emptyList
+        self.references = emptyList
         self.compressedIn = None
         if name[0] == '/':
             self.rawValue = self.value = self.encryptedValue = name
@@ -465,7 +601,7 @@ class PDFName (PDFObject) :
         self.containsJScode = False
         self.encryptedValue = ''
         self.encrypted = False
-        self.referencesInElements = {}
+        self.referencesInElements = emptyDict
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
@@ -474,7 +610,7 @@ class PDFName (PDFObject) :
                 raise Exception(ret[1])
 
     def update(self):
-        self.errors = []
+        self.errors = emptyList
         errorMessage = ''
         self.value = self.rawValue
         self.encryptedValue = self.rawValue
@@ -502,19 +638,20 @@ class PDFString (PDFObject) :
     '''
         String object of a PDF document
     '''
+    __slots__ = ()
     def __init__(self, string) :
         self.type = 'string'
-        self.errors = []
+        self.errors = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.value = self.rawValue = self.encryptedValue = string
         self.updateNeeded = False
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
-        self.references = []
-        self.referencesInElements = {}
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
+        self.references = emptyList
+        self.referencesInElements = emptyDict
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
@@ -529,11 +666,11 @@ class PDFString (PDFObject) :
             @param decrypt: A boolean indicating if a decryption has been performed. By default: False.
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
-        self.errors = []
+        self.errors = emptyList
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
         self.rawValue = unescapeString(self.rawValue)
         self.value = self.rawValue
         '''
@@ -653,10 +790,11 @@ class PDFHexString (PDFObject) :
     '''
         Hexadecimal string object of a PDF document
     '''
+    __slots__ = ('asciiValue',)
     def __init__(self, hex) : 
         self.asciiValue = ''
         self.type = 'hexstring'
-        self.errors = []
+        self.errors = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.value = ''
@@ -664,11 +802,11 @@ class PDFHexString (PDFObject) :
         self.encryptedValue = hex
         self.updateNeeded = False
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
-        self.referencesInElements = {}
-        self.references = []
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
+        self.referencesInElements = emptyDict
+        self.references = emptyList
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
@@ -683,12 +821,12 @@ class PDFHexString (PDFObject) :
             @param decrypt: A boolean indicating if a decryption has been performed. By default: False.
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
-        self.errors = []
+        self.errors = emptyList
         self.value = ''
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
         tmpValue = self.rawValue
         if len(tmpValue) % 2 != 0:
             tmpValue += '0'
@@ -791,10 +929,11 @@ class PDFReference (PDFObject) :
     '''
         Reference object of a PDF document
     '''
+    __slots__ = ('id','genNumber')
     def __init__(self, id, genNumber = '0') :
         self.type = 'reference'
-        self.errors = []
-        self.JSCode = []
+        self.errors = emptyList
+        self.JSCode = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.value = self.rawValue = self.encryptedValue = id + ' ' + genNumber + ' R'
@@ -802,8 +941,8 @@ class PDFReference (PDFObject) :
         self.genNumber = genNumber
         self.updateNeeded = False
         self.containsJScode = False
-        self.referencesInElements = {}
-        self.references = []
+        self.referencesInElements = emptyDict
+        self.references = emptyList
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
@@ -812,7 +951,7 @@ class PDFReference (PDFObject) :
                 raise Exception(ret[1])
         
     def update(self):
-        self.errors = []
+        self.errors = emptyList
         self.value = self.encryptedValue = self.rawValue
         valueElements = self.rawValue.split()
         if valueElements != []:
@@ -861,20 +1000,18 @@ class PDFArray (PDFObject) :
     '''
         Array object of a PDF document
     '''
+    __slots__ = ('elements',)
     def __init__(self, rawContent = '', elements = []) :
         self.type = 'array'
-        self.errors = []
-        self.JSCode = []
+        self.errors = emptyList
+        self.JSCode = emptyList
         self.compressedIn = None
         self.encrypted = False
-        self.encryptedValue = rawContent
-        self.rawValue = rawContent
         self.elements = elements
-        self.value = ''
         self.updateNeeded = False
         self.containsJScode = False
-        self.referencesInElements = {}
-        self.references = []
+        self.referencesInElements = emptyDict
+        self.references = emptyList
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
@@ -882,6 +1019,37 @@ class PDFArray (PDFObject) :
             else:
                 raise Exception(ret[1])
 
+    def __getattr__(self, name):
+        '''
+            Builds the value, raw value or encrypted value of the array the first time it is accessed after a modification
+        '''
+        if name in ('value', 'rawValue', 'encryptedValue'):
+            values = ['[ ']
+            for element in self.elements:
+                if element != None:
+                    if name == 'value':
+                        values.append(element.getValue() + ' ')
+                    elif name == 'rawValue':
+                        values.append(str(element.getRawValue()) + ' ')
+                    else:
+                        values.append(str(element.getEncryptedValue()) + ' ')
+            values[-1] = values[-1][:-1]
+            values.append(' ]')
+            value = ''.join(values)
+            setattr(self, name, value)
+            return value
+        raise AttributeError(name)
+
+    def deferValues(self):
+        '''
+            Discards the value, raw value and encrypted value of the array, they will be built again when accessed
+        '''
+        for name in ('value', 'rawValue', 'encryptedValue'):
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+
     def update(self, decrypt = False):
         '''
             Updates the object after some modification has occurred
@@ -890,20 +1058,18 @@ class PDFArray (PDFObject) :
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
         errorMessage = ''
-        self.errors = []
-        self.encryptedValue = '[ '
-        self.rawValue = '[ '
-        self.value = '[ '
-        self.references = []
+        self.errors = emptyList
+        self.deferValues()
+        self.references = emptyList
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
         for element in self.elements:
             if element != None:
                 type = element.getType()
                 if type == 'reference':
-                    self.references.append(element.getValue())
+                    self.references += [element.getValue()]
                 elif type == 'dictionary' or type == 'array':
                     self.references += element.getReferences()
                 if element.containsJS():
@@ -919,15 +1085,9 @@ class PDFArray (PDFObject) :
                     if ret[0] == -1:
                         errorMessage = 'Error encrypting element'
                         self.addError(errorMessage)
-                self.encryptedValue += str(element.getEncryptedValue()) + ' '
-                self.rawValue += str(element.getRawValue()) + ' '
-                self.value += element.getValue() + ' '
             else:
                 errorMessage = 'None elements'
                 self.addError(errorMessage)
-        self.encryptedValue = self.encryptedValue[:-1] + ' ]'
-        self.rawValue = self.rawValue[:-1] + ' ]'
-        self.value = self.value[:-1] + ' ]'
         if errorMessage != '':
             return (-1,'Errors while updating PDFArray')
         else:
@@ -1124,32 +1284,68 @@ class PDFArray (PDFObject) :
 
 
 class PDFDictionary (PDFObject):
+    __slots__ = ('elements','dictType','numElements','rawNames')
+
     def __init__(self, rawContent = '', elements = {}, rawNames = {}) :
         self.type = 'dictionary'
         self.dictType = ''
-        self.errors = []
+        self.errors = emptyList
         self.compressedIn = None
         self.encrypted = False
-        self.value = ''
         self.updateNeeded = False
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
-        self.referencesInElements = {}
-        self.rawValue = rawContent
-        self.encryptedValue = rawContent
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
+        self.referencesInElements = emptyDict
         self.rawNames = rawNames
         self.elements = elements
         self.numElements = len(self.elements)
-        self.references = []
+        self.references = emptyList
         ret = self.update()
         if ret[0] == -1:
             if isForceMode:
                 self.addError(ret[1])
             else:
                 raise Exception(ret[1])
-    
+
+    def __getattr__(self, name):
+        '''
+            Builds the value, raw value or encrypted value of the dictionary the first time it is accessed after a modification
+        '''
+        if name in ('value', 'rawValue', 'encryptedValue'):
+            values = ['<< ']
+            for key, valueObject in self.elements.items():
+                if valueObject == None:
+                    valueObject = PDFString('')
+                if name == 'value':
+                    values.append(key + ' ' + valueObject.getValue() + newLine)
+                    continue
+                if self.rawNames.has_key(key):
+                    rawName = self.rawNames[key].getRawValue()
+                else:
+                    rawName = key
+                if name == 'rawValue':
+                    values.append(rawName + ' ' + str(valueObject.getRawValue()) + newLine)
+                else:
+                    values.append(rawName + ' ' + str(valueObject.getEncryptedValue()) + newLine)
+            values[-1] = values[-1][:-1]
+            values.append(' >>')
+            value = ''.join(values)
+            setattr(self, name, value)
+            return value
+        raise AttributeError(name)
+
+    def deferValues(self):
+        '''
+            Discards the value, raw value and encrypted value of the dictionary, they will be built again when accessed
+        '''
+        for name in ('value', 'rawValue', 'encryptedValue'):
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+
     def update(self, decrypt = False):
         '''
             Updates the object after some modification has occurred
@@ -1157,17 +1353,15 @@ class PDFDictionary (PDFObject):
             @param decrypt: A boolean indicating if a decryption has been performed. By default: False.
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
-        self.errors = []
-        self.references = []
+        self.errors = emptyList
+        self.references = emptyList
         self.containsJScode = False
-        self.JSCode = []
+        self.JSCode = emptyList
         self.dictType = ''
-        self.unescapedBytes = []
-        self.urlsFound = []
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
         errorMessage = ''
-        self.value = '<< '
-        self.rawValue = '<< '
-        self.encryptedValue = '<< '
+        self.deferValues()
         keys = self.elements.keys()
         values = self.elements.values()
         for i in range(len(keys)):
@@ -1190,7 +1384,7 @@ class PDFDictionary (PDFObject):
                 else:
                     self.dictType += ' ' + v
             if type == 'reference':
-                self.references.append(v)
+                self.references += [v]
             elif type == 'dictionary' or type == 'array':
                 self.references += valueObject.getReferences()
             if valueObject.containsJS():
@@ -1201,23 +1395,13 @@ class PDFDictionary (PDFObject):
             if valueObject.isFaulty():
                 for error in valueObject.getErrors():
                     self.addError('Children element contains errors: ' + error)
-            if self.rawNames.has_key(keys[i]):
-                rawName = self.rawNames[keys[i]]
-                rawValue = rawName.getRawValue()
-            else:
-                rawValue = keys[i]
+            if not self.rawNames.has_key(keys[i]):
                 self.rawNames[keys[i]] = PDFName(keys[i][1:])
             if type in ['string','hexstring','array','dictionary'] and self.encrypted and not decrypt:
                 ret = valueObject.encrypt(self.encryptionKey)
                 if ret[0] == -1:
                     errorMessage = 'Error encrypting element'
                     self.addError(errorMessage)
-            self.encryptedValue += rawValue + ' ' + str(valueObject.getEncryptedValue()) + newLine
-            self.rawValue += rawValue + ' ' + str(valueObject.getRawValue()) + newLine
-            self.value += keys[i] + ' ' + v + newLine
-        self.encryptedValue = self.encryptedValue[:-1] + ' >>'
-        self.rawValue = self.rawValue[:-1] + ' >>'
-        self.value = self.value[:-1] + ' >>'
         if errorMessage != '':
             return (-1,errorMessage)
         return (0,'')
@@ -1262,6 +1446,7 @@ class PDFDictionary (PDFObject):
             if update:
                 ret = self.update()
                 return ret
+            self.deferValues()
             return (0,'')
         else:
             return (-1,'Element not found')
@@ -1470,6 +1655,7 @@ class PDFDictionary (PDFObject):
         if update:
             ret = self.update()
             return ret
+        self.deferValues()
         return (0,'')
 
     def setElements(self, newElements):
@@ -1506,20 +1692,20 @@ class PDFStream (PDFDictionary) :
     '''
         Stream object of a PDF document
     '''
+    __slots__ = ('decodedStream','decodingError','decodingStats','deletedFilters','encodedStream','encryptedStream','file','filter','filterParams','isEncodedStream','modifiedRawStream','modifiedStream','newFilters','rawStream','recoveredStream','size','uncheckedContent','xrefStream')
     def __init__(self, rawDict = '', rawStream = '', elements = {}, rawNames = {}) :
         global isForceMode
         self.type = 'stream'
         self.dictType = ''
-        self.errors = []
+        self.errors = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.decodedStream = ''
         self.encodedStream = ''
-        self.encryptedValue = rawDict
-        self.rawValue = rawDict
+        self.recoveredStream = ''
+        self.decodingStats = {'encodedBytes':0, 'decodedBytes':0, 'limitExceeded':False}
         self.rawNames = rawNames
         self.elements = elements
-        self.value = ''
         self.updateNeeded = False
         self.containsJScode = False
         self.rawStream = rawStream
@@ -1529,17 +1715,18 @@ class PDFStream (PDFDictionary) :
         self.deletedFilters = False
         self.modifiedStream = False
         self.modifiedRawStream = True
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
         self.referencesInElements = {}
-        self.references = []
+        self.references = emptyList
         self.size = 0
         self.filter = None
         self.filterParams = None
         self.file = None
         self.isEncodedStream = False
         self.decodingError = False
+        self.uncheckedContent = False
         if elements == {}:
             errorMessage = 'No dictionary in stream object'
             if isForceMode:
@@ -1553,6 +1740,16 @@ class PDFStream (PDFDictionary) :
             else:
                 raise Exception(ret[1])
 
+    def __getattr__(self, name):
+        '''
+            Decodes the stream the first time decodedStream is accessed if its decoding was deferred (lazy mode), and builds the values of the stream dictionary like PDFDictionary
+        '''
+        if name == 'decodedStream':
+            self.decodedStream = ''
+            self.decode()
+            return self.decodedStream
+        return PDFDictionary.__getattr__(self, name)
+
     def update(self, onlyElements = False, decrypt = False, algorithm = 'RC4'):
         '''
             Updates the object after some modification has occurred
@@ -1561,17 +1758,15 @@ class PDFStream (PDFDictionary) :
             @param decrypt: A boolean indicating if a decryption has been performed. By default: False.
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
-        self.value = '<< '
-        self.rawValue = '<< '
-        self.encryptedValue = '<< '
+        self.deferValues()
         keys = self.elements.keys()
         values = self.elements.values()
         if not onlyElements:
-            self.references = []
-            self.errors = []
-            self.JSCode = []
-            self.unescapedBytes = []
-            self.urlsFound = []
+            self.references = emptyList
+            self.errors = emptyList
+            self.JSCode = emptyList
+            self.unescapedBytes = emptyList
+            self.urlsFound = emptyList
             self.containsJScode = False
             self.decodingError = False
             
@@ -1657,7 +1852,7 @@ class PDFStream (PDFDictionary) :
             type = valueElement.getType()
             if type == 'reference':
                 if v not in self.references: 
-                    self.references.append(v)
+                    self.references += [v]
             elif type == 'dictionary' or type == 'array':
                 self.references = list(set(self.references + valueElement.getReferences()))
             if valueElement.containsJS():
@@ -1668,23 +1863,13 @@ class PDFStream (PDFDictionary) :
             if valueElement.isFaulty():
                 for error in valueObject.getErrors():
                     self.addError('Children element contains errors: ' + error)
-            if self.rawNames.has_key(keys[i]):
-                rawName = self.rawNames[keys[i]]
-                rawValue = rawName.getRawValue()
-            else:
-                rawValue = keys[i]
+            if not self.rawNames.has_key(keys[i]):
                 self.rawNames[keys[i]] = PDFName(keys[i][1:])
             if type in ['string','hexstring','array','dictionary'] and self.encrypted and not decrypt:
                 ret = valueElement.encrypt(self.encryptionKey)
                 if ret[0] == -1:
                     errorMessage = ret[1]+' in child element'
                     self.addError(errorMessage)
-            self.encryptedValue += rawValue + ' ' + str(valueElement.getEncryptedValue()) + newLine
-            self.rawValue += rawValue + ' ' + str(valueElement.getRawValue()) + newLine
-            self.value += keys[i] + ' ' + v + newLine
-        self.encryptedValue = self.encryptedValue[:-1] + ' >>'
-        self.rawValue = self.rawValue[:-1] + ' >>'
-        self.value = self.value[:-1] + ' >>'
         
         if not onlyElements:
             # Stream
@@ -1814,9 +1999,13 @@ class PDFStream (PDFDictionary) :
                                         return (-1,errorMessage)
                         else:
                             if self.isEncodedStream:
-                                self.decode()
+                                if isLazyMode and self.isDeferrable():
+                                    self.deferDecoding()
+                                    self.uncheckedContent = True
+                                else:
+                                    self.decode()
                         self.size = len(self.rawStream)
-                        if not self.isFaultyDecoding():
+                        if not self.isFaultyDecoding() and not self.isDecodingDeferred():
                             refs = re.findall('(\d{1,5}\s{1,3}\d{1,5}\s{1,3}R)', self.decodedStream)
                             if refs != []:
                                 self.references += refs
@@ -1926,6 +2115,38 @@ class PDFStream (PDFDictionary) :
         else:
             return (0,'')
 
+    def checkDeferredContent(self):
+        '''
+            Checks the content of a stream whose decoding was deferred (lazy mode) looking for references and Javascript code, as it is done while parsing the stream in normal mode. The stream is decoded and, if there are no decoding errors, its decoded content is dropped again.
+            
+            @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
+        '''
+        if not self.uncheckedContent:
+            return (0,'')
+        self.uncheckedContent = False
+        errorMessage = ''
+        deferred = self.isDecodingDeferred()
+        if deferred:
+            self.decodedStream = ''
+            ret = self.decode()
+            if ret[0] == -1:
+                errorMessage = ret[1]
+        if not self.isFaultyDecoding():
+            refs = re.findall('(\d{1,5}\s{1,3}\d{1,5}\s{1,3}R)', self.decodedStream)
+            if refs != []:
+                self.references = list(set(self.references + refs))
+            if isJavascript(self.decodedStream):
+                self.containsJScode = True
+                self.JSCode, self.unescapedBytes, self.urlsFound, jsErrors, jsContexts['global'] = analyseJS(self.decodedStream, jsContexts['global'], isManualAnalysis)
+                for jsError in jsErrors:
+                    errorMessage = 'Error analysing Javascript: '+jsError
+                    self.addError(errorMessage)
+            if deferred:
+                self.deferDecoding()
+        if errorMessage != '':
+            return (-1,errorMessage)
+        return (0,'')
+
     def cleanStream(self):
         '''
             Cleans the start and end of the stream
@@ -1996,6 +2217,7 @@ class PDFStream (PDFDictionary) :
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
         errorMessage = ''
+        self.decodingStats = {'encodedBytes':0, 'decodedBytes':0, 'limitExceeded':False}
         if len(self.rawStream) > 0:
             if self.isEncodedStream:
                 if self.filter == None:
@@ -2007,16 +2229,16 @@ class PDFStream (PDFDictionary) :
                     filterParamsType = self.filterParams.getType()
                 if filterType == 'name':
                     if self.filterParams == None:
-                        ret = decodeStream(self.encodedStream, self.filter.getValue(), self.filterParams)
+                        ret = self.decodeData(self.encodedStream, self.filter.getValue(), self.filterParams)
                         if ret[0] == -1:
                             if self.rawStream != self.encodedStream:
-                                ret = decodeStream(self.rawStream, self.filter.getValue(), self.filterParams)
+                                ret = self.decodeData(self.rawStream, self.filter.getValue(), self.filterParams)
                             if ret[0] == -1:
                                 self.decodingError = True
                                 errorMessage = 'Decoding error: '+ret[1]
                                 if isForceMode:
                                     self.addError(errorMessage)
-                                    self.decodedStream = ''
+                                    self.decodedStream = self.recoveredStream
                                 else:
                                     return (-1,errorMessage)
                             else:
@@ -2024,16 +2246,16 @@ class PDFStream (PDFDictionary) :
                         else:
                             self.decodedStream = ret[1]
                     elif filterParamsType == 'dictionary':
-                        ret = decodeStream(self.encodedStream, self.filter.getValue(), self.filterParams.getElements())            
+                        ret = self.decodeData(self.encodedStream, self.filter.getValue(), self.filterParams.getElements())            
                         if ret[0] == -1:
                             if self.rawStream != self.encodedStream:
-                                ret = decodeStream(self.rawStream, self.filter.getValue(), self.filterParams.getElements())
+                                ret = self.decodeData(self.rawStream, self.filter.getValue(), self.filterParams.getElements())
                             if ret[0] == -1:
                                 self.decodingError = True
                                 errorMessage = 'Decoding error: '+ret[1]
                                 if isForceMode:
                                     self.addError(errorMessage)
-                                    self.decodedStream = ''
+                                    self.decodedStream = self.recoveredStream
                                 else:
                                     return (-1,errorMessage)
                             else:
@@ -2060,16 +2282,16 @@ class PDFStream (PDFDictionary) :
                             return (-1,'Bad /Filter element in PDFArray')
                         if filter.getType() == 'name':
                             if self.filterParams == None:
-                                ret = decodeStream(self.decodedStream, filter.getValue(), self.filterParams)
+                                ret = self.decodeData(self.decodedStream, filter.getValue(), self.filterParams)
                                 if ret[0] == -1:
                                     if i == 0 and self.rawStream != self.encodedStream:
-                                        ret = decodeStream(self.rawStream, filter.getValue(), self.filterParams)
+                                        ret = self.decodeData(self.rawStream, filter.getValue(), self.filterParams)
                                     if ret[0] == -1:
                                         self.decodingError = True
                                         errorMessage = 'Decoding error: '+ret[1]
                                         if isForceMode:
                                             self.addError(errorMessage)
-                                            self.decodedStream = ''
+                                            self.decodedStream = self.recoveredStream
                                         else:
                                             return (-1,errorMessage)
                                     else:
@@ -2094,16 +2316,16 @@ class PDFStream (PDFDictionary) :
                                         paramsDict = paramsObj.getElements()
                                     else:
                                         paramsDict = {}
-                                ret = decodeStream(self.decodedStream, filter.getValue(), paramsDict)
+                                ret = self.decodeData(self.decodedStream, filter.getValue(), paramsDict)
                                 if ret[0] == -1:
                                     if i == 0 and self.rawStream != self.encodedStream:
-                                        ret = decodeStream(self.rawStream, filter.getValue(), paramsDict)
+                                        ret = self.decodeData(self.rawStream, filter.getValue(), paramsDict)
                                     if ret[0] == -1:
                                         self.decodingError = True
                                         errorMessage = 'Decoding error: '+ret[1]
                                         if isForceMode:
                                             self.addError(errorMessage)
-                                            self.decodedStream = ''
+                                            self.decodedStream = self.recoveredStream
                                         else:
                                             return (-1,errorMessage)
                                     else:
@@ -2140,6 +2362,27 @@ class PDFStream (PDFDictionary) :
         else:
             return (-1,'Empty stream')            
 
+    def decodeData(self, data, filter, parameters):
+        '''
+            Decodes some data of the stream with the given filter, applying the decompression limits and updating the decoding counters
+            
+            @param data: The data to decode (string)
+            @param filter: The name of the filter
+            @param parameters: The parameters of the filter
+            @return: A tuple (status,statusContent), where statusContent is the decoded data in case status = 0 or an error message in case status = -1
+        '''
+        stats = {}
+        ret = decodeStream(data, filter, parameters, maxDecodedSize, maxDecompressionRatio, stats)
+        self.decodingStats['encodedBytes'] += stats.get('encodedBytes', len(data))
+        if stats.has_key('decodedBytes'):
+            self.decodingStats['decodedBytes'] += stats['decodedBytes']
+        elif ret[0] != -1:
+            self.decodingStats['decodedBytes'] += len(ret[1])
+        if stats.get('limitExceeded', False):
+            self.decodingStats['limitExceeded'] = True
+        self.recoveredStream = stats.get('partialStream', '')
+        return ret
+
     def decrypt(self, password = None, strAlgorithm = 'RC4', altAlgorithm = 'RC4'):
         '''
             Decrypt the content of the object if possible 
@@ -2167,6 +2410,13 @@ class PDFStream (PDFDictionary) :
             return (-1,errorMessage)
         return ret
     
+    def deferDecoding(self):
+        '''
+            Postpones the decoding of the stream until decodedStream is accessed for the first time
+        '''
+        if not self.isDecodingDeferred():
+            del(self.decodedStream)
+
     def delElement(self, name, update = True):
         onlyElements = True
         if self.elements.has_key(name):
@@ -2381,6 +2631,14 @@ class PDFStream (PDFDictionary) :
             stats['JSCode'] = False
         return stats
     
+    def getDecodingStats(self):
+        '''
+            Gets the counters of the last decoding of the stream
+            
+            @return: A dictionary with the number of encoded bytes consumed (encodedBytes), the number of decoded bytes (decodedBytes) and if the decompression limits were exceeded (limitExceeded)
+        '''
+        return self.decodingStats
+
     def getStream(self):
         '''
             Gets the stream of the object 
@@ -2415,6 +2673,35 @@ class PDFStream (PDFDictionary) :
         '''
         return self.isEncodedStream
     
+    def isDecodingDeferred(self):
+        '''
+            Specifies if the stream has not been decoded yet because it was parsed in lazy mode
+            
+            @return: A boolean
+        '''
+        # Reading the attribute itself would decode the stream
+        try:
+            PDFStream.__dict__['decodedStream'].__get__(self)
+        except AttributeError:
+            return True
+        return False
+
+    def isDeferrable(self):
+        '''
+            Specifies if the decoding of the stream can be deferred in lazy mode. Only image and font streams are deferred, their content is checked looking for references and Javascript code on demand (checkDeferredContent).
+            
+            @return: A boolean
+        '''
+        if self.encrypted or self.xrefStream:
+            return False
+        for lengthKey in ['/Length1','/Length2','/Length3']:
+            if self.elements.has_key(lengthKey):
+                return True
+        subtype = self.elements.get('/Subtype')
+        if subtype != None and subtype.getType() == 'name' and subtype.getValue() in lazyStreamSubtypes:
+            return True
+        return False
+
     def isFaultyDecoding(self):
         '''
             Specifies if there are any errors in the process of decoding the stream 
@@ -2422,6 +2709,20 @@ class PDFStream (PDFDictionary) :
             @return: A boolean
         '''
         return self.decodingError
+
+    def peekStream(self, size):
+        '''
+            Gets the first bytes of the decoded stream. If the decoding was deferred only the needed part of a Flate stream is decompressed, without caching it.
+            
+            @param size: The number of bytes to obtain
+            @return: The beginning of the decoded stream (string)
+        '''
+        if self.isDecodingDeferred() and self.filter != None and self.filter.getType() == 'name' and self.filterParams == None:
+            if self.filter.getValue() in ['/FlateDecode','/Fl']:
+                ret = flateDecodePrefix(self.encodedStream, size)
+                if ret[0] != -1:
+                    return ret[1]
+        return self.decodedStream[:size]
     
     def replace(self, string1, string2):
         stringFound = False
@@ -2476,6 +2777,10 @@ class PDFStream (PDFDictionary) :
             self.size = int(value)
             self.cleanStream()
         self.updateNeeded = False
+        if isLazyMode and self.isEncodedStream and self.isDeferrable():
+            self.deferDecoding()
+            self.uncheckedContent = True
+            return (0,'')
         ret = self.decode()
         if ret[0] == -1:
             errorMessage = ret[1]
@@ -2553,15 +2858,19 @@ class PDFStream (PDFDictionary) :
     
 
 class PDFObjectStream (PDFStream) :
+    __slots__ = ('compressedObjectsDict','extends','firstObjectOffset','indexes','newRawStream','numCompressedObjects')
+
     def __init__(self, rawDict = '', rawStream = '', elements = {}, rawNames = {}, compressedObjectsDict = {}) :
         global isForceMode
         self.type = 'stream'
         self.dictType = ''
-        self.errors = []
+        self.errors = emptyList
         self.compressedIn = None
         self.encrypted = False
         self.decodedStream = ''
         self.encodedStream = ''
+        self.recoveredStream = ''
+        self.decodingStats = {'encodedBytes':0, 'decodedBytes':0, 'limitExceeded':False}
         self.rawStream = rawStream
         self.newRawStream = False
         self.newFilters = False
@@ -2574,11 +2883,11 @@ class PDFObjectStream (PDFStream) :
         self.value = '' # string
         self.updateNeeded = False
         self.containsJScode = False
-        self.JSCode = []
-        self.unescapedBytes = []
-        self.urlsFound = []
+        self.JSCode = emptyList
+        self.unescapedBytes = emptyList
+        self.urlsFound = emptyList
         self.referencesInElements = {}
-        self.references = []
+        self.references = emptyList
         self.elements = elements
         self.compressedObjectsDict = compressedObjectsDict
         self.indexes = []
@@ -2591,6 +2900,7 @@ class PDFObjectStream (PDFStream) :
         self.file = None
         self.isEncodedStream = False
         self.decodingError = False
+        self.uncheckedContent = False
         if elements != {}:
             ret = self.update()
             if ret[0] == -1:
@@ -2610,17 +2920,15 @@ class PDFObjectStream (PDFStream) :
             @param decrypt: A boolean indicating if a decryption has been performed. By default: False.
             @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
         '''
-        self.value = '<< '
-        self.rawValue = '<< '
-        self.encryptedValue = '<< '
+        self.deferValues()
         keys = self.elements.keys()
         values = self.elements.values()
         if not onlyElements:
-            self.errors = []
-            self.references = []
-            self.JSCode = []
-            self.unescapedBytes = []
-            self.urlsFound = []
+            self.errors = emptyList
+            self.references = emptyList
+            self.JSCode = emptyList
+            self.unescapedBytes = emptyList
+            self.urlsFound = emptyList
             self.containsJScode = False
             self.decodingError = False
             
@@ -2724,7 +3032,7 @@ class PDFObjectStream (PDFStream) :
             type = valueElement.getType()
             if type == 'reference':
                 if v not in self.references: 
-                    self.references.append(v)
+                    self.references += [v]
             elif type == 'dictionary' or type == 'array':
                 self.references = list(set(self.references + valueElement.getReferences()))
             if valueElement.containsJS():
@@ -2735,23 +3043,13 @@ class PDFObjectStream (PDFStream) :
             if valueElement.isFaulty():
                 errorMessage = 'Child element is faulty'
                 self.addError(errorMessage)
-            if self.rawNames.has_key(keys[i]):
-                rawName = self.rawNames[keys[i]]
-                rawValue = rawName.getRawValue()
-            else:
-                rawValue = keys[i]
+            if not self.rawNames.has_key(keys[i]):
                 self.rawNames[keys[i]] = PDFName(keys[i][1:])
             if type in ['string','hexstring','array','dictionary'] and self.encrypted and not decrypt:
                 ret = valueElement.encrypt(self.encryptionKey)
                 if ret[0] == -1:
                     errorMessage = ret[1]+' in child element'
                     self.addError(errorMessage)
-            self.encryptedValue += rawValue + ' ' + str(valueElement.getEncryptedValue()) + newLine
-            self.rawValue += rawValue + ' ' + str(valueElement.getRawValue()) + newLine
-            self.value += keys[i] + ' ' + v + newLine
-        self.encryptedValue = self.encryptedValue[:-1] + ' >>'
-        self.rawValue = self.rawValue[:-1] + ' >>'
-        self.value = self.value[:-1] + ' >>'
         
         if not onlyElements:
             # Stream
@@ -3728,6 +4026,85 @@ class PDFCrossRefEntry:
         return output
 
 
+class PDFObjectGraph :
+    '''
+        Index of the references between the objects of one version of the document.
+        The edges are kept in compressed sparse row arrays: the targets of the object in row r are targets[offsets[r]:offsets[r+1]].
+        The reverse edges are the reverse reference map of the body, which is not copied.
+    '''
+    def __init__(self, body) :
+        self.ids = array.array('l')
+        self.rows = {} # id -> row
+        self.types = []
+        self.labels = []
+        self.offsets = array.array('l', [0])
+        self.targets = array.array('l')
+        self.referrers = body.referrers # referenced id -> sorted ids of the objects referencing it, kept up to date by the body
+        objects = body.getObjects()
+        for id in body.getObjectsIds():
+            indirectObject = objects.get(id)
+            if indirectObject == None or indirectObject.getObject() == None:
+                continue
+            object = indirectObject.getObject()
+            type = label = object.getType()
+            if type == 'dictionary' or type == 'stream':
+                dictType = object.getDictType()
+                if dictType != '':
+                    label = dictType
+                elif type == 'dictionary':
+                    elements = object.getElements()
+                    if len(elements) == 1:
+                        label = elements.keys()[0]
+            self.rows[id] = len(self.ids)
+            self.ids.append(id)
+            self.types.append(type)
+            self.labels.append(label)
+            for reference in object.getReferences():
+                self.targets.append(int(reference.split()[0]))
+            self.offsets.append(len(self.targets))
+
+    def contains(self, id) :
+        return self.rows.has_key(id)
+
+    def getIds(self) :
+        '''
+            @return: The ids of the indexed objects, sorted by offset
+        '''
+        return self.ids.tolist()
+
+    def getLabel(self, id) :
+        '''
+            @return: The label of the object in the tree (dictionary type, single key or object type) or None if it is not indexed
+        '''
+        row = self.rows.get(id)
+        if row == None:
+            return None
+        return self.labels[row]
+
+    def getType(self, id) :
+        row = self.rows.get(id)
+        if row == None:
+            return None
+        return self.types[row]
+
+    def getReferencesIn(self, id) :
+        '''
+            @return: The ids referenced by the object, in the order of its references, or None if it is not indexed
+        '''
+        row = self.rows.get(id)
+        if row == None:
+            return None
+        return self.targets[self.offsets[row]:self.offsets[row+1]].tolist()
+
+    def getReferencesTo(self, id) :
+        '''
+            @return: The ids of the objects referencing the specified id, sorted
+        '''
+        if not self.referrers.has_key(id):
+            return []
+        return list(self.referrers[id])
+
+
 class PDFBody :
     def __init__(self) :
         self.numObjects = 0 # int
@@ -3752,6 +4129,39 @@ class PDFBody :
         self.objectStreams = []
         self.compressedObjects = []
         self.errors = []
+        self.graph = None # PDFObjectGraph, built when first needed
+        self.referencesOut = {} # id -> ids referenced by the object when it was registered
+        self.referrers = {} # referenced id -> sorted ids of the objects referencing it
+
+    def addReferences(self, id, pdfObject):
+        '''
+            Adds the references made by the object to the reverse reference map
+            
+            @param id: The id of the object
+            @param pdfObject: The PDFObject
+        '''
+        self.delReferences(id)
+        targets = set([int(reference.split()[0]) for reference in pdfObject.getReferences()])
+        for target in targets:
+            if self.referrers.has_key(target):
+                bisect.insort(self.referrers[target], id)
+            else:
+                self.referrers[target] = [id]
+        self.referencesOut[id] = targets
+
+    def delReferences(self, id):
+        '''
+            Removes the references made by the object from the reverse reference map
+            
+            @param id: The id of the object
+        '''
+        if not self.referencesOut.has_key(id):
+            return
+        for target in self.referencesOut.pop(id):
+            referrers = self.referrers[target]
+            del(referrers[bisect.bisect_left(referrers, id)])
+            if referrers == []:
+                del(self.referrers[target])
 
     def addCompressedObject(self, id):
         if id not in self.compressedObjects:
@@ -3765,6 +4175,52 @@ class PDFBody :
         if id not in self.xrefStreams:
             self.xrefStreams.append(id)
 
+    def checkDeferredJS(self):
+        '''
+            Checks the deferred streams (lazy mode) referenced as Javascript code by the /JS actions of the body, so the code hidden in image or font streams is found while parsing
+            
+            @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
+        '''
+        ids = []
+        for action in ['/JS','/JavaScript']:
+            for id in self.suspiciousActions.get(action, []):
+                if not self.objects.has_key(id):
+                    continue
+                pdfObject = self.objects[id].getObject()
+                if pdfObject == None:
+                    continue
+                for target in re.findall('/JS\s*(\d{1,10})\s{1,3}\d{1,5}\s{1,3}R', pdfObject.value):
+                    if int(target) not in ids:
+                        ids.append(int(target))
+        return self.checkDeferredStreams(ids)
+
+    def checkDeferredStreams(self, ids = None):
+        '''
+            Checks the content of the streams whose decoding was deferred (lazy mode) looking for references and Javascript code, updating the reverse reference map and the Javascript code of the body
+            
+            @param ids: The ids of the streams to check. By default: None (all the streams of the body).
+            @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
+        '''
+        errorMessage = ''
+        if ids == None:
+            ids = self.streams
+        for id in ids:
+            if not self.objects.has_key(id):
+                continue
+            pdfObject = self.objects[id].getObject()
+            if pdfObject == None or pdfObject.getType() != 'stream' or not pdfObject.uncheckedContent:
+                continue
+            ret = pdfObject.checkDeferredContent()
+            if ret[0] == -1:
+                errorMessage = ret[1]
+            self.addReferences(id, pdfObject)
+            self.graph = None
+            if pdfObject.containsJS():
+                self.updateStats(id, pdfObject)
+        if errorMessage != '':
+            return (-1,errorMessage)
+        return (0,'')
+
     def containsCompressedObjects(self):
         if len(self.compressedObjects) > 0:
             return True
@@ -3800,6 +4256,8 @@ class PDFBody :
         id = pdfIndirectObject.getId()
         if self.objects.has_key(id):
             self.objects.pop(id)
+        self.delReferences(id)
+        self.graph = None
         pdfObject = pdfIndirectObject.getObject()
         if pdfObject == None:
             errorMessage = 'Object is None'
@@ -3906,6 +4364,17 @@ class PDFBody :
     def getFaultyStreams(self):
         return self.faultyStreams
         
+    def getGraph(self):
+        '''
+            Returns the index of the references between the objects, building it if the body has changed
+            
+            @return: A PDFObjectGraph
+        '''
+        self.checkDeferredStreams()
+        if self.graph == None:
+            self.graph = PDFObjectGraph(self)
+        return self.graph
+
     def getIndirectObject(self, id):
         if self.objects.has_key(id):
             return self.objects[id]
@@ -4043,6 +4512,8 @@ class PDFBody :
                             del(compressedObjectsDict)
         pdfIndirectObject.setObject(pdfObject)
         self.objects[id] = pdfIndirectObject
+        self.addReferences(id, pdfObject)
+        self.graph = None
         self.errors += pdfObject.getErrors()
         if type == '':
             type = objectType
@@ -4095,9 +4566,17 @@ class PDFBody :
 
     def setObjects(self, objects):
         self.objects = objects
+        self.referencesOut = {}
+        self.referrers = {}
+        for id in objects:
+            pdfObject = objects[id].getObject()
+            if pdfObject != None:
+                self.addReferences(id, pdfObject)
+        self.graph = None
                 
     def updateObjects(self):
         errorMessage = ''
+        self.graph = None
         for id in self.toUpdate:
             updatedElements = {}
             object = self.objects[id].getObject()
@@ -4133,6 +4612,8 @@ class PDFBody :
                         return (-1,errorMessage)
             object.setReferencesInElements(updatedElements)
             object.resolveReferences()
+            # The decoded stream can add references
+            self.addReferences(id, object)
             if object.getType() == 'stream':
                 self.numStreams += 1
                 self.streams.append(id)
@@ -4177,42 +4658,50 @@ class PDFBody :
             errorMessage = 'Object is None'
             pdfFile.addError(errorMessage)
             return (-1,errorMessage)
-        value = pdfObject.getValue()
-        for event in monitorizedEvents:
-            if value.find(event) != -1:
-                printedEvent = event.strip()
-                if self.suspiciousEvents.has_key(printedEvent):
-                    if delete:
-                        if id in self.suspiciousEvents[printedEvent]:
-                            self.suspiciousEvents[printedEvent].remove(id)
-                    elif id not in self.suspiciousEvents[printedEvent]:
-                        self.suspiciousEvents[printedEvent].append(id)
-                elif not delete:
-                    self.suspiciousEvents[printedEvent] = [id]
-        for action in monitorizedActions:
-            index = value.find(action)
-            if index != -1 and (action == '/JS ' or len(value) == index + len(action) or value[index+len(action)] in delimiterChars+spacesChars):
-                printedAction = action.strip()
-                if self.suspiciousActions.has_key(printedAction):
-                    if delete:
-                        if id in self.suspiciousActions[printedAction]:
-                            self.suspiciousActions[printedAction].remove(id)
-                    elif id not in self.suspiciousActions[printedAction]:
-                        self.suspiciousActions[printedAction].append(id)
-                elif not delete:
-                    self.suspiciousActions[printedAction] = [id]
-        for element in monitorizedElements:
-            index = value.find(element)
-            if index != -1 and (element == '/EmbeddedFiles ' or len(value) == index + len(element) or value[index+len(element)] in delimiterChars+spacesChars):
-                printedElement = element.strip()
-                if self.suspiciousElements.has_key(printedElement):
-                    if delete:
-                        if id in self.suspiciousElements[printedElement]:
-                            self.suspiciousElements[printedElement].remove(id)
-                    elif id not in self.suspiciousElements[printedElement]:
-                        self.suspiciousElements[printedElement].append(id)
-                elif not delete:
-                    self.suspiciousElements[printedElement] = [id]
+        if pdfObject.getType() == 'stream' and pdfObject.isDecodingDeferred():
+            # Only the dictionary, the stream is decoded when needed (lazy mode)
+            value = pdfObject.value
+        else:
+            value = pdfObject.getValue()
+        # Most objects contain none of the keywords
+        found = indicatorsScanner.scan(value)
+        if found:
+            endChars = delimiterChars + spacesChars
+            for event in monitorizedEvents:
+                if found.has_key(event):
+                    printedEvent = event.strip()
+                    if self.suspiciousEvents.has_key(printedEvent):
+                        if delete:
+                            if id in self.suspiciousEvents[printedEvent]:
+                                self.suspiciousEvents[printedEvent].remove(id)
+                        elif id not in self.suspiciousEvents[printedEvent]:
+                            self.suspiciousEvents[printedEvent].append(id)
+                    elif not delete:
+                        self.suspiciousEvents[printedEvent] = [id]
+            for action in monitorizedActions:
+                index = found.get(action, -1)
+                if index != -1 and (action == '/JS ' or len(value) == index + len(action) or value[index+len(action)] in endChars):
+                    printedAction = action.strip()
+                    if self.suspiciousActions.has_key(printedAction):
+                        if delete:
+                            if id in self.suspiciousActions[printedAction]:
+                                self.suspiciousActions[printedAction].remove(id)
+                        elif id not in self.suspiciousActions[printedAction]:
+                            self.suspiciousActions[printedAction].append(id)
+                    elif not delete:
+                        self.suspiciousActions[printedAction] = [id]
+            for element in monitorizedElements:
+                index = found.get(element, -1)
+                if index != -1 and (element == '/EmbeddedFiles ' or len(value) == index + len(element) or value[index+len(element)] in endChars):
+                    printedElement = element.strip()
+                    if self.suspiciousElements.has_key(printedElement):
+                        if delete:
+                            if id in self.suspiciousElements[printedElement]:
+                                self.suspiciousElements[printedElement].remove(id)
+                        elif id not in self.suspiciousElements[printedElement]:
+                            self.suspiciousElements[printedElement].append(id)
+                    elif not delete:
+                        self.suspiciousElements[printedElement] = [id]
         if pdfObject.containsJS():
             if delete:
                 jsCodeArray = pdfObject.getJSCode()
@@ -4221,8 +4710,9 @@ class PDFBody :
                     for jsCode in jsCodeArray:
                         if jsCode in self.JSCode:
                             self.JSCode.remove(jsCode)
+                        vulnsFound = jsVulnsScanner.scan(jsCode)
                         for vuln in jsVulns:
-                            if jsCode.find(vuln) != -1:
+                            if vulnsFound.has_key(vuln):
                                 if self.vulns.has_key(vuln) and id in self.vulns[vuln]:
                                     self.vulns[vuln].remove(id)
             else:
@@ -4233,8 +4723,9 @@ class PDFBody :
                     if js not in self.JSCode:
                         self.JSCode.append(js)
                 for code in jsCode:
+                    vulnsFound = jsVulnsScanner.scan(code)
                     for vuln in jsVulns:
-                        if code.find(vuln) != -1:
+                        if vulnsFound.has_key(vuln):
                             if self.vulns.has_key(vuln):
                                 self.vulns[vuln].append(id)
                             else:
@@ -4243,13 +4734,17 @@ class PDFBody :
         objectType = pdfObject.getType()
         if objectType == 'stream':
             vulnFound = None
-            streamContent = pdfObject.getStream()
+            if pdfObject.isDecodingDeferred():
+                # The SING table check only needs the beginning of the stream (lazy mode)
+                streamContent = pdfObject.peekStream(328)
+            else:
+                streamContent = pdfObject.getStream()
             if len(streamContent) > 327 and streamContent[236:240] == 'SING' and streamContent[327] != '\0':
                 # CVE-2010-2883
                 # http://opensource.adobe.com/svn/opensource/tin/src/SING.cpp
                 # http://community.websense.com/blogs/securitylabs/archive/2010/09/10/brief-analysis-on-adobe-reader-sing-table-parsing-vulnerability-cve-2010-2883.aspx
                 vulnFound = singUniqueName
-            elif streamContent.count('AAL/AAAC/wAAAv8A') > 1000:
+            elif len(streamContent) > 16000 and streamContent.count('AAL/AAAC/wAAAv8A') > 1000:
                 # CVE-2013-2729
                 # Adobe Reader BMP/RLE heap corruption
                 # http://blog.binamuse.com/2013/05/readerbmprle.html
@@ -5848,6 +6343,7 @@ class PDFFile :
                     if indirectObject == None:
                         return None
                     else:
+                        self.body[i].checkDeferredStreams([id])
                         return indirectObject.getReferences()
             else:
                 return None
@@ -5860,36 +6356,24 @@ class PDFFile :
                 if indirectObject == None:
                     return None
                 else:
+                    self.body[version].checkDeferredStreams([id])
                     return indirectObject.getReferences()
             else:
                 return None
     
     def getReferencesTo (self, id, version = None) :
         ''' 
-            Get the references to the specified object in the document
+            Get the references to the specified object in the document.
+            Only the references parsed as reference objects, or found in the decoded content of a stream, are counted. A reference written inside a string, like "(see 1 0 R)", is not, unlike the search in the values of the objects used by previous versions.
         '''
         matchedObjects = []
         if version == None:
             for i in range(self.updates + 1):
-                indirectObjectsDict = self.body[i].getObjects()
-                for indirectObject in indirectObjectsDict.values():
-                    if indirectObject != None:
-                        object = indirectObject.getObject()
-                        if object != None:
-                            value = object.getValue()
-                            if re.findall('\D'+str(id)+'\s{1,3}\d{1,3}\s{1,3}R', value) != []:
-                                matchedObjects.append(indirectObject.id)
+                matchedObjects += self.body[i].getGraph().getReferencesTo(id)
         else:
             if version > self.updates or version < 0:
                 return None
-            indirectObjectsDict = self.body[version].getObjects()
-            for indirectObject in indirectObjectsDict.values():
-                if indirectObject != None:
-                    object = indirectObject.getObject()
-                    if object != None:
-                        value = object.getValue()
-                        if re.findall('\D'+str(id)+'\s{1,3}\d{1,3}\s{1,3}R', value) != []:
-                            matchedObjects.append(indirectObject.id)
+            matchedObjects = self.body[version].getGraph().getReferencesTo(id)
         return matchedObjects
 
     def getSHA1(self):
@@ -6048,7 +6532,7 @@ class PDFFile :
             streamTrailer = None
             catalogId = None
             infoId = None
-            ids = self.body[version].getObjectsIds()
+            graph = self.body[version].getGraph()
             ret = self.getTrailer(version)
             if ret != None:
                 trailer, streamTrailer = ret[1]
@@ -6060,29 +6544,11 @@ class PDFFile :
                 catalogId = streamTrailer.getCatalogId()
             if infoId == None and streamTrailer != None: 
                 infoId = streamTrailer.getInfoId()
-            for id in ids:
-                referencesIds = []
-                object = self.getObject(id, version)
-                if object != None:
-                    type = object.getType()    
-                    if type == 'dictionary' or type == 'stream':
-                        elements = object.getElements()
-                        if infoId == id:
-                            type = '/Info'
-                        else:
-                            dictType = object.getDictType()
-                            if dictType != '':
-                                type = dictType
-                            else:
-                                if type == 'dictionary' and len(elements) == 1:
-                                    type = elements.keys()[0]
-                    references = self.getReferencesIn(id, version)
-                    for i in range(len(references)):
-                        referencesIds.append(int(references[i].split()[0]))
-                    if references == None:
-                        objectsIn[id] = (type, [])
-                    else:
-                        objectsIn[id] = (type, referencesIds)
+            for id in graph.getIds():
+                type = graph.getLabel(id)
+                if infoId == id and graph.getType(id) in ['dictionary','stream']:
+                    type = '/Info'
+                objectsIn[id] = (type, graph.getReferencesIn(id))
             tree.append([catalogId, objectsIn])
         return tree
 
@@ -6571,23 +7037,210 @@ class PDFFile :
         pass
 
 
-class PDFParser :
+class PDFLexer :
+    '''
+        Tokenizer used by PDFParser when the 'fast' lexer is selected. It scans the raw content with compiled regular expressions
+        and index lookups instead of reading it character by character, and it never slices the content that has not been read yet.
+    '''
+    spacesRE = re.compile('[\x00\x09\x0a\x0c\x0d\x20]*')
+    regularCharsRE = re.compile('[^\x00\x09\x0a\x0c\x0d\x20(<\[{/%]*')
+    endOfLineRE = re.compile('[\r\n]')
+    referenceRE = re.compile('\d{1,10}\s{1,3}\d{1,10}\s{1,3}R', re.DOTALL)
+    numberRE = re.compile('[-+]?\.?\d{1,15}\.?\d{0,15}', re.DOTALL)
+    stringDelimsRE = re.compile('[()]')
+    
     def __init__(self) :
+        self.delimiters = {'<<':('<<','>>','dictionary'),'(':('(',')','string'),'<':('<','>','hexadecimal'),'[':('[',']','array')}
+        self.containerDelimsRE = {}
+        for closingDelim in ['>>','>',']']:
+            self.containerDelimsRE[closingDelim] = re.compile('[(\[<' + re.escape(closingDelim[0]) + ']')
+    
+    def getToken(self, content, pos):
+        '''
+            Returns the type of the token starting at the given position, without consuming it
+            @param content
+            @param pos
+            @return The type of the token: 'bool', 'null', 'reference', 'number' or None if it is not a known token
+        '''
+        if content[pos] == 't' or content[pos] == 'f':
+            return 'bool'
+        elif content[pos] == 'n':
+            return 'null'
+        elif self.referenceRE.match(content, pos) != None:
+            return 'reference'
+        elif self.numberRE.match(content, pos) != None:
+            return 'number'
+        return None
+    
+    def readSpaces(self, content, pos):
+        '''
+            Skips the space characters
+            @param content
+            @param pos
+            @return The position of the first non-space character
+        '''
+        if pos >= len(content):
+            return pos
+        return self.spacesRE.match(content, pos).end()
+    
+    def readRegularChars(self, content, pos):
+        '''
+            Reads the regular characters, stopping at the first space or delimiter
+            @param content
+            @param pos
+            @return A tuple (chars,end), where chars are the regular characters read and end is the position of the first non-regular character
+        '''
+        if pos >= len(content):
+            return ('', pos)
+        match = self.regularCharsRE.match(content, pos)
+        return (match.group(), match.end())
+    
+    def findEndOfLine(self, content, pos):
+        '''
+            Looks for the next end of line character
+            @param content
+            @param pos
+            @return The position of the end of line character or -1 if not found
+        '''
+        match = self.endOfLineRE.search(content, pos)
+        if match == None:
+            return -1
+        return match.start()
+    
+    def findClosingDelim(self, content, pos, delim, maxDepth = None):
+        '''
+            Looks for the closing delimiter matching an already read opening delimiter, skipping nested objects and escaped parenthesis.
+            Nested objects are tracked with an explicit stack instead of recursion, and the content is read only once whatever the nesting depth is.
+            @param content
+            @param pos Position after the opening delimiter
+            @param delim The delimiter tuple (opening,closing,type)
+            @param maxDepth Maximum number of nested objects, counting the first one. Default value: None (no limit).
+            @return A tuple (status,position), where status is 0 if the closing delimiter is found (position is its index), -1 if it is not found or -2 if maxDepth is exceeded (position is where the search stopped)
+        '''
+        stack = []
+        nextClosingDelims = {}
+        lastClosingDelims = {}
+        newObject = True
+        while True:
+            closingIndex = -1
+            if newObject:
+                # If there is just one closing delimiter left it is taken as the matching one, without looking for nested objects
+                newObject = False
+                start = pos
+                closingDelim = delim[1]
+                if not lastClosingDelims.has_key(closingDelim):
+                    lastClosingDelims[closingDelim] = content.rfind(closingDelim)
+                lastClosingDelim = lastClosingDelims[closingDelim]
+                if lastClosingDelim < pos:
+                    return (-1, pos)
+                nextClosingDelim = nextClosingDelims.get(closingDelim, -1)
+                if nextClosingDelim < pos:
+                    nextClosingDelim = content.find(closingDelim, pos)
+                    nextClosingDelims[closingDelim] = nextClosingDelim
+                if nextClosingDelim + len(closingDelim) > lastClosingDelim:
+                    closingIndex = lastClosingDelim
+                else:
+                    if delim[0] == '(':
+                        delimsRE = self.stringDelimsRE
+                    else:
+                        delimsRE = self.containerDelimsRE[closingDelim]
+                    prevChar = ''
+            else:
+                match = delimsRE.search(content, pos)
+                if match == None:
+                    return (-1, len(content))
+                index = match.start()
+                if index > pos:
+                    prevChar = content[index-1]
+                char = content[index]
+                if content.startswith(closingDelim, index):
+                    if char != ')' or index == start or content[index-1] != '\\':
+                        closingIndex = index
+                    else:
+                        pos = index + 1
+                elif (char == '(' and prevChar != '\\') or (char in ['[','<'] and delim[0] != '('):
+                    if maxDepth != None and len(stack) + 1 >= maxDepth:
+                        return (-2, index)
+                    stack.append((delim, start, prevChar, delimsRE))
+                    if content.startswith('<<', index):
+                        delim = self.delimiters['<<']
+                    else:
+                        delim = self.delimiters[char]
+                    pos = index + len(delim[0])
+                    newObject = True
+                else:
+                    prevChar = char
+                    pos = index + 1
+            if closingIndex != -1:
+                if stack == []:
+                    return (0, closingIndex)
+                pos = closingIndex + len(closingDelim)
+                delim, start, prevChar, delimsRE = stack.pop()
+                closingDelim = delim[1]
+
+
+class PDFParser :
+    def __init__(self, lexer = None, maxNestingDepth = defaultMaxNestingDepth, maxDecodedSize = None, maxDecompressionRatio = None) :
+        '''
+            Constructor of the parser
+            @param lexer The lexer used to read the objects: None (character by character) or 'fast' (PDFLexer). Default value: None.
+            @param maxNestingDepth Maximum number of nested arrays, dictionaries and strings in an object, to avoid parsing delimiter bombs. Nested objects are read and rendered recursively, so with None (no limit) the parsing of an object fails when it reaches the recursion limit of Python. Default value: defaultMaxNestingDepth (100).
+            @param maxDecodedSize Maximum number of bytes decoded from a Flate stream, to avoid decompression bombs. Default value: None (no limit).
+            @param maxDecompressionRatio Maximum ratio between the decoded and encoded bytes of a Flate stream. Default value: None (no limit).
+        '''
         self.commentChar = '%'
         self.comments = []
         self.delimiters = [('<<','>>','dictionary'),('(',')','string'),('<','>','hexadecimal'),('[',']','array'),('{','}',''),('/','','name'),('%','','comment')]
         self.fileParts = []
         self.charCounter = 0    
+        self.maxNestingDepth = maxNestingDepth
+        self.maxDecodedSize = maxDecodedSize
+        self.maxDecompressionRatio = maxDecompressionRatio
+        self.lexer = PDFLexer()
+        if lexer == None:
+            self.fastLexer = False
+        elif lexer == 'fast':
+            self.fastLexer = True
+        else:
+            raise Exception('Unknown lexer "'+str(lexer)+'"')
     
-    def parse (self, fileName, forceMode = False, looseMode = False, manualAnalysis = False) :
+    def parse (self, fileName, forceMode = False, looseMode = False, manualAnalysis = False, lazyMode = False) :
         '''
             Main method to parse a PDF document
             @param fileName The name of the file to be parsed
             @param forceMode Boolean to specify if ignore errors or not. Default value: False.
             @param looseMode Boolean to set the loose mode when parsing objects. Default value: False.
+            @param lazyMode Boolean to defer the decoding of image and font streams until they are accessed. Their content is checked looking for Javascript code if they are referenced by a /JS action, and looking for references when the references of the document are requested. Default value: False.
+            @return A PDFFile instance
+        '''
+        global isForceMode, pdfFile, isManualAnalysis, isLazyMode, maxDecodedSize, maxDecompressionRatio
+        pdfFile = PDFFile()
+        pdfFile.setPath(fileName)
+        pdfFile.setFileName(os.path.basename(fileName))
+        isForceMode = forceMode
+        isManualAnalysis = manualAnalysis
+        isLazyMode = lazyMode
+        maxDecodedSize = self.maxDecodedSize
+        maxDecompressionRatio = self.maxDecompressionRatio
+        
+        # Mapping the file in memory, so the header, the updates and the hashes are obtained from the same buffer
+        fileContent = self.mapFile(fileName)
+        try:
+            return self.parseMapped(fileContent, forceMode, looseMode)
+        finally:
+            # The updates must outlive the mapping, which is closed so it is not kept until garbage collection
+            self.fileParts = [str(part) for part in self.fileParts]
+            if isinstance(fileContent, mmap.mmap):
+                fileContent.close()
+
+    def parseMapped (self, fileContent, forceMode = False, looseMode = False) :
+        '''
+            Parses the content of a PDF document once it is mapped in memory by the parse method
+            @param fileContent The content of the file (mmap or string)
+            @param forceMode Boolean to specify if ignore errors or not. Default value: False.
+            @param looseMode Boolean to set the loose mode when parsing objects. Default value: False.
             @return A PDFFile instance
         '''
-        global isForceMode, pdfFile, isManualAnalysis
         isFirstBody = True
         linearizedFound = False
         errorMessage = ''
@@ -6595,15 +7248,10 @@ class PDFParser :
         binaryLine = ''
         headerOffset = 0
         garbageHeader = ''
-        pdfFile = PDFFile()
-        pdfFile.setPath(fileName)
-        pdfFile.setFileName(os.path.basename(fileName))
-        isForceMode = forceMode
-        isManualAnalysis = manualAnalysis
+        fileSize = len(fileContent)
         
         # Reading the file header
-        file = open(fileName,'rb')
-        for line in file:
+        for line in self.iterLines(fileContent):
             if versionLine == '':
                 pdfHeaderIndex = line.find('%PDF-')
                 psHeaderIndex = line.find('%!PS-Adobe-')
@@ -6627,7 +7275,6 @@ class PDFParser :
                 binaryLine = line
                 break
             headerOffset += len(line)
-        file.close()
         
         # Getting the specification version
         versionLine = versionLine.replace('\r','')
@@ -6664,31 +7311,43 @@ class PDFParser :
             else:
                 pdfFile.binary = False
             
-        # Reading the rest of the file
-        fileContent = open(fileName,'rb').read()
-        pdfFile.setSize(len(fileContent))
+        # Hashing the whole file
+        pdfFile.setSize(fileSize)
         pdfFile.setMD5(hashlib.md5(fileContent).hexdigest())
         pdfFile.setSHA1(hashlib.sha1(fileContent).hexdigest())
         pdfFile.setSHA256(hashlib.sha256(fileContent).hexdigest())
         
-        # Getting the number of updates in the file
-        while fileContent.find('%%EOF') != -1:
-            self.readUntilSymbol(fileContent, '%%EOF')
-            self.readUntilEndOfLine(fileContent)
-            self.fileParts.append(fileContent[:self.charCounter])
-            fileContent = fileContent[self.charCounter:]
-            self.charCounter = 0
+        # Getting the number of updates in the file. Each part is a view of the mapped file, not a copy.
+        partStart = 0
+        eofIndex = fileContent.find('%%EOF', partStart, fileSize)
+        while eofIndex != -1:
+            crIndex = fileContent.find('\r', eofIndex, fileSize)
+            if crIndex == -1:
+                lfIndex = fileContent.find('\n', eofIndex, fileSize)
+            else:
+                lfIndex = fileContent.find('\n', eofIndex, crIndex)
+            if lfIndex != -1:
+                partEnd = lfIndex
+            elif crIndex != -1:
+                partEnd = crIndex
+            else:
+                pdfFile.addError('EOL not found')
+                partEnd = fileSize
+            self.fileParts.append(buffer(fileContent, partStart, partEnd - partStart))
+            partStart = partEnd
+            eofIndex = fileContent.find('%%EOF', partStart, fileSize)
         else:
             if self.fileParts == []:
                 errorMessage = '%%EOF not found'
                 if forceMode:
                     pdfFile.addError(errorMessage)
-                    self.fileParts.append(fileContent)
+                    self.fileParts.append(buffer(fileContent))
                 else:
                     sys.exit(errorMessage)
         pdfFile.setUpdates(len(self.fileParts) - 1)
         
         # Getting the body, cross reference table and trailer of each part of the file
+        partStart = 0
         for i in range(len(self.fileParts)):
             bodyOffset = 0
             xrefOffset = 0
@@ -6708,14 +7367,15 @@ class PDFParser :
                 encryptDictId = None
             if pdfFile.getFileId() == '':
                 fileId = None
-            content = self.fileParts[i]
+            partEnd = partStart + len(self.fileParts[i])
             if i == 0:
                 bodyOffset = 0
             else:
                 bodyOffset = len(self.fileParts[i-1])
                 
             # Getting the content for each section
-            bodyContent,xrefContent,trailerContent = self.parsePDFSections(content,forceMode,looseMode)
+            bodyContent,xrefContent,trailerContent = self.parsePDFSections(fileContent,forceMode,looseMode,partStart,partEnd)
+            partStart = partEnd
             if xrefContent != None:    
                 xrefOffset = bodyOffset + len(bodyContent)
                 trailerOffset = xrefOffset + len(xrefContent)
@@ -6743,30 +7403,14 @@ class PDFParser :
             rawIndirectObjects = self.getIndirectObjects(bodyContent, looseMode)
             if rawIndirectObjects != []:
                 for j in range(len(rawIndirectObjects)):
-                    relativeOffset = 0
-                    auxContent = str(bodyContent)
                     rawObject = rawIndirectObjects[j][0]
                     objectHeader = rawIndirectObjects[j][1]
-                    while True:
-                        index = auxContent.find(objectHeader)
-                        if index == -1:
-                            relativeOffset = index
-                            break
-                        relativeOffset += index
-                        checkHeader = bodyContent[relativeOffset-1:relativeOffset+len(objectHeader)]
-                        if not re.match('\d{1,10}'+objectHeader,checkHeader):
-                            break
-                        else:
-                            auxContent = auxContent[index+len(objectHeader):]
-                            relativeOffset += len(objectHeader)
+                    relativeOffset = rawIndirectObjects[j][2]
                     ret = self.createPDFIndirectObject(rawObject, forceMode, looseMode)
                     if ret[0] != -1:
                         pdfIndirectObject = ret[1]
                         if pdfIndirectObject != None:
-                            if relativeOffset == -1:
-                                pdfIndirectObject.setOffset(relativeOffset)
-                            else:
-                                pdfIndirectObject.setOffset(bodyOffset + relativeOffset)
+                            pdfIndirectObject.setOffset(bodyOffset + relativeOffset)
                             ret = body.registerObject(pdfIndirectObject)
                             if ret[0] == -1:
                                 pdfFile.addError(ret[1])
@@ -6804,6 +7448,9 @@ class PDFParser :
             if pdfIndirectObject != None:
                 body.setNextOffset(pdfIndirectObject.getOffset())
             ret = body.updateObjects()
+            if ret[0] == -1:
+                pdfFile.addError(ret[1])
+            ret = body.checkDeferredJS()
             if ret[0] == -1:
                 pdfFile.addError(ret[1])
             pdfFile.addBody(body)
@@ -6879,52 +7526,52 @@ class PDFParser :
                 pdfFile.addError(ret[1])
         return (0,pdfFile)
 
-    def parsePDFSections(self, content, forceMode = False, looseMode = False):
+    def parsePDFSections(self, content, forceMode = False, looseMode = False, start = 0, end = None):
         '''
             Method to parse the different sections of a version of a PDF document.
-            @param content The raw content of the version of the PDF document.
+            @param content The raw content of the version of the PDF document, or the whole mapped file if start and end are specified.
             @param forceMode Boolean to specify if ignore errors or not. Default value: False.
             @param looseMode Boolean to set the loose mode when parsing objects. Default value: False.
+            @param start Offset where the version begins in content. Default value: 0.
+            @param end Offset where the version ends in content. Default value: None (end of content).
             @return An array with the different sections found: body, trailer and cross reference table
         '''
         threeSections = False
         bodyContent = None
         xrefContent = None
         trailerContent = None
+        if end == None:
+            end = len(content)
         
         global pdfFile
-        indexTrailer = content.find('trailer')
+        indexTrailer = content.find('trailer', start, end)
         if indexTrailer != -1:
-            restContent = content[:indexTrailer]
-            auxTrailer = content[indexTrailer:]
-            indexEOF = auxTrailer.find('%%EOF')
+            indexEOF = content.find('%%EOF', indexTrailer, end)
             if indexEOF == -1:
-                trailerContent = auxTrailer
+                trailerContent = content[indexTrailer:end]
             else:
-                trailerContent = auxTrailer[:indexEOF+5]
-            indexXref = restContent.find('xref')
+                trailerContent = content[indexTrailer:indexEOF+5]
+            indexXref = content.find('xref', start, indexTrailer)
             if indexXref != -1:
-                bodyContent = restContent[:indexXref]
-                xrefContent = restContent[indexXref:]
+                bodyContent = content[start:indexXref]
+                xrefContent = content[indexXref:indexTrailer]
             else:
-                bodyContent = restContent
+                bodyContent = content[start:indexTrailer]
                 if forceMode:
                     pdfFile.addError('Xref section not found')
             return [bodyContent,xrefContent,trailerContent]                
                 
-        indexTrailer = content.find('startxref')
+        indexTrailer = content.find('startxref', start, end)
         if indexTrailer != -1:
-            restContent = content[:indexTrailer]
-            auxTrailer = content[indexTrailer:]
-            indexEOF = auxTrailer.find('%%EOF')
+            indexEOF = content.find('%%EOF', indexTrailer, end)
             if indexEOF == -1:
-                trailerContent = auxTrailer
+                trailerContent = content[indexTrailer:end]
             else:
-                trailerContent = auxTrailer[:indexEOF+5]
-            bodyContent = restContent
+                trailerContent = content[indexTrailer:indexEOF+5]
+            bodyContent = content[start:indexTrailer]
             return [bodyContent,xrefContent,trailerContent]
         
-        return [content,xrefContent,trailerContent]
+        return [content[start:end],xrefContent,trailerContent]
     
     def createPDFIndirectObject (self, rawIndirectObject, forceMode = False, looseMode = False) :
         '''
@@ -6945,14 +7592,18 @@ class PDFParser :
             ret = self.readSymbol(rawIndirectObject, 'obj')
             if ret[0] == -1:
                 return ret
-            rawObject = rawIndirectObject[self.charCounter:]
-            ret = self.readObject(rawObject, forceMode = forceMode, looseMode = looseMode)
+            ret = self.readNextObject(rawIndirectObject, forceMode = forceMode, looseMode = looseMode)
             if ret[0] == -1:
                 return ret
             object = ret[1]
             pdfIndirectObject.setObject(object)
             ret = self.readSymbol(rawIndirectObject, 'endobj', False)
             pdfIndirectObject.setSize(self.charCounter)
+        except RuntimeError:
+            # Recursion limit reached reading nested objects without a nesting limit
+            errorMessage = 'Maximum nesting depth exceeded'
+            pdfFile.addError(errorMessage)
+            return (-1, errorMessage)
         except:
             errorMessage = 'Unspecified parsing error'
             pdfFile.addError(errorMessage)
@@ -6970,7 +7621,7 @@ class PDFParser :
         realCounter = self.charCounter
         self.charCounter = 0
         elements = []
-        ret = self.readObject(rawContent)
+        ret = self.readNextObject(rawContent)
         if ret[0] == -1:
             if ret[1] != 'Empty content reading object':
                 if isForceMode:
@@ -6984,7 +7635,7 @@ class PDFParser :
             pdfObject = ret[1]
         while pdfObject != None:
             elements.append(pdfObject)
-            ret = self.readObject(rawContent[self.charCounter:])
+            ret = self.readNextObject(rawContent)
             if ret[0] == -1:
                 if ret[1] != 'Empty content reading object':
                     if isForceMode:
@@ -7016,7 +7667,7 @@ class PDFParser :
         self.charCounter = 0
         elements = {}
         rawNames = {}
-        ret = self.readObject(rawContent[self.charCounter:], 'name')
+        ret = self.readNextObject(rawContent, 'name')
         if ret[0] == -1:
             if ret[1] != 'Empty content reading object':
                 if isForceMode:
@@ -7031,14 +7682,14 @@ class PDFParser :
         while name != None:
             key = name.getValue()
             rawNames[key] = name
-            rawValue = rawContent[self.charCounter:]
-            ret = self.readObject(rawValue)
+            valueOffset = self.charCounter
+            ret = self.readNextObject(rawContent)
             if ret[0] == -1:
                 if isForceMode:
                     pdfFile.addError('Bad object for '+str(key)+' key')
                     ret = self.readUntilSymbol(rawContent, '/')
                     if ret[0] == -1:
-                        elements[key] = PDFString(rawValue)
+                        elements[key] = PDFString(rawContent[valueOffset:])
                     else:
                         elements[key] = PDFString(ret[1])
                     self.readSpaces(rawContent)
@@ -7047,7 +7698,7 @@ class PDFParser :
             else:
                 value = ret[1]
                 elements[key] = value
-            ret = self.readObject(rawContent[self.charCounter:], 'name')
+            ret = self.readNextObject(rawContent, 'name')
             if ret[0] == -1:
                 if ret[1] != 'Empty content reading object':
                     if isForceMode:
@@ -7087,7 +7738,7 @@ class PDFParser :
         self.charCounter = 0
         elements = {}
         rawNames = {}
-        ret = self.readObject(dict[self.charCounter:], 'name')
+        ret = self.readNextObject(dict, 'name')
         if ret[0] == -1:
             if ret[1] != 'Empty content reading object':
                 if isForceMode:
@@ -7102,7 +7753,7 @@ class PDFParser :
         while name != None:
             key = name.getValue()
             rawNames[key] = name
-            ret = self.readObject(dict[self.charCounter:])
+            ret = self.readNextObject(dict)
             if ret[0] == -1:
                 if ret[1] != 'Empty content reading object':
                     if isForceMode:
@@ -7115,7 +7766,7 @@ class PDFParser :
             else:
                 value = ret[1]
             elements[key] = value
-            ret = self.readObject(dict[self.charCounter:], 'name')
+            ret = self.readNextObject(dict, 'name')
             if ret[0] == -1:
                 if ret[1] != 'Empty content reading object':
                     if isForceMode:
@@ -7366,7 +8017,12 @@ class PDFParser :
         if not isinstance(rawContent,str):
             return (-1,'Empty trailer content')
         self.readSymbol(rawContent, 'trailer')    
-        ret = self.readObject(rawContent[self.charCounter:],'dictionary')
+        try:
+            ret = self.readNextObject(rawContent,'dictionary')
+        except RuntimeError:
+            errorMessage = 'Maximum nesting depth exceeded'
+            pdfFile.addError(errorMessage)
+            ret = (-1, errorMessage)
         if ret[0] == -1:
             dict = PDFDictionary('')
             dict.addError('Error creating the trailer dictionary')
@@ -7473,7 +8129,7 @@ class PDFParser :
             This function returns an array of raw indirect objects of the PDF file given the raw body.
             @param content: string with the raw content of the PDF body.
             @param looseMode: boolean specifies if the parsing process should search for the endobj tag or not.
-            @return matchingObjects: array of tuples (object_content,object_header).
+            @return matchingObjects: array of tuples (object_content,object_header,object_offset), where object_offset is relative to the body.
         '''
         global pdfFile
         matchingObjects = []
@@ -7481,24 +8137,36 @@ class PDFParser :
             return matchingObjects
         if not looseMode:
             regExp = re.compile('((\d{1,10}\s\d{1,10}\sobj).*?endobj)',re.DOTALL)
-            matchingObjects = regExp.findall(content)
-        else:
-            regExp = re.compile('((\d{1,10}\s\d{1,10}\sobj).*?)\s\d{1,10}\s\d{1,10}\sobj',re.DOTALL)
-            matchingObjectsAux = regExp.findall(content)
-            while matchingObjectsAux != []:
-                if matchingObjectsAux[0] != []:
-                    objectBody = matchingObjectsAux[0][0]
-                    matchingObjects.append(matchingObjectsAux[0])
-                    content = content[content.find(objectBody)+len(objectBody):]
-                    matchingObjectsAux = regExp.findall(content)
-                else:
-                    matchingObjectsAux = []
-            lastObject = re.findall('(\d{1,5}\s\d{1,5}\sobj)',content,re.DOTALL)
-            if lastObject != []:
-                content = content[content.find(lastObject[0]):]
-                matchingObjects.append((content,lastObject[0]))
+            for match in regExp.finditer(content):
+                matchingObjects.append((match.group(1),match.group(2),match.start()))
+        else:
+            regExp = re.compile('((\d{1,10}\s\d{1,10}\sobj).*?)(?=\s\d{1,10}\s\d{1,10}\sobj)',re.DOTALL)
+            lastEnd = 0
+            for match in regExp.finditer(content):
+                matchingObjects.append((match.group(1),match.group(2),match.start()))
+                lastEnd = match.end()
+            lastObject = re.compile('(\d{1,5}\s\d{1,5}\sobj)',re.DOTALL).search(content,lastEnd)
+            if lastObject != None:
+                matchingObjects.append((content[lastObject.start():],lastObject.group(1),lastObject.start()))
         return matchingObjects
         
+    def iterLines(self, content):
+        '''
+            Generator returning the lines of the content, keeping the end of line characters, like iterating a file object
+            @param content A string or a mapped file
+            @return Iterator with the lines
+        '''
+        contentSize = len(content)
+        lineStart = 0
+        while lineStart < contentSize:
+            lineEnd = content.find('\n', lineStart, contentSize)
+            if lineEnd == -1:
+                lineEnd = contentSize
+            else:
+                lineEnd += 1
+            yield content[lineStart:lineEnd]
+            lineStart = lineEnd
+
     def getLines(self, content):
         '''
             Simple function to return the lines separated by end of line characters
@@ -7523,6 +8191,20 @@ class PDFParser :
             lines.append(content)
         return lines
     
+    def mapFile(self, fileName):
+        '''
+            Maps the file in memory (read-only) to avoid reading it more than once and copying its updates
+            @param fileName The name of the file
+            @return A mmap object with the content of the file, or a string if the file can not be mapped (empty files, for example)
+        '''
+        file = open(fileName,'rb')
+        try:
+            fileContent = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, mmap.error, EnvironmentError):
+            fileContent = file.read()
+        file.close()
+        return fileContent
+
     def readObject(self, content, objectType = None, forceMode = False, looseMode = False):
         '''
             Method to parse the raw body of the PDF file and obtain PDFObject instances
@@ -7532,12 +8214,40 @@ class PDFParser :
             @param looseMode
             @return A tuple (status,statusContent), where statusContent is a PDFObject instance in case status = 0 or an error in case status = -1
         '''
-        global pdfFile
         if len(content) == 0 or content[:6] == 'endobj':
             return (-1,'Empty content reading object')
-        pdfObject = None
         oldCounter = self.charCounter
         self.charCounter = 0
+        return self.readObjectAt(content, objectType, forceMode, looseMode, oldCounter)
+
+    def readNextObject(self, content, objectType = None, forceMode = False, looseMode = False):
+        '''
+            Reads the object placed at the current position of the content, using the selected lexer
+            @param content
+            @param objectType
+            @param forceMode
+            @param looseMode
+            @return A tuple (status,statusContent), where statusContent is a PDFObject instance in case status = 0 or an error in case status = -1
+        '''
+        if self.fastLexer:
+            return self.readObjectAt(content, objectType, forceMode, looseMode)
+        return self.readObject(content[self.charCounter:], objectType, forceMode, looseMode)
+
+    def readObjectAt(self, content, objectType = None, forceMode = False, looseMode = False, offset = 0):
+        '''
+            Reads the object placed at the current position of the content, without copying the rest of the content. readObject reads from the beginning of its content with it.
+            @param content
+            @param objectType
+            @param forceMode
+            @param looseMode
+            @param offset Position of the content in the original content, added to the counter once the object is read (readObject reads a copy of the rest of the content). Default value: 0.
+            @return A tuple (status,statusContent), where statusContent is a PDFObject instance in case status = 0 or an error in case status = -1
+        '''
+        global pdfFile
+        start = self.charCounter
+        if start >= len(content) or content.startswith('endobj', start):
+            return (-1,'Empty content reading object')
+        pdfObject = None
         if objectType != None:
             objectsTypeArray = [self.delimiters[i][2] for i in range(len(self.delimiters))]
             index = objectsTypeArray.index(objectType)
@@ -7551,7 +8261,11 @@ class PDFParser :
                     sys.exit('Error: Unknown object type!!')
         else:
             delimiters = self.delimiters
+        # On parsing errors the counter is left relative to the beginning of the object, createPDFDictionary goes on reading from there
         for delim in delimiters:
+            # Skipping the delimiters which can not be read, without the overhead of calling readSymbol
+            if self.charCounter < len(content) and content[self.charCounter] != '%' and not content.startswith(delim[0], self.charCounter):
+                continue
             ret = self.readSymbol(content, delim[0])
             if ret[0] != -1:
                 if delim[2] == 'dictionary':
@@ -7560,9 +8274,10 @@ class PDFParser :
                         dictContent = ''
                     else:
                         dictContent = ret[1]
-                    if content.find('stream') != -1 and dictContent.find('stream') == -1:
+                    if content.find('stream', start) != -1 and dictContent.find('stream') == -1:
                         ret = self.readUntilSymbol(content, 'stream')
                         if ret[0] == -1:
+                            self.charCounter -= start
                             return ret
                         auxDict = ret[1]
                         self.readSymbol(content, 'stream', False)
@@ -7587,7 +8302,7 @@ class PDFParser :
                                 return ret
                             pdfObject = ret[1]
                         else:
-                            pdfObject = PDFDictionary(content)
+                            pdfObject = PDFDictionary(content[start:])
                             pdfObject.addError('Closing delimiter not found in dictionary object')
                         break
                 elif delim[2] == 'string':
@@ -7597,7 +8312,7 @@ class PDFParser :
                         self.readSymbol(content, delim[1])
                         pdfObject = PDFString(stringContent)
                     else:
-                        pdfObject = PDFString(content)
+                        pdfObject = PDFString(content[start:])
                         pdfObject.addError('Closing delimiter not found in string object')
                     break
                 elif delim[2] == 'hexadecimal':
@@ -7607,7 +8322,7 @@ class PDFParser :
                         self.readSymbol(content, delim[1])
                         pdfObject = PDFHexString(hexContent)
                     else:
-                        pdfObject = PDFHexString(content)
+                        pdfObject = PDFHexString(content[start:])
                         pdfObject.addError('Closing delimiter not found in hexadecimal object')
                     break
                 elif delim[2] == 'array':
@@ -7620,7 +8335,7 @@ class PDFParser :
                             return ret
                         pdfObject = ret[1]
                     else:
-                        pdfObject = PDFArray(content)
+                        pdfObject = PDFArray(content[start:])
                         pdfObject.addError('Closing delimiter not found in array object')
                     break
                 elif delim[2] == 'name':
@@ -7632,31 +8347,34 @@ class PDFParser :
                     if ret[0] == 0:
                         self.comments.append(ret[1])
                         self.readSpaces(content)
-                        pdfObject = self.readObject(content[self.charCounter:],objectType)
+                        pdfObject = self.readObjectAt(content,objectType)
                     else:
+                        self.charCounter -= start
                         return ret
                     break
         else:
-            if content[0] == 't' or content[0] == 'f':
+            tokenType = self.lexer.getToken(content, start)
+            if tokenType == 'bool':
                 ret,raw = self.readUntilNotRegularChar(content)
                 pdfObject = PDFBool(raw)
-            elif content[0] == 'n':
+            elif tokenType == 'null':
                 ret,raw = self.readUntilNotRegularChar(content)
                 pdfObject = PDFNull(raw)
-            elif re.findall('^(\d{1,10}\s{1,3}\d{1,10}\s{1,3}R)', content, re.DOTALL) != []:
+            elif tokenType == 'reference':
                 ret,id = self.readUntilNotRegularChar(content)
                 ret,genNumber = self.readUntilNotRegularChar(content)
                 ret = self.readSymbol(content, 'R')
                 if ret[0] == -1:
+                    self.charCounter -= start
                     return ret
                 pdfObject = PDFReference(id, genNumber)
-            elif re.findall('^([-+]?\.?\d{1,15}\.?\d{0,15})', content, re.DOTALL) != []:
+            elif tokenType == 'number':
                 ret,num = self.readUntilNotRegularChar(content)
                 pdfObject = PDFNum(num)
             else:
-                self.charCounter += oldCounter
+                self.charCounter += offset
                 return (-1,'Object not found')
-        self.charCounter += oldCounter
+        self.charCounter += offset
         return (0,pdfObject)
 
     def readSpaces(self, string):
@@ -7668,6 +8386,9 @@ class PDFParser :
         if not isinstance(string,str):
             return (-1,'Bad string')
         spacesCounter = self.charCounter
+        if self.fastLexer:
+            self.charCounter = self.lexer.readSpaces(string, self.charCounter)
+            return (0,spacesCounter - self.charCounter)
         for i in range(self.charCounter,len(string)):
             if string[i] not in spacesChars:
                 break
@@ -7715,69 +8436,19 @@ class PDFParser :
             @return A tuple (status,statusContent), where statusContent is the characters read in case status = 0 or an error in case status = -1
         '''
         global pdfFile
-        output = ''
         if not isinstance(content,str):
             return (-1,'Bad string')
-        newContent = content[self.charCounter:]
-        numOpeningDelims = newContent.count(delim[0]) + 1
-        numClosingDelims = newContent.count(delim[1])
-        if numClosingDelims == 0:
+        start = self.charCounter
+        status, self.charCounter = self.lexer.findClosingDelim(content, start, delim, self.maxNestingDepth)
+        if status == -1:
             errorMessage = 'No closing delimiter found'
             pdfFile.addError(errorMessage)
             return (-1, errorMessage)
-        elif numClosingDelims == 1:
-            index = newContent.rfind(delim[1])
-            self.charCounter += index
-            return (0,newContent[:index])
-        else:
-            indexChar = 0
-            prevChar = ''
-            while indexChar != len(newContent):
-                char = newContent[indexChar]
-                if indexChar == len(newContent) - 1:
-                    nextChar = ''
-                else:
-                    nextChar = newContent[indexChar+1]
-                if char == delim[1] or (char + nextChar) == delim[1]:
-                    if char != ')' or indexChar == 0 or newContent[indexChar-1] != '\\':
-                        return (0,output)
-                    else:
-                        output += char
-                        indexChar += 1
-                        self.charCounter += 1
-                elif (char == '(' and prevChar != '\\') or (char in ['[','<'] and delim[0] != '('):
-                    if (char + nextChar) != '<<':
-                        delimIndex = delimiterChars.index(char)
-                        self.charCounter += 1
-                        ret = self.readUntilClosingDelim(content, self.delimiters[delimIndex])
-                        if ret[0] != -1:
-                            tempObject = char + ret[1]
-                        else:
-                            return ret
-                    else:
-                        delimIndex = delimiterChars.index(char + nextChar)
-                        self.charCounter += 2
-                        ret = self.readUntilClosingDelim(content, self.delimiters[delimIndex])
-                        if ret[0] != -1:
-                            tempObject = char + nextChar + ret[1]
-                        else:
-                            return ret
-                    ret = self.readSymbol(content, self.delimiters[delimIndex][1], False)
-                    if ret[0] != -1:
-                        tempObject += self.delimiters[delimIndex][1]
-                    else:
-                        return ret
-                    indexChar += len(tempObject)
-                    output += tempObject
-                else:
-                    indexChar += 1
-                    self.charCounter += 1
-                    output += char
-                    prevChar = char            
-            else:
-                errorMessage = 'No closing delimiter found'
-                pdfFile.addError(errorMessage)
-                return (-1, errorMessage)
+        elif status == -2:
+            errorMessage = 'Maximum nesting depth exceeded ('+str(self.maxNestingDepth)+')'
+            pdfFile.addError(errorMessage)
+            return (-1, errorMessage)
+        return (0,content[start:self.charCounter])
     
     def readUntilEndOfLine(self, content):
         '''
@@ -7790,6 +8461,15 @@ class PDFParser :
             return (-1,'Bad string')
         errorMessage = []
         oldCharCounter = self.charCounter
+        if self.fastLexer:
+            index = self.lexer.findEndOfLine(content, self.charCounter)
+            if index != -1:
+                self.charCounter = index
+                return (0,content[oldCharCounter:self.charCounter])
+            self.charCounter = max(self.charCounter, len(content))
+            errorMessage = 'EOL not found'
+            pdfFile.addError(errorMessage)
+            return (-1, errorMessage)
         tmpContent = content[self.charCounter:]
         for char in tmpContent:
             if char == '\r' or char == '\n':
@@ -7810,6 +8490,15 @@ class PDFParser :
         global pdfFile
         if not isinstance(string,str):
             return (-1,'Bad string')
+        if self.fastLexer:
+            index = string.rfind(symbol, self.charCounter)
+            if index == -1:
+                errorMessage = 'Symbol "'+symbol+'" not found'
+                pdfFile.addError(errorMessage)
+                return (-1, errorMessage)
+            oldCharCounter = self.charCounter
+            self.charCounter = index
+            return (0,string[oldCharCounter:index])
         newString = string[self.charCounter:]
         index = newString.rfind(symbol)
         if index == -1:
@@ -7828,6 +8517,11 @@ class PDFParser :
         readChars = ''
         if not isinstance(string,str):
             return (-1,'Bad string')
+        if self.fastLexer:
+            readChars, self.charCounter = self.lexer.readRegularChars(string, self.charCounter)
+            if self.charCounter < len(string):
+                self.readSpaces(string)
+            return (0,readChars)
         notRegChars = spacesChars + delimiterChars
         for i in range(self.charCounter,len(string)):
             if string[i] in notRegChars:
@@ -7847,6 +8541,14 @@ class PDFParser :
         global pdfFile
         if not isinstance(string,str):
             return (-1,'Bad string')
+        if self.fastLexer:
+            index = string.find(symbol, self.charCounter)
+            if index == -1:
+                errorMessage = 'Symbol "'+symbol+'" not found'
+                return (-1, errorMessage)
+            oldCharCounter = self.charCounter
+            self.charCounter = index
+            return (0,string[oldCharCounter:index])
         newString = string[self.charCounter:]
         index = newString.find(symbol)
         if index == -1:
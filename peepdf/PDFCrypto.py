@@ -25,11 +25,15 @@
     Module to manage cryptographic operations with PDF files
 '''    
 
-import hashlib,struct,random,warnings,aes
+import hashlib,struct,random,warnings,binascii,aes
 from itertools import cycle, izip
 warnings.filterwarnings("ignore")
 
 paddingString = '\x28\xBF\x4E\x5E\x4E\x75\x8A\x41\x64\x00\x4E\x56\xFF\xFA\x01\x08\x2E\x2E\x00\xB6\xD0\x68\x3E\x80\x2F\x0C\xA9\xFE\x64\x53\x69\x7A'
+# Caches of the RC4 key schedules and the object keys, emptied when they reach maxCacheEntries
+rc4SchedulesCache = {}
+objectKeysCache = {}
+maxCacheEntries = 4096
 
 def computeEncryptionKey(password, dictOwnerPass, dictUserPass, dictOE, dictUE, fileID, pElement, dictKeyLength = 128, revision = 3, encryptMetadata = False, passwordType = None):
     '''
@@ -92,6 +96,9 @@ def computeObjectKey(id, generationNum, encryptionKey, keyLengthBytes, algorithm
         @param algorithm: The algorithm used in the encryption/decryption process
         @return: The computed key in string format
     '''    
+    cacheKey = (id, generationNum, encryptionKey, keyLengthBytes, algorithm)
+    if objectKeysCache.has_key(cacheKey):
+        return objectKeysCache[cacheKey]
     key = encryptionKey + struct.pack('<i',id)[:3] + struct.pack('<i',generationNum)[:2]
     if algorithm == 'AES':
         key += '\x73\x41\x6C\x54' # sAlT
@@ -101,6 +108,9 @@ def computeObjectKey(id, generationNum, encryptionKey, keyLengthBytes, algorithm
     else:
         key = key[:16]
     # AES: block size = 16 bytes, initialization vector (16 bytes), random, first bytes encrypted string
+    if len(objectKeysCache) >= maxCacheEntries:
+        objectKeysCache.clear()
+    objectKeysCache[cacheKey] = key
     return key
 
 def computeOwnerPass(ownerPassString, userPassString, keyLength = 128, revision = 3):
@@ -270,33 +280,37 @@ def RC4(data, key):
         @param key: Key used for the algorithm
         @return: The encrypted/decrypted bytes
     '''    
-    y = 0
-    hash = {}
-    box = {}
-    ret = ''
-    keyLength  = len(key)
-    dataLength = len(data)
-      
     #Initialization
-    for x in range(256):
-        hash[x] = ord(key[x % keyLength])
-        box[x]    = x  
-    for x in range(256):
-        y            = (y + int(box[x]) + int(hash[x])) % 256 
-        tmp        = box[x]
-        box[x] = box[y]
-        box[y] = tmp 
+    if rc4SchedulesCache.has_key(key):
+        box = list(rc4SchedulesCache[key])
+    else:
+        keyBytes = bytearray(key)
+        keyLength = len(keyBytes)
+        box = range(256)
+        y = 0
+        for x in xrange(256):
+            y = (y + box[x] + keyBytes[x % keyLength]) & 0xff
+            box[x], box[y] = box[y], box[x]
+        if len(rc4SchedulesCache) >= maxCacheEntries:
+            rc4SchedulesCache.clear()
+        rc4SchedulesCache[key] = tuple(box)
 
+    dataLength = len(data)
+    if dataLength == 0:
+        return ''
+    keyStream = bytearray(dataLength)
     z = y = 0
-    for x in range(0,dataLength):
-        z = (z + 1) % 256 
-        y = (y + box[z]) % 256
-        tmp    = box[z]
-        box[z] = box[y]
-        box[y] = tmp
-        k    = box[((box[z] + box[y]) % 256)]
-        ret    += chr(ord(data[x]) ^ k)
-    return ret
+    for x in xrange(dataLength):
+        z = (z + 1) & 0xff
+        a = box[z]
+        y = (y + a) & 0xff
+        b = box[y]
+        box[z] = b
+        box[y] = a
+        keyStream[x] = box[(a + b) & 0xff]
+    # The whole data is xored at once as big integers
+    result = int(binascii.hexlify(data), 16) ^ int(binascii.hexlify(keyStream), 16)
+    return binascii.unhexlify('%0*x' % (2*dataLength, result))
 
 '''
     Author: Evan Fosmark (http://www.evanfosmark.com/2008/06/xor-encryption-with-python/)
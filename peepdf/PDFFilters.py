@@ -56,17 +56,36 @@
     Module to manage encoding/decoding in PDF files
 '''
 
-import sys, zlib, lzw, struct
+import sys, re, zlib, lzw, struct, binascii
 from PDFUtils import getNumsFromBytes, getBytesFromBits, getBitsFromNum
 from ccitt import CCITTFax
+try:
+    import numpy
+    NUMPY_MODULE = True
+except:
+    NUMPY_MODULE = False
 
-def decodeStream(stream, filter, parameters = {}):
+# Size of the compressed chunks given to the Flate decompressor
+flateChunkSize = 65536
+# The decompression ratio is checked every time this number of bytes has been decoded
+minRatioCheckSize = 1048576
+# Rows shorter than this are added byte by byte instead of as big integers
+swarMinLength = 16
+swarMasks = {}
+# Number of bytes of a TIFF predicted stream processed at once with NumPy
+tiffBlockSize = 1048576
+componentsTables = {}
+
+def decodeStream(stream, filter, parameters = {}, maxSize = None, maxRatio = None, stats = None):
     '''
         Decode the given stream
         
         @param stream: Stream to be decoded (string)
         @param filter: Filter to apply to decode the stream
         @param parameters: List of PDFObjects containing the parameters for the filter
+        @param maxSize: Maximum number of decoded bytes allowed for the Flate filter. By default: None (no limit).
+        @param maxRatio: Maximum ratio between decoded and encoded bytes allowed for the Flate filter. By default: None (no limit).
+        @param stats: Dictionary where the Flate filter stores the decoding counters. By default: None.
         @return: A tuple (status,statusContent), where statusContent is the decoded stream in case status = 0 or an error in case status = -1
     '''
     if filter == '/ASCIIHexDecode' or filter == '/AHx':
@@ -76,7 +95,7 @@ def decodeStream(stream, filter, parameters = {}):
     elif filter == '/LZWDecode' or filter == '/LZW':
         ret = lzwDecode(stream, parameters)
     elif filter == '/FlateDecode' or filter == '/Fl':
-        ret = flateDecode(stream, parameters)
+        ret = flateDecode(stream, parameters, maxSize, maxRatio, stats)
     elif filter == '/RunLengthDecode' or filter == '/RL':
         ret = runLengthDecode(stream)
     elif filter == '/CCITTFaxDecode' or filter == '/CCF':
@@ -243,19 +262,116 @@ def asciiHexEncode(stream):
         return (-1,'Error in hexadecimal conversion')
     return (0,encodedStream)
 
-def flateDecode(stream, parameters):
+def flateDecode(stream, parameters, maxSize = None, maxRatio = None, stats = None):
     '''
         Method to decode streams using the Flate algorithm
     
         @param stream: A PDF stream
+        @param maxSize: The maximum number of decoded bytes allowed. By default: None (no limit).
+        @param maxRatio: The maximum ratio between decoded and encoded bytes allowed. By default: None (no limit).
+        @param stats: A dictionary to store the decoding counters and, in case of error, the partially decoded stream (see flateDecompress). By default: None.
         @return: A tuple (status,statusContent), where statusContent is the decoded PDF stream in case status = 0 or an error in case status = -1
     '''
-    decodedStream = ''
-    try:
-        decodedStream = zlib.decompress(stream)
-    except:
-        return (-1,'Error decompressing string')
+    if stats == None:
+        stats = {}
+    ret = flateDecompress(stream, maxSize, maxRatio, stats)
+    if ret[0] == -1:
+        if stats['partialStream'] != '':
+            predicted = flatePostPrediction(stats['partialStream'], parameters)
+            if predicted[0] != -1:
+                stats['partialStream'] = predicted[1]
+            else:
+                stats['partialStream'] = ''
+        return ret
+    return flatePostPrediction(ret[1], parameters)
 
+def flateDecompress(stream, maxSize = None, maxRatio = None, stats = None):
+    '''
+        Method to decompress a zlib stream incrementally, stopping when the decoded size or the compression ratio exceed the given limits
+    
+        @param stream: A zlib stream
+        @param maxSize: The maximum number of decoded bytes allowed. By default: None (no limit).
+        @param maxRatio: The maximum ratio between decoded and encoded bytes allowed, checked once minRatioCheckSize bytes have been decoded. By default: None (no limit).
+        @param stats: A dictionary where the number of encoded bytes consumed (encodedBytes), the number of decoded bytes (decodedBytes), if a limit was exceeded (limitExceeded) and the bytes decoded before an error (partialStream) are stored. By default: None.
+        @return: A tuple (status,statusContent), where statusContent is the decompressed stream in case status = 0 or an error in case status = -1
+    '''
+    if stats == None:
+        stats = {}
+    errorMessage = ''
+    decodedChunks = []
+    decodedBytes = 0
+    encodedBytes = 0
+    offset = 0
+    decompressor = zlib.decompressobj()
+    while offset < len(stream) and errorMessage == '' and decompressor.unused_data == '':
+        chunk = stream[offset:offset+flateChunkSize]
+        offset += len(chunk)
+        while chunk != '':
+            if maxSize != None:
+                maxLength = maxSize - decodedBytes + 1
+            else:
+                maxLength = 0
+            if maxRatio != None and (maxLength == 0 or maxLength > minRatioCheckSize):
+                maxLength = minRatioCheckSize
+            try:
+                decodedChunk = decompressor.decompress(chunk, maxLength)
+            except:
+                errorMessage = 'Error decompressing string'
+                break
+            decodedChunks.append(decodedChunk)
+            decodedBytes += len(decodedChunk)
+            if decompressor.unused_data != '':
+                # End of the zlib stream, the remaining bytes are ignored
+                chunk = ''
+                encodedBytes = offset - len(decompressor.unused_data)
+            else:
+                chunk = decompressor.unconsumed_tail
+                encodedBytes = offset - len(chunk)
+            if maxSize != None and decodedBytes > maxSize:
+                errorMessage = 'Decoded size limit exceeded (%d bytes)' % maxSize
+            elif maxRatio != None and decodedBytes > minRatioCheckSize and decodedBytes > maxRatio * encodedBytes:
+                errorMessage = 'Decompression ratio limit exceeded (%d)' % maxRatio
+            if errorMessage != '':
+                stats['limitExceeded'] = True
+                break
+    if errorMessage == '' and decompressor.unused_data == '':
+        # The end of the zlib stream has been reached only if the following bytes are not considered compressed data
+        endChecker = decompressor.copy()
+        try:
+            endChecker.decompress('\x00')
+        except:
+            pass
+        if endChecker.unused_data == '':
+            errorMessage = 'Error decompressing string'
+        try:
+            decodedChunk = decompressor.flush()
+        except:
+            decodedChunk = ''
+        decodedChunks.append(decodedChunk)
+        decodedBytes += len(decodedChunk)
+        if errorMessage == '' and maxSize != None and decodedBytes > maxSize:
+            errorMessage = 'Decoded size limit exceeded (%d bytes)' % maxSize
+            stats['limitExceeded'] = True
+    stats['encodedBytes'] = stats.get('encodedBytes', 0) + encodedBytes
+    stats['decodedBytes'] = stats.get('decodedBytes', 0) + decodedBytes
+    stats.setdefault('limitExceeded', False)
+    if errorMessage != '':
+        if maxSize != None:
+            stats['partialStream'] = ''.join(decodedChunks)[:maxSize]
+        else:
+            stats['partialStream'] = ''.join(decodedChunks)
+        return (-1,errorMessage)
+    stats['partialStream'] = ''
+    return (0,''.join(decodedChunks))
+
+def flatePostPrediction(decodedStream, parameters):
+    '''
+        Method to apply the predictor specified in the Flate parameters to a decompressed stream
+    
+        @param decodedStream: The decompressed stream
+        @param parameters: The dictionary of parameters of the Flate filter
+        @return: A tuple (status,statusContent), where statusContent is the decoded PDF stream in case status = 0 or an error in case status = -1
+    '''
     if parameters == None or parameters == {}:
         return (0,decodedStream)
     else:
@@ -288,6 +404,26 @@ def flateDecode(stream, parameters):
         else:
             return (0,decodedStream)        
 
+def flateDecodePrefix(stream, size, chunkSize = 512):
+    '''
+        Method to decode only the beginning of a stream compressed with the Flate algorithm
+    
+        @param stream: A PDF stream
+        @param size: The maximum number of bytes to decode
+        @param chunkSize: The number of compressed bytes given to the decompressor each time. By default: 512.
+        @return: A tuple (status,statusContent), where statusContent is the beginning of the decoded PDF stream in case status = 0 or an error in case status = -1
+    '''
+    decodedStream = ''
+    offset = 0
+    try:
+        decompressor = zlib.decompressobj()
+        while len(decodedStream) < size and offset < len(stream):
+            decodedStream += decompressor.decompress(stream[offset:offset+chunkSize], size - len(decodedStream))
+            offset += chunkSize
+    except:
+        return (-1,'Error decompressing string')
+    return (0,decodedStream)
+
 def flateEncode(stream, parameters):
     '''
         Method to encode streams using the Flate algorithm
@@ -445,6 +581,352 @@ def lzwEncode(stream, parameters):
         except:
             return (-1,'Error decompressing string')
 
+def isRegularPrediction(columns, colors, bits):
+    '''
+        Specifies if the predictor parameters can be handled by the optimized predictor functions
+    
+        @param columns: Number of samples per row
+        @param colors: Number of colors per sample
+        @param bits: Number of bits per color
+        @return: A boolean
+    '''
+    for param in (columns, colors, bits):
+        if type(param) not in (int, long) or param < 1:
+            return False
+    return bits in [1,2,4,8,16]
+
+def addBytes(data, upData):
+    '''
+        Adds two strings of the same length byte by byte (modulo 256)
+    
+        @param data: The first string
+        @param upData: The second string
+        @return: The resulting string
+    '''
+    length = len(data)
+    if length < swarMinLength:
+        output = bytearray(data)
+        upBytes = bytearray(upData)
+        for i in xrange(length):
+            output[i] = (output[i] + upBytes[i]) & 0xff
+        return str(output)
+    # The strings are added as big integers, avoiding the carry between bytes
+    if not swarMasks.has_key(length):
+        swarMasks[length] = (int('7f'*length, 16), int('80'*length, 16))
+    lowMask, highMask = swarMasks[length]
+    x = int(binascii.hexlify(data), 16)
+    y = int(binascii.hexlify(upData), 16)
+    result = ((x & lowMask) + (y & lowMask)) ^ ((x ^ y) & highMask)
+    return binascii.unhexlify('%0*x' % (2*length, result))
+
+def accumulateBytes(data):
+    '''
+        Returns the running sums (modulo 256) of the bytes of the string
+    
+        @param data: The string
+        @return: The resulting string
+    '''
+    length = len(data)
+    if length < swarMinLength:
+        output = bytearray(data)
+        for i in xrange(1, length):
+            output[i] = (output[i] + output[i-1]) & 0xff
+        return str(output)
+    if not swarMasks.has_key(length):
+        swarMasks[length] = (int('7f'*length, 16), int('80'*length, 16))
+    lowMask, highMask = swarMasks[length]
+    # Each step adds the partial sums of the previous bytes, doubling the distance
+    x = int(binascii.hexlify(data), 16)
+    shift = 8
+    while shift < 8*length:
+        y = x >> shift
+        x = ((x & lowMask) + (y & lowMask)) ^ ((x ^ y) & highMask)
+        shift *= 2
+    return binascii.unhexlify('%0*x' % (2*length, x))
+
+def pngUpPostPredictionRows(rows, upData, columns, bytesPerRow):
+    '''
+        Removes the PNG Up prediction of consecutive rows, modifying the rows column by column
+    
+        @param rows: The rows to be modified, including the filter bytes
+        @param upData: The bytes of the row before the first one, at least as long as columns
+        @param columns: Number of bytes to be modified in each row
+        @param bytesPerRow: Number of bytes per row, including the filter byte
+        @return: The modified rows without the filter bytes (string)
+    '''
+    output = bytearray(rows)
+    for i in xrange(columns):
+        column = output[i+1::bytesPerRow]
+        column[0] = (column[0] + ord(upData[i])) & 0xff
+        output[i+1::bytesPerRow] = accumulateBytes(str(column))
+    del output[::bytesPerRow]
+    return str(output)
+
+def pngPostPredictionRow(filterByte, data, upData, bytesPerSample):
+    '''
+        Removes the PNG prediction of one row
+    
+        @param filterByte: The PNG filter used in the row (1 to 4)
+        @param data: The bytes of the row to be modified, without the filter byte
+        @param upData: The bytes of the previous row, at least as long as data
+        @param bytesPerSample: Number of bytes per sample
+        @return: The modified row (string)
+    '''
+    length = len(data)
+    if filterByte == 2:
+        # Up
+        return addBytes(data, upData[:length])
+    output = bytearray(data)
+    if filterByte == 1:
+        # Sub
+        for i in xrange(bytesPerSample, length):
+            output[i] = (output[i] + output[i-bytesPerSample]) & 0xff
+    elif filterByte == 3:
+        # Average
+        upBytes = bytearray(upData[:length])
+        for i in xrange(min(bytesPerSample, length)):
+            output[i] = (output[i] + (upBytes[i] >> 1)) & 0xff
+        for i in xrange(bytesPerSample, length):
+            output[i] = (output[i] + ((output[i-bytesPerSample] + upBytes[i]) >> 1)) & 0xff
+    else:
+        # Paeth
+        upBytes = bytearray(upData[:length])
+        for i in xrange(min(bytesPerSample, length)):
+            output[i] = (output[i] + upBytes[i]) & 0xff
+        for i in xrange(bytesPerSample, length):
+            prevSample = output[i-bytesPerSample]
+            upSample = upBytes[i]
+            upPrevSample = upBytes[i-bytesPerSample]
+            p = prevSample + upSample - upPrevSample
+            pa = abs(p - prevSample)
+            pb = abs(p - upSample)
+            pc = abs(p - upPrevSample)
+            if pa <= pb and pa <= pc:
+                nearest = prevSample
+            elif pb <= pc:
+                nearest = upSample
+            else:
+                nearest = upPrevSample
+            output[i] = (output[i] + nearest) & 0xff
+    return str(output)
+
+def pngPostPrediction(stream, columns, colors, bits):
+    '''
+        Removes the PNG prediction of the stream, with the same results as post_prediction. Only the first bytes of each row (as many as columns) are modified.
+    
+        @param stream: The decoded stream to be modified
+        @param columns: Number of samples per row
+        @param colors: Number of colors per sample
+        @param bits: Number of bits per color
+        @return: A tuple (status,statusContent), where statusContent is the modified decoded stream in case status = 0 or an error in case status = -1
+    '''
+    bytesPerRow = (colors * bits * columns + 7) / 8 + 1
+    bytesPerSample = (colors * bits + 7) / 8
+    numRows = len(stream) / bytesPerRow
+    output = []
+    upData = '\x00' * columns
+    if NUMPY_MODULE and numRows > 0 and columns < bytesPerRow:
+        rows = numpy.frombuffer(stream, dtype = numpy.uint8, count = numRows * bytesPerRow).reshape(numRows, bytesPerRow).copy()
+        filterBytes = rows[:,0]
+        samples = rows[:,1:columns+1]
+        # Rows using the same filter are modified together
+        runStarts = [0] + (numpy.flatnonzero(numpy.diff(filterBytes)) + 1).tolist()
+        runEnds = runStarts[1:] + [numRows]
+        for start, end in zip(runStarts, runEnds):
+            filterByte = filterBytes[start]
+            if filterByte == 1:
+                # Sub: the samples of each row are accumulated
+                paddedColumns = (columns + bytesPerSample - 1) / bytesPerSample * bytesPerSample
+                runSamples = numpy.zeros((end - start, paddedColumns), dtype = numpy.uint8)
+                runSamples[:,:columns] = samples[start:end]
+                runSamples = runSamples.reshape(end - start, -1, bytesPerSample).cumsum(axis = 1, dtype = numpy.uint8)
+                samples[start:end] = runSamples.reshape(end - start, paddedColumns)[:,:columns]
+            elif filterByte == 2:
+                # Up: the rows are accumulated, starting from the previous one
+                if start > 0:
+                    samples[start:end] = samples[start:end].cumsum(axis = 0, dtype = numpy.uint8) + samples[start-1]
+                else:
+                    samples[start:end] = samples[start:end].cumsum(axis = 0, dtype = numpy.uint8)
+            elif filterByte == 3 or filterByte == 4:
+                for row in xrange(start, end):
+                    if row > 0:
+                        upData = samples[row-1].tostring()
+                    data = pngPostPredictionRow(filterByte, samples[row].tostring(), upData, bytesPerSample)
+                    samples[row] = numpy.frombuffer(data, dtype = numpy.uint8)
+        output.append(rows[:,1:].tostring())
+        upData = rows[-1,1:].tostring()
+        firstRow = numRows
+    else:
+        firstRow = 0
+    # Long runs of narrow rows using the Up filter (cross-reference streams) are modified column by column
+    upRuns = {}
+    if firstRow == 0 and columns < bytesPerRow:
+        for match in re.finditer('\x02{%d,}' % (columns + 1), stream[:numRows*bytesPerRow:bytesPerRow]):
+            upRuns[match.start() * bytesPerRow] = match.end() * bytesPerRow
+    offset = firstRow * bytesPerRow
+    while offset < len(stream):
+        if upRuns.has_key(offset):
+            data = pngUpPostPredictionRows(stream[offset:upRuns[offset]], upData, columns, bytesPerRow)
+            output.append(data)
+            upData = data[-(bytesPerRow-1):]
+            offset = upRuns[offset]
+            continue
+        filterByte = ord(stream[offset])
+        data = stream[offset+1:offset+bytesPerRow]
+        if filterByte >= 1 and filterByte <= 4:
+            if len(data) < columns:
+                raise IndexError('list index out of range')
+            data = pngPostPredictionRow(filterByte, data[:columns], upData, bytesPerSample) + data[columns:]
+        output.append(data)
+        upData = data
+        offset += bytesPerRow
+    return (0,''.join(output))
+
+def tiffPostPrediction(stream, columns, colors, bits):
+    '''
+        Removes the TIFF prediction (predictor 2) of the stream, with the same results as post_prediction
+    
+        @param stream: The decoded stream to be modified
+        @param columns: Number of samples per row
+        @param colors: Number of colors per sample
+        @param bits: Number of bits per color
+        @return: A tuple (status,statusContent), where statusContent is the modified decoded stream in case status = 0 or an error in case status = -1
+    '''
+    bytesPerRow = (colors * bits * columns + 7) / 8
+    numRows = len(stream) / bytesPerRow
+    bitmask = 2 ** bits - 1
+    output = []
+    # Components of less than 8 bits are written one after the other, so the last bits of a row can share a byte with the next one
+    pendingBits = 0
+    numPendingBits = 0
+    if NUMPY_MODULE:
+        # Blocks of 8 rows always fill whole bytes
+        blockRows = max(1, tiffBlockSize / bytesPerRow / 8) * 8
+        numBlockRows = numRows / blockRows * blockRows
+        weights = 2 ** numpy.arange(bits - 1, -1, -1)
+        for start in xrange(0, numBlockRows, blockRows):
+            rows = numpy.frombuffer(stream, dtype = numpy.uint8, count = blockRows * bytesPerRow, offset = start * bytesPerRow).reshape(blockRows, bytesPerRow).astype(numpy.int64)
+            if bits == 8:
+                nums = rows
+            elif bits == 16:
+                evenBytes = rows[:,:bytesPerRow - bytesPerRow % 2]
+                nums = evenBytes[:,0::2] * 256 + evenBytes[:,1::2]
+                if bytesPerRow % 2 == 1:
+                    nums = numpy.column_stack((nums, rows[:,-1]))
+            else:
+                rowBits = numpy.unpackbits(rows.astype(numpy.uint8), axis = 1)
+                nums = (rowBits.reshape(blockRows, -1, bits) * weights).sum(axis = 2)
+            # The sample index is added to the color index, as post_prediction does
+            pixels = numpy.empty((blockRows, columns, colors), dtype = numpy.int64)
+            for j in xrange(colors):
+                pixels[:,:,j] = nums[:,j:j+columns].cumsum(axis = 1) & bitmask
+            pixels = pixels.reshape(-1)
+            if bits == 8:
+                output.append(pixels.astype(numpy.uint8).tostring())
+            elif bits == 16:
+                # Values lower than 256 are written with only one byte, as getBitsFromNum does
+                pairs = numpy.column_stack((pixels >> 8, pixels & 0xff)).astype(numpy.uint8)
+                written = numpy.column_stack((pixels > 0xff, numpy.ones(len(pixels), dtype = bool)))
+                output.append(pairs[written].tostring())
+            else:
+                pixelBits = ((pixels[:,None] / weights) & 1).astype(numpy.uint8)
+                output.append(numpy.packbits(pixelBits.reshape(-1)).tostring())
+    else:
+        numBlockRows = 0
+    if bits < 8 and not componentsTables.has_key(bits):
+        componentsTables[bits] = [getNumsFromBytes(chr(byte), bits)[1] for byte in range(256)]
+    for rowIndex in xrange(numBlockRows, numRows):
+        row = stream[rowIndex*bytesPerRow:rowIndex*bytesPerRow+bytesPerRow]
+        if bits == 8:
+            nums = bytearray(row)
+        elif bits == 16:
+            nums = list(struct.unpack('>%dH' % (bytesPerRow / 2), row[:bytesPerRow - bytesPerRow % 2]))
+            if bytesPerRow % 2 == 1:
+                nums.append(ord(row[-1]))
+        else:
+            table = componentsTables[bits]
+            nums = []
+            for byte in bytearray(row):
+                nums.extend(table[byte])
+        pixels = [0] * (columns * colors)
+        for j in xrange(colors):
+            pixel = 0
+            for i in xrange(columns):
+                pixel = (pixel + nums[i+j]) & bitmask
+                pixels[i*colors+j] = pixel
+        if bits == 8:
+            output.append(str(bytearray(pixels)))
+        elif bits == 16:
+            rowBytes = bytearray()
+            for pixel in pixels:
+                if pixel > 0xff:
+                    rowBytes.append(pixel >> 8)
+                rowBytes.append(pixel & 0xff)
+            output.append(str(rowBytes))
+        else:
+            rowBytes = bytearray()
+            for pixel in pixels:
+                pendingBits = (pendingBits << bits) | pixel
+                numPendingBits += bits
+                if numPendingBits == 8:
+                    rowBytes.append(pendingBits)
+                    pendingBits = 0
+                    numPendingBits = 0
+            output.append(str(rowBytes))
+    if numPendingBits > 0:
+        # Like getBytesFromBits, the last incomplete byte is not padded
+        output.append(chr(pendingBits))
+    return (0,''.join(output))
+
+def pngPrediction(stream, predictor, columns):
+    '''
+        Applies the PNG prediction to the stream, with the same results as pre_prediction
+    
+        @param stream: The stream to be modified
+        @param predictor: The type of predictor to apply
+        @param columns: Number of bytes per row
+        @return: A tuple (status,statusContent), where statusContent is the modified stream in case status = 0 or an error in case status = -1
+    '''
+    numRows = len(stream) / columns
+    filterByte = predictor - 10
+    if numRows == 0:
+        return (0,'')
+    if filterByte > 2:
+        return (-1,'Unsupported predictor')
+    if NUMPY_MODULE:
+        rows = numpy.frombuffer(stream, dtype = numpy.uint8, count = numRows * columns).reshape(numRows, columns)
+        output = numpy.empty((numRows, columns + 1), dtype = numpy.uint8)
+        output[:,0] = filterByte
+        output[:,1:] = rows
+        if filterByte == 1:
+            # Sub
+            output[:,2:] -= rows[:,:-1]
+        return (0,output.tostring())
+    output = []
+    filterChar = chr(filterByte)
+    for offset in xrange(0, numRows * columns, columns):
+        row = stream[offset:offset+columns]
+        if filterByte == 1:
+            # Sub
+            output.append(filterChar + row[0] + subtractBytes(row[1:], row[:-1]))
+        else:
+            output.append(filterChar + row)
+    return (0,''.join(output))
+
+def subtractBytes(data, prevData):
+    '''
+        Subtracts two strings of the same length byte by byte (modulo 256)
+    
+        @param data: The string to subtract from
+        @param prevData: The string to subtract
+        @return: The resulting string
+    '''
+    output = bytearray(data)
+    prevBytes = bytearray(prevData)
+    for i in xrange(len(output)):
+        output[i] = (output[i] - prevBytes[i]) & 0xff
+    return str(output)
+
 def pre_prediction(stream, predictor, columns, colors, bits):
     '''
         Predictor function to make the stream more predictable and improve compression (PDF Specification)
@@ -456,6 +938,8 @@ def pre_prediction(stream, predictor, columns, colors, bits):
         @param bits: Number of bits per color
         @return: A tuple (status,statusContent), where statusContent is the modified stream in case status = 0 or an error in case status = -1
     '''
+    if type(predictor) in (int, long) and predictor >= 10 and predictor <= 15 and isRegularPrediction(columns, colors, bits):
+        return pngPrediction(stream, predictor, columns)
     
     output = ''
     #TODO: TIFF and more PNG predictions
@@ -495,6 +979,11 @@ def post_prediction(decodedStream, predictor, columns, colors, bits):
         @param bits: Number of bits per color
         @return: A tuple (status,statusContent), where statusContent is the modified decoded stream in case status = 0 or an error in case status = -1
     '''
+    if isRegularPrediction(columns, colors, bits):
+        if predictor == 2:
+            return tiffPostPrediction(decodedStream, columns, colors, bits)
+        elif predictor >= 10 and predictor <= 15:
+            return pngPostPrediction(decodedStream, columns, colors, bits)
     
     output = ''
     bytesPerRow = (colors * bits * columns + 7) / 8
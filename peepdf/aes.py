@@ -29,32 +29,52 @@ Licensed under the MIT license http://www.opensource.org/licenses/mit-license.ph
 """
 
 import sys
-from aespython import key_expander, aes_cipher, cbc_mode
+from aespython import key_expander, tbox_cipher
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+    CRYPTOGRAPHY_MODULE = True
+except:
+    CRYPTOGRAPHY_MODULE = False
+try:
+    from Crypto.Cipher import AES
+    PYCRYPTODOME_MODULE = True
+except:
+    PYCRYPTODOME_MODULE = False
+# Ciphers with the expanded keys, emptied when they reach maxCacheEntries
+ciphersCache = {}
+maxCacheEntries = 1024
 
 def decryptData(data, password = None, keyLength =  None, mode = 'CBC'):
     '''
-        Method added for peepdf
+        Method added for peepdf. The whole data is decrypted at once, using the cryptography or pycryptodome modules if available, and the T-box implementation of aespython otherwise.
     '''
-    decryptedData = ''
     if keyLength == None:
         keyLength = len(password)*8
     if keyLength not in [128, 192, 256]:
         return (-1, 'Bad length key in AES decryption process')
     
-    iv = map(ord, data[:16])
-    key = map(ord, password)
+    iv = data[:16]
+    if len(iv) != 16:
+        iv = '\0'*16
     data = data[16:]
     if len(data) % 16 != 0:
         data = data[:-(len(data)%16)]
-    keyExpander = key_expander.KeyExpander(keyLength)
-    expandedKey = keyExpander.expand(key)
-    aesCipher = aes_cipher.AESCipher(expandedKey)
-    if mode == 'CBC':
-        aesMode = cbc_mode.CBCMode(aesCipher, 16)
-    aesMode.set_iv(iv)
-    for i in range(0,len(data),16):
-        ciphertext = map(ord,data[i:i+16])
-        decryptedBytes = aesMode.decrypt_block(ciphertext)
-        for byte in decryptedBytes:
-            decryptedData += chr(byte)
-    return (0, decryptedData) 
\ No newline at end of file
+    if data == '':
+        return (0, '')
+    if len(password)*8 == keyLength:
+        if CRYPTOGRAPHY_MODULE:
+            decryptor = Cipher(algorithms.AES(password), modes.CBC(iv), backend = default_backend()).decryptor()
+            return (0, decryptor.update(data) + decryptor.finalize())
+        elif PYCRYPTODOME_MODULE:
+            return (0, AES.new(password, AES.MODE_CBC, iv).decrypt(data))
+    if ciphersCache.has_key((password, keyLength)):
+        aesCipher = ciphersCache[(password, keyLength)]
+    else:
+        keyExpander = key_expander.KeyExpander(keyLength)
+        expandedKey = keyExpander.expand(map(ord, password))
+        aesCipher = tbox_cipher.TBoxCipher(expandedKey)
+        if len(ciphersCache) >= maxCacheEntries:
+            ciphersCache.clear()
+        ciphersCache[(password, keyLength)] = aesCipher
+    return (0, aesCipher.decrypt_cbc(data, iv))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+AES Block Decipher using T-box lookup tables.
+
+Deciphers whole CBC buffers working on 32 bit words instead of lists of bytes.
+Each round is computed with four table lookups per column, combining the inverse
+S-box, InvShiftRows and InvMixColumns (equivalent inverse cipher).
+
+Running this file as __main__ will result in a self-test of the algorithm.
+
+Algorithm per NIST FIPS-197 http://csrc.nist.gov/publications/fips/fips197/fips-197.pdf
+"""
+import struct
+
+#Normally use relative import. In test mode use local import.
+try:from .aes_tables import sbox,i_sbox,galI
+except ValueError:from aes_tables import sbox,i_sbox,galI
+
+g14,g11,g13,g9=galI
+td0=tuple(g14[s]<<24|g9[s]<<16|g13[s]<<8|g11[s] for s in i_sbox)
+td1=tuple((t>>8|t<<24)&0xffffffff for t in td0)
+td2=tuple((t>>8|t<<24)&0xffffffff for t in td1)
+td3=tuple((t>>8|t<<24)&0xffffffff for t in td2)
+#InvMixColumns of a byte, used to transform the round keys
+imc0=tuple(td0[s] for s in sbox)
+imc1=tuple(td1[s] for s in sbox)
+imc2=tuple(td2[s] for s in sbox)
+imc3=tuple(td3[s] for s in sbox)
+isb=i_sbox
+isb8=tuple(s<<8 for s in i_sbox)
+isb16=tuple(s<<16 for s in i_sbox)
+isb24=tuple(s<<24 for s in i_sbox)
+
+class TBoxCipher:
+    """Decipher blocks with the T-box tables, using an expanded key from KeyExpander"""
+    def __init__(self, expanded_key):
+        words=struct.unpack('>%dI'%(len(expanded_key)>>2),str(bytearray(expanded_key)))
+        self._Nr=(len(words)>>2)-1
+        #Round keys in decryption order, the middle ones transformed by InvMixColumns
+        round_keys=[words[r*4:r*4+4] for r in range(self._Nr,-1,-1)]
+        for r in range(1,self._Nr):
+            round_keys[r]=tuple(imc0[w>>24]^imc1[w>>16&255]^imc2[w>>8&255]^imc3[w&255] for w in round_keys[r])
+        self._round_keys=round_keys
+
+    def decipher_block(self, ciphertext):
+        """Decipher a 16 element list of integers, returning a 16 element list of integers"""
+        return list(bytearray(self.decrypt_cbc(str(bytearray(ciphertext)),'\0'*16)))
+
+    def decrypt_cbc(self, data, iv):
+        """Decipher a string (multiple of 16 bytes) in CBC mode with a 16 bytes IV, returning a string"""
+        if not data:
+            return ''
+        T0,T1,T2,T3=td0,td1,td2,td3
+        first_key=self._round_keys[0]
+        middle_keys=self._round_keys[1:-1]
+        k0,k1,k2,k3=self._round_keys[-1]
+        words=struct.unpack('>%dI'%(len(data)>>2),data)
+        p0,p1,p2,p3=struct.unpack('>4I',iv)
+        output=[]
+        append=output.extend
+        for i in xrange(0,len(words),4):
+            c0,c1,c2,c3=words[i:i+4]
+            s0=c0^first_key[0];s1=c1^first_key[1];s2=c2^first_key[2];s3=c3^first_key[3]
+            for r0,r1,r2,r3 in middle_keys:
+                s0,s1,s2,s3=(T0[s0>>24]^T1[s3>>16&255]^T2[s2>>8&255]^T3[s1&255]^r0,
+                    T0[s1>>24]^T1[s0>>16&255]^T2[s3>>8&255]^T3[s2&255]^r1,
+                    T0[s2>>24]^T1[s1>>16&255]^T2[s0>>8&255]^T3[s3&255]^r2,
+                    T0[s3>>24]^T1[s2>>16&255]^T2[s1>>8&255]^T3[s0&255]^r3)
+            append((isb24[s0>>24]^isb16[s3>>16&255]^isb8[s2>>8&255]^isb[s1&255]^k0^p0,
+                isb24[s1>>24]^isb16[s0>>16&255]^isb8[s3>>8&255]^isb[s2&255]^k1^p1,
+                isb24[s2>>24]^isb16[s1>>16&255]^isb8[s0>>8&255]^isb[s3&255]^k2^p2,
+                isb24[s3>>24]^isb16[s2>>16&255]^isb8[s1>>8&255]^isb[s0&255]^k3^p3))
+            p0,p1,p2,p3=c0,c1,c2,c3
+        return struct.pack('>%dI'%len(output),*output)
+
+import unittest
+class TestTBoxCipher(unittest.TestCase):
+    def test_decipher(self):
+        """Test T-box decipher with all key lengths"""
+        import test_keys
+        import key_expander
+        test_data = test_keys.TestKeys()
+        for key_size in 128, 192, 256:
+            test_key_expander = key_expander.KeyExpander(key_size)
+            test_expanded_key = test_key_expander.expand(list(test_data.test_key[key_size]))
+            test_cipher = TBoxCipher(test_expanded_key)
+            test_result_plaintext = test_cipher.decipher_block(test_data.test_block_ciphertext_validated[key_size])
+            self.assertEquals(test_result_plaintext, test_data.test_block_plaintext,
+                msg='Test %d bit decipher'%key_size)
+
+    def test_cbc(self):
+        """Test T-box CBC decryption of several blocks"""
+        import test_keys
+        import key_expander
+        test_data = test_keys.TestKeys()
+        test_expander = key_expander.KeyExpander(256)
+        test_cipher = TBoxCipher(test_expander.expand(list(test_data.test_mode_key)))
+        ciphertext = ''.join(str(bytearray(block)) for block in test_data.test_cbc_ciphertext)
+        plaintext = ''.join(str(bytearray(block)) for block in test_data.test_mode_plaintext)
+        self.assertEquals(test_cipher.decrypt_cbc(ciphertext, str(bytearray(test_data.test_mode_iv))), plaintext,
+            msg='CBC decrypt test')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,9 +27,9 @@
     Initial script to launch the tool
 '''
 
-import sys, os, optparse, re, urllib2, datetime, hashlib, traceback
+import sys, os, optparse, re, urllib2, datetime, hashlib, traceback, ConfigParser
 from datetime import datetime
-from PDFCore import PDFParser, vulnsDict
+from PDFCore import PDFParser, vulnsDict, addMonitorizedKeywords
 from PDFUtils import vtcheck
 
 VT_KEY = 'fc90df3f5ac749a94a94cb8bf87e05a681a2eb001aef34b6a0084b8c22c97a64'
@@ -86,6 +86,32 @@ def getLocalFilesInfo(filesList):
     print '[+] Done'
     return localFilesInfo
 
+def loadKeywords(keywordsFile):
+    '''
+        Adds the suspicious keywords of the [indicators] section of a configuration file.
+        The options events, actions, elements and js_vulns are comma separated lists of keywords.
+        
+        @param keywordsFile: The path of the configuration file
+        @return: A tuple (status,statusContent), where statusContent is empty in case status = 0 or an error message in case status = -1
+    '''
+    configParser = ConfigParser.RawConfigParser()
+    try:
+        configParser.read(keywordsFile)
+    except ConfigParser.Error as e:
+        return (-1,'Bad keywords file: '+str(e))
+    if not configParser.has_section('indicators'):
+        return (-1,'The keywords file has no [indicators] section')
+    keywords = {}
+    for option in ['events','actions','elements','js_vulns']:
+        keywords[option] = []
+        if configParser.has_option('indicators',option):
+            for keyword in configParser.get('indicators',option).split(','):
+                keyword = keyword.strip()
+                if keyword != '':
+                    keywords[option].append(keyword)
+    addMonitorizedKeywords(keywords['events'], keywords['actions'], keywords['elements'], keywords['js_vulns'])
+    return (0,'')
+
 def getPeepXML(statsDict, version, revision):
     root = etree.Element('peepdf_analysis', version = version+' r'+revision, url = 'http://peepdf.eternal-todo.com', author = 'Jose Miguel Esparza')
     analysisDate = etree.SubElement(root, 'date')
@@ -264,6 +290,7 @@ argsParser.add_option('-u', '--update', action='store_true', dest='update', defa
 argsParser.add_option('-g', '--grinch-mode', action='store_true', dest='avoidColors', default=False, help='Avoids colorized output in the interactive console.')
 argsParser.add_option('-v', '--version', action='store_true', dest='version', default=False, help='Shows program\'s version number.')
 argsParser.add_option('-x', '--xml', action='store_true', dest='xmlOutput', default=False, help='Shows the document information in XML format.')
+argsParser.add_option('-k', '--keywords', action='store', type='string', dest='keywordsFile', help='Adds the suspicious keywords of the [indicators] section of the specified file (events, actions, elements and js_vulns, comma separated).')
 (options, args) = argsParser.parse_args()
 
 try:
@@ -345,6 +372,13 @@ try:
         if options.scriptFile != None:
             if not os.path.exists(options.scriptFile):
                 sys.exit('Error: The script file "'+options.scriptFile+'" does not exist!!')
+
+        if options.keywordsFile != None:
+            if not os.path.exists(options.keywordsFile):
+                sys.exit('Error: The keywords file "'+options.keywordsFile+'" does not exist!!')
+            ret = loadKeywords(options.keywordsFile)
+            if ret[0] == -1:
+                sys.exit('Error: '+ret[1])
             
         if fileName != None:
             pdfParser = PDFParser()